@@ -7,6 +7,7 @@ import os
 import pandas_ta as ta
 from datetime import datetime
 from market_engine import MarketDataEngine
+from swing_engine import find_swings
 
 def get_client(api_key, base_url):
     """
@@ -85,15 +86,14 @@ class AIAssistant:
         try:
             clean_symbol = symbol.split(':')[0].replace('USDT', '/USDT') if 'USDT' in symbol and '/' not in symbol else symbol
             
-            # 获取 4H 数据 (回溯 150 天)
+            # 获取 4H 数据 (回溯 150 天，直接读预聚合表)
             lookback = 150 * 24 * 60 * 60 * 1000
             start_ts = int(open_time) - lookback # 确保是 int
-            df = self.market_engine.get_klines_df(clean_symbol, start_ts, int(open_time) + 60000)
+            df_4h = self.market_engine.get_klines_df(clean_symbol, start_ts, int(open_time) + 60000, timeframe='4h')
             
-            if df.empty or len(df) < 1000:
+            if df_4h.empty:
                 return "数据不足 (请同步至少150天K线)"
-            df.set_index('datetime', inplace=True)
-            df_4h = df.resample('4h').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}).dropna()
+            df_4h.set_index('datetime', inplace=True)
             
             if len(df_4h) < 170:
                 return "历史数据不足计算 Vegas"
@@ -110,6 +110,23 @@ class AIAssistant:
         except Exception as e:
             return f"趋势分析失败: {str(e)}"
 
+    def _analyze_swing_structure(self, symbol, open_time, lookback_minutes=240):
+        """v10.0 后台计算入场前的摆动结构 (1m K 线分形高低点 + HH/HL，与价格行为统计同一套引擎)"""
+        if not symbol or not open_time:
+            return "数据不足，跳过结构分析"
+        try:
+            clean_symbol = symbol.split(':')[0].replace('USDT', '/USDT') if 'USDT' in symbol and '/' not in symbol else symbol
+            start_ts = int(open_time) - lookback_minutes * 60 * 1000
+            klines = self.market_engine.get_klines_array(clean_symbol, start_ts, int(open_time) - 1)
+            if len(klines) == 0:
+                return "无入场前 K 线"
+            tracker = find_swings(klines['high'], klines['low'], klines['timestamp'])
+            highs, lows = tracker.last('high', 3), tracker.last('low', 3)
+            points = f"最近高点 {', '.join(f'{p:.4f}' for p in highs) or '无'} | 最近低点 {', '.join(f'{p:.4f}' for p in lows) or '无'}"
+            return f"{tracker.trend_label()} ({points})"
+        except Exception as e:
+            return f"结构分析不可用: {str(e)}"
+
     def _analyze_missed_profit(self, symbol, direction, close_time, exit_price):
         """后台自动计算是否卖飞"""
         # === 🚨 关键修复：防止 exit_price 为 None 导致 float() 崩溃 ===
@@ -167,6 +184,7 @@ def audit_single_trade(api_key, base_url, trade_data, system_manifesto="", strat
         
         # 自动分析上帝视角 (Vegas Trend)
         trend_context = ai_helper._analyze_vegas_trend(symbol, open_ts)
+        swing_context = ai_helper._analyze_swing_structure(symbol, open_ts)
         what_if_result = ai_helper._analyze_missed_profit(symbol, direction, close_ts, price)
         
         # 准备上下文数据
@@ -194,6 +212,7 @@ def audit_single_trade(api_key, base_url, trade_data, system_manifesto="", strat
         
         【上帝视角 (AI Auto-Analysis)】
         - 宏观趋势: {trend_context}
+        - 入场前结构 (1m 摆动点): {swing_context}
         - 离场评价: {what_if_result}
         
         【交易员主观记录】
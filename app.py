@@ -3,14 +3,16 @@ import pandas as pd
 import numpy as np  # v5.0 新增：用于蒙特卡洛模拟
 import time
 import os
-import sqlite3  # v7.0 新增：用于 K 线数据同步
 import plotly.express as px
 from data_engine import TradeDataEngine
-from data_processor import process_trades_to_rounds, calc_price_action_stats # 引入核心逻辑
+from data_processor import process_trades_to_rounds, calc_price_action_stats, pa_data_version # 引入核心逻辑
+from swing_engine import SwingTracker  # v10.0 流式摆动点 (回放结构标记)
 from word_exporter import create_word_report
 from market_engine import MarketDataEngine
+from rate_limiter import get_governor  # v10.0 权重预算调度
+from pa_backfill import backfill_price_action  # v10.0 批量回填价格行为指标
 from ai_assistant import generate_batch_review, generate_batch_review_v3, audit_single_trade, review_potential_trade, analyze_live_positions
-from risk_simulator import MonteCarloEngine  # v5.0 新增
+from risk_simulator import MonteCarloEngine, RESAMPLING_MODELS  # v5.0 新增 (v10.0: 可选抽样模型)
 from memory_engine import MemoryEngine  # v5.0 RAG 记忆系统
 from datetime import datetime
 
@@ -251,6 +253,9 @@ with st.sidebar:
         
         # --- C. 数据同步 (折叠菜单) ---
         with st.expander("🔄 数据同步"):
+            # v10.0: 交易所权重预算 (交易同步与 K 线同步共用)
+            gov = get_governor().metrics()
+            st.caption(f"⚖️ 权重预算: 本分钟已用 {gov['used_weight_1m']:.0f}/{gov['weight_per_minute']} ({gov['utilization']:.0%})，累计请求 {gov['requests']} 次")
             mode = st.radio("模式", ["快速 (7天)", "深度 (1年)"], captions=["日常更新", "补录历史"])
             coins = ""
             if "深度" in mode:
@@ -266,7 +271,10 @@ with st.sidebar:
                     p_bar.progress(val)
                 
                 msg, count = engine.fetch_and_save(selected_key, selected_secret, api_mode, coins, ui_callback)
-                if "成功" in msg:
+                if "部分失败" in msg:
+                    # v10.0: 部分币种/资金费扫描失败时保留提示，不自动刷新
+                    st.warning(msg)
+                elif "成功" in msg:
                     st.success(f"同步完成！新增 {count} 条")
                     time.sleep(1)
                     st.rerun()
@@ -290,13 +298,10 @@ with st.sidebar:
                 status_box = st.status("正在分析交易记录...", expanded=True)
                 
                 try:
-                    # 连接数据库读取交易过的 symbol
-                    db_path = engine.db_path
-                    conn = sqlite3.connect(db_path)
-                    c = conn.cursor()
+                    # 连接数据库读取交易过的 symbol (复用引擎的长连接)
+                    c = engine.db.connection().cursor()
                     c.execute("SELECT DISTINCT symbol FROM trades")
                     rows = c.fetchall()
-                    conn.close()
                     
                     # 清洗币种列表
                     target_coins = set()
@@ -318,25 +323,21 @@ with st.sidebar:
                     status_box.write(f"📋 发现 {total_coins} 个关注币种，准备同步...")
                     progress_bar = status_box.progress(0)
                     
-                    # 3. 循环同步
+                    # 3. 并发同步 (v10.0: 多币种同时抓取，按交易所权重预算调度)
+                    def sync_callback(msg, pct):
+                        # 只更新总进度条
+                        progress_bar.progress(min(pct, 1.0))
+                    
+                    results = me.sync_symbols_async(target_list, timeframe='1m', days=sync_days, progress_callback=sync_callback)
+                    
                     success_count = 0
-                    for i, symbol in enumerate(target_list):
-                        status_box.write(f"🔄 [{i+1}/{total_coins}] 正在同步 {symbol}...")
-                        
-                        # 定义回调更新进度
-                        def sync_callback(msg, pct):
-                            # 这里不更新主进度条，以免闪烁，只在后台打印或忽略
-                            pass
-                            
-                        ok, msg = me.sync_symbol_history(symbol, timeframe='1m', days=sync_days)
-                        
+                    for symbol in target_list:
+                        ok, msg = results.get(symbol, (False, "未执行"))
                         if ok:
                             success_count += 1
                         else:
                             st.toast(f"⚠️ {symbol} 同步失败: {msg}")
-                            
-                        # 更新总进度
-                        progress_bar.progress((i + 1) / total_coins)
+                    progress_bar.progress(1.0)
                     
                     status_box.update(label=f"✅ 同步完成！成功更新 {success_count}/{total_coins} 个币种", state="complete", expanded=False)
                     st.success("本地数据仓库已更新，现在可以进行极速复盘了！")
@@ -372,8 +373,8 @@ with st.sidebar:
                         if raw_df.empty:
                             st.error("没有交易记录可导出！")
                         else:
-                            # 处理数据：合成回合
-                            df_export = process_trades_to_rounds(raw_df)
+                            # 处理数据：合成回合 (增量回合表)
+                            df_export = engine.load_rounds(selected_key)
                             
                             if df_export.empty:
                                 st.error("❌ 没有完整的交易记录可导出。")
@@ -450,7 +451,8 @@ if selected_key:
         st.info("👋 暂无数据，请在侧边栏点击【开始同步】。")
     else:
         # 2. 调用处理器：生成完整交易 (Round Trips)
-        rounds_df = process_trades_to_rounds(raw_df)
+        # v10.0: 回合已持久化，只对有新成交的币种增量续跑
+        rounds_df = engine.load_rounds(selected_key)
         
         if rounds_df.empty:
             st.warning("🤔 有数据，但没有检测到完整的【开仓-平仓】闭环。请确认是否有已平仓的订单。")
@@ -1365,79 +1367,88 @@ if selected_key:
                             st.session_state[f"show_pa_{trade['round_id']}"] = True
                     
                     if st.session_state.get(f"show_pa_{trade['round_id']}", False) or has_pa_data:
-                        if st.session_state.get(f"show_pa_{trade['round_id']}", False):
-                            # === v7.0 核心变更：使用 MarketDataEngine 从本地读取 ===
-                            # 初始化本地市场引擎 (单例模式，避免重复连接数据库)
-                            if 'market_engine' not in st.session_state:
-                                st.session_state.market_engine = MarketDataEngine()
-                            
-                            me = st.session_state.market_engine
-                            
-                            # =========== 🔧 修复开始：清洗币种名称 ===========
-                            # 你的交易记录里是 "BNB/USDT:USDT"，但仓库里存的是 "BNB/USDT"
-                            # 所以查询前必须把后缀去掉，不然查不到数据
-                            raw_symbol = trade['symbol']
-                            clean_symbol = raw_symbol.split(':')[0] 
-                            if "USDT" in clean_symbol and "/" not in clean_symbol:
-                                clean_symbol = clean_symbol.replace("USDT", "/USDT")
-                            # ===============================================
-                            
-                            entry_price = float(trade_row['price'])
-                            # 获取仓位大小
-                            amount = float(trade_row.get('amount', 0) or trade.get('amount', 0) or 0)
+                        # === v7.0 核心变更：使用 MarketDataEngine 从本地读取 ===
+                        # 初始化本地市场引擎 (单例模式，避免重复连接数据库)
+                        if 'market_engine' not in st.session_state:
+                            st.session_state.market_engine = MarketDataEngine()
+                        
+                        me = st.session_state.market_engine
+                        
+                        # =========== 🔧 修复开始：清洗币种名称 ===========
+                        # 你的交易记录里是 "BNB/USDT:USDT"，但仓库里存的是 "BNB/USDT"
+                        # 所以查询前必须把后缀去掉，不然查不到数据
+                        raw_symbol = trade['symbol']
+                        clean_symbol = raw_symbol.split(':')[0] 
+                        if "USDT" in clean_symbol and "/" not in clean_symbol:
+                            clean_symbol = clean_symbol.replace("USDT", "/USDT")
+                        # ===============================================
+                        
+                        entry_price = float(trade_row['price'])
+                        # 获取仓位大小
+                        amount = float(trade_row.get('amount', 0) or trade.get('amount', 0) or 0)
+                        
+                        # v10.0: 统计结果按 (回合, 数据版本, 风险额) 存在 pa_stats 表里，重启后再打开直接读取
+                        # 图表 DataFrame 不进缓存，需要时现场重建 (会话里只保留当前这一笔的图表)
+                        candles = pd.DataFrame()
+                        pa_version = None
+                        v7_stats = None
+                        if entry_price > 0 and amount > 0:
+                            # 关键：多取前 200 分钟数据，为了计算 ATR-14
+                            # 如果本地没有数据，这里会返回空，提示用户去同步
+                            query_start = trade['open_time'] - (200 * 60 * 1000) 
+                            query_end = trade['close_time']
                             
+                            # 👇 注意：这里改成了传入 clean_symbol (v10.0: 经过进程内 K 线缓存，反复打开不读盘)
+                            candles = me.get_klines_df(
+                                clean_symbol, query_start, query_end
+                            )
+                            if not candles.empty:
+                                pa_version = pa_data_version(candles, trade['direction'], entry_price, amount)
+                                v7_stats = engine.get_pa_stats(trade['round_id'], selected_key, pa_version, risk_input)
+                        
+                        def run_pa_calc():
+                            """调用 v7.0 的计算引擎 (完整结果，含图表 DataFrame)"""
+                            exit_price = candles.iloc[-1]['close']
+                            return calc_price_action_stats(
+                                candles, trade['direction'], entry_price, exit_price,
+                                trade['open_time'], trade['close_time'], # 传入真实开平仓时间截取
+                                amount, risk_input
+                            )
+                        
+                        if st.session_state.get(f"show_pa_{trade['round_id']}", False):
                             if entry_price <= 0 or amount <= 0:
                                 st.error("❌ 价格或数量无效，请先编辑交易。")
+                            elif candles.empty:
+                                # 错误提示也优化一下，告诉用户你要查的是谁
+                                st.error(f"❌ 本地仓库没有 {clean_symbol} 的数据。请点击侧边栏的【一键同步 K 线】！")
                             else:
                                 with st.spinner("📦 正在从本地仓库调取数据..."):
-                                    # 关键：多取前 200 分钟数据，为了计算 ATR-14
-                                    # 如果本地没有数据，这里会返回空，提示用户去同步
-                                    query_start = trade['open_time'] - (200 * 60 * 1000) 
-                                    query_end = trade['close_time']
-                                    
-                                    # 👇 注意：这里改成了传入 clean_symbol
-                                    candles = me.get_klines_df(
-                                        clean_symbol, query_start, query_end
-                                    )
+                                    stats = v7_stats
+                                    if stats is None:
+                                        full_stats = run_pa_calc()
+                                        if full_stats:
+                                            st.session_state['pa_chart'] = (trade['round_id'], pa_version, full_stats['Charts'])
+                                            stats = engine.save_pa_stats(trade['round_id'], selected_key, pa_version, risk_input, full_stats)
                                     
-                                    if not candles.empty:
-                                        # 调用 v7.0 的计算引擎
-                                        exit_price = candles.iloc[-1]['close']
-                                        stats = calc_price_action_stats(
-                                            candles, trade['direction'], entry_price, exit_price,
-                                            trade['open_time'], trade['close_time'], # 传入真实开平仓时间截取
-                                            amount, risk_input
-                                        )
+                                    if stats:
+                                        # 保存基本数据到数据库 (兼容旧字段)
+                                        save_data = {
+                                            'mae': float(stats['MAE']),
+                                            'mfe': float(stats['MFE']),
+                                            'etd': float(stats['ETD']),
+                                            'mae_atr': float(stats['MAE_ATR']),
+                                            'mfe_atr': float(stats['MFE_ATR']),
+                                            'rvol': float(stats.get('RVOL', 1.0)),
+                                            'pattern_signal': stats.get('Pattern', '无显著形态')  # 👈 新增
+                                        }
+                                        base_id = trade['round_id'].replace('_OPEN', '').replace('_CLOSE', '')
+                                        success, save_msg = engine.update_trade_extended(base_id, selected_key, save_data)
                                         
-                                        if stats:
-                                            # 保存基本数据到数据库 (兼容旧字段)
-                                            save_data = {
-                                                'mae': float(stats['MAE']),
-                                                'mfe': float(stats['MFE']),
-                                                'etd': float(stats['ETD']),
-                                                'mae_atr': float(stats['MAE_ATR']),
-                                                'mfe_atr': float(stats['MFE_ATR']),
-                                                'rvol': float(stats.get('RVOL', 1.0)),
-                                                'pattern_signal': stats.get('Pattern', '无显著形态')  # 👈 新增
-                                            }
-                                            base_id = trade['round_id'].replace('_OPEN', '').replace('_CLOSE', '')
-                                            success, save_msg = engine.update_trade_extended(base_id, selected_key, save_data)
-                                            
-                                            # 在 Session 中展示 v7.0 高级指标 (暂不存库，只用于显示)
-                                            st.session_state[f"v7_stats_{trade['round_id']}"] = stats
-                                            
-                                            if success:
-                                                st.success("✅ 计算完成！")
-                                                st.session_state[f"show_pa_{trade['round_id']}"] = False 
-                                                time.sleep(0.5)
-                                                st.rerun()
-                                    else:
-                                        # 错误提示也优化一下，告诉用户你要查的是谁
-                                        st.error(f"❌ 本地仓库没有 {clean_symbol} 的数据。请点击侧边栏的【一键同步 K 线】！")
-                        
-                        # === 展示数据 (v7.0 增强版) ===
-                        # 尝试获取实时计算的 v7 stats
-                        v7_stats = st.session_state.get(f"v7_stats_{trade['round_id']}")
+                                        if success:
+                                            st.success("✅ 计算完成！")
+                                            st.session_state[f"show_pa_{trade['round_id']}"] = False 
+                                            time.sleep(0.5)
+                                            st.rerun()
                         
                         # === 全局安全补丁：防止 None 值导致 float() 崩溃 ===
                         def safe_float(v):
@@ -1518,8 +1529,17 @@ if selected_key:
                             st.markdown("##### 🎢 痛苦路径回放 (Price & Volume)")
                             st.caption("红色点标记了你处于浮亏的时刻。灰色区域是 1倍 ATR 的正常波动范围。")
                             
-                            chart_df = v7_stats.get('Charts')
-                            
+                            # v10.0: 图表数据按需重建，会话里只保留一份 (回合 + 数据版本对得上才复用)
+                            chart_df = None
+                            chart_slot = st.session_state.get('pa_chart')
+                            if chart_slot and chart_slot[0] == trade['round_id'] and chart_slot[1] == pa_version:
+                                chart_df = chart_slot[2]
+                            elif st.checkbox("📈 加载图表与回放", key=f"pa_chart_on_{trade['round_id']}"):
+                                with st.spinner("正在重建图表数据..."):
+                                    full_stats = run_pa_calc()
+                                chart_df = full_stats['Charts'] if full_stats else None
+                                st.session_state['pa_chart'] = (trade['round_id'], pa_version, chart_df)
+
                             if chart_df is not None and not chart_df.empty:
                                 from plotly.subplots import make_subplots
                                 import plotly.graph_objects as go
@@ -1739,6 +1759,21 @@ if selected_key:
                                         current_view_df = replay_full_df.iloc[:curr_frame].copy()
                                         last_bar = current_view_df.iloc[-1]
                                         
+                                        # v10.0: 摆动点引擎随播放增量追加 (每帧只喂新出现的 K 线，倒退或数据变了才重建)
+                                        # 全局只保留一个槽位 (当前回放的交易)，换交易时直接覆盖，不按交易累积
+                                        swing_slot = st.session_state.get("rp_swing")
+                                        if (not swing_slot or swing_slot[0] != (tid, pa_version)
+                                                or swing_slot[1].count > curr_frame):
+                                            swing_slot = ((tid, pa_version), SwingTracker())
+                                            st.session_state["rp_swing"] = swing_slot
+                                        swing_tracker = swing_slot[1]
+                                        fed = swing_tracker.count
+                                        swing_tracker.extend(
+                                            replay_full_df['high'].values[fed:curr_frame],
+                                            replay_full_df['low'].values[fed:curr_frame],
+                                            replay_full_df['timestamp'].values[fed:curr_frame]
+                                        )
+                                        
                                         # 数据计算
                                         cur_price = last_bar['close']
                                         cur_time_str = last_bar['datetime'].strftime('%m-%d %H:%M')
@@ -1760,6 +1795,7 @@ if selected_key:
                                             <span style="color:{pnl_color}; font-size:20px; font-weight:bold;">{pnl_pct:+.2f}%</span>
                                         </div>
                                         """, unsafe_allow_html=True)
+                                        st.caption(f"🧭 当前结构 (已确认的摆动点): {swing_tracker.trend_label()}")
                                         
                                         # 绘图
                                         import plotly.graph_objects as go
@@ -1770,6 +1806,16 @@ if selected_key:
                                             low=current_view_df['low'], close=current_view_df['close'],
                                             name='Price'
                                         ))
+                                        # 摆动高/低点标记
+                                        for kind, symbol, color in (('high', 'triangle-down', '#FF5252'), ('low', 'triangle-up', '#4CAF50')):
+                                            points = [sw for sw in swing_tracker.swings if sw.kind == kind]
+                                            if points:
+                                                fig_rep.add_trace(go.Scatter(
+                                                    x=replay_full_df['datetime'].iloc[[sw.index for sw in points]],
+                                                    y=[sw.price for sw in points],
+                                                    mode='markers', name=f'摆动{"高" if kind == "high" else "低"}点',
+                                                    marker=dict(symbol=symbol, color=color, size=9)
+                                                ))
                                         fig_rep.add_hline(y=entry_price, line_dash="dash", line_color="yellow")
                                         
                                         y_min = replay_full_df['low'].min()
@@ -2006,21 +2052,15 @@ if selected_key:
                                     clean_symbol = clean_symbol.replace("USDT", "/USDT")
                                     
                                 with st.spinner(f"正在构建 {sel_tf} Vegas 隧道 (回溯 {days_needed} 天数据)..."):
-                                    raw_context_df = me.get_klines_df(clean_symbol, context_start, context_end)
+                                    # 3. 直接读取预聚合的高周期 K 线 (v10.0 同步时已由 1m 增量生成)
+                                    htf_df = me.get_klines_df(clean_symbol, context_start, context_end, timeframe=resample_rule)
                                     
                                     # 检查数据是否真的足够 (可能你的本地库只同步了 30 天)
-                                    if raw_context_df.empty:
+                                    if htf_df.empty:
                                         st.warning("⚠️ 本地数据为空，请先同步。")
                                     else:
-                                        # 3. 核心算法：重采样
-                                        agg_dict = {
-                                            'open': 'first', 'high': 'max',
-                                            'low': 'min', 'close': 'last', 'volume': 'sum'
-                                        }
-                                        if 'datetime' in raw_context_df.columns:
-                                            raw_context_df.set_index('datetime', inplace=True)
-                                            
-                                        htf_df = raw_context_df.resample(resample_rule).agg(agg_dict).dropna()
+                                        if 'datetime' in htf_df.columns:
+                                            htf_df.set_index('datetime', inplace=True)
                                         
                                         # 4. 计算 Vegas 均线组
                                         if show_vegas and len(htf_df) > 338:
@@ -2446,6 +2486,37 @@ if selected_key:
                 if rounds_df.empty:
                     st.info("暂无数据，请先录入交易。")
                 else:
+                    # v10.0: 批量回填价格行为指标 (下方散点图和 MAE 分析依赖这些字段)
+                    missing_pa = int(pd.to_numeric(rounds_df['mae'], errors='coerce').isna().sum())
+                    with st.expander(f"🧮 批量计算价格行为指标 (还有 {missing_pa} 笔未计算)", expanded=False):
+                        st.caption("按币种分组读取本地 K 线，多进程并行计算 MAE/MFE/ETD/RVOL/形态，结果直接写回交易记录。")
+                        bf_col1, bf_col2 = st.columns(2)
+                        with bf_col1:
+                            bf_risk = st.number_input("📉 单笔风险 ($ Risk)", value=100.0, step=10.0, key="bf_risk")
+                        with bf_col2:
+                            bf_all = st.checkbox("全部重算 (包括已有指标的交易)", key="bf_all")
+                        
+                        if st.button("🚀 开始批量计算", key="btn_pa_backfill", use_container_width=True):
+                            if 'market_engine' not in st.session_state:
+                                st.session_state.market_engine = MarketDataEngine()
+                            bf_status = st.empty()
+                            bf_bar = st.progress(0)
+                            
+                            def backfill_callback(msg, pct):
+                                bf_status.text(msg)
+                                bf_bar.progress(min(pct, 1.0))
+                            
+                            bf_result = backfill_price_action(
+                                engine, selected_key, risk_amount=bf_risk, only_missing=not bf_all,
+                                market_engine=st.session_state.market_engine, progress_callback=backfill_callback
+                            )
+                            bf_bar.progress(1.0)
+                            st.success(f"✅ 完成 {bf_result['done']}/{bf_result['total']} 笔，用时 {bf_result['seconds']:.1f}s")
+                            if bf_result['failed']:
+                                st.warning(f"⚠️ {len(bf_result['failed'])} 笔未能计算 (多数是本地仓库缺少对应 K 线，请先同步)")
+                            time.sleep(2)
+                            st.rerun()
+                    
                     # 1. 数据准备
                     analysis_df = rounds_df.copy()
                     
@@ -2725,7 +2796,7 @@ if selected_key:
                             st.error("请先在左侧侧边栏配置 AI API Key！")
                         else:
                             # === A. 获取并处理数据 (核心修复) ===
-                            conn = sqlite3.connect(engine.db_path)
+                            conn = engine.db.connection()
                             
                             # 1. 既然要合成回合，我们需要读取足够多的历史原始数据
                             # 简单起见，读取全部交易，然后在内存中处理 (SQLite处理几万条数据很快)
@@ -2733,7 +2804,6 @@ if selected_key:
                             query = "SELECT * FROM trades ORDER BY timestamp ASC"
                             try:
                                 df_raw = pd.read_sql_query(query, conn)
-                                conn.close()
                             except Exception as e:
                                 st.error(f"数据库读取失败: {e}")
                                 st.stop()
@@ -2980,19 +3050,21 @@ if selected_key:
                     
                     with col_p1:
                         sim_start_equity = st.number_input("初始模拟资金 ($)", value=10000.0, step=1000.0)
+                        # v10.0: 固定种子可复现同一组模拟 (0 = 每次随机)
+                        sim_seed = st.number_input("随机种子 (0=随机)", min_value=0, value=0, step=1)
                     
                     with col_p2:
                         st.markdown("**模拟次数 (平行宇宙)**")
-                        # 滑块 (Key: slider_runs)
+                        # 滑块 (Key: slider_runs) - v10.0: 上限改为 10000，更大的次数用下方输入框
                         st.slider(
-                            "Runs Slider", 50, 1000, 
-                            value=st.session_state.mc_sim_runs, 
+                            "Runs Slider", 50, 10000, 
+                            value=min(st.session_state.mc_sim_runs, 10000), 
                             key='slider_runs', on_change=sync_runs_slider, 
                             label_visibility="collapsed"
                         )
-                        # 输入框 (Key: input_runs)
+                        # 输入框 (Key: input_runs) - v10.0: 分块 + 多进程模拟，压力测试可直接输入到 100 万次
                         st.number_input(
-                            "Runs Input", 50, 1000, 
+                            "Runs Input", 50, 1_000_000, 
                             value=st.session_state.mc_sim_runs, 
                             key='input_runs', on_change=sync_runs_input, 
                             label_visibility="collapsed"
@@ -3015,16 +3087,43 @@ if selected_key:
                             label_visibility="collapsed"
                         )
                     
+                    # v10.0: 抽样模型与仓位模式
+                    col_m1, col_m2, col_m3 = st.columns(3)
+                    mc_block, mc_strata, mc_risk_pct = 5, 'strategy', 1.0
+                    with col_m1:
+                        mc_model = st.selectbox("抽样模型", options=list(RESAMPLING_MODELS.keys()),
+                                                format_func=RESAMPLING_MODELS.get, key="mc_model")
+                        if mc_model == 'block':
+                            mc_block = st.slider("平均块长 (笔)", 2, 30, 5, key="mc_block",
+                                                 help="块越长，历史上的连亏/连赢保留得越完整")
+                        elif mc_model == 'stratified':
+                            mc_strata = st.radio("分层依据", ['strategy', 'symbol'], horizontal=True, key="mc_strata",
+                                                 format_func=lambda c: "策略" if c == 'strategy' else "币种")
+                    with col_m2:
+                        mc_sizing = st.radio("仓位模式", ['fixed', 'fractional'], key="mc_sizing",
+                                             format_func=lambda c: "固定金额 (历史美元盈亏)" if c == 'fixed' else "固定比例 (R 倍数复利)")
+                    with col_m3:
+                        if mc_sizing == 'fractional':
+                            mc_risk_pct = st.number_input("每笔风险 (% 资金)", 0.1, 20.0, 1.0, step=0.1, key="mc_risk_pct",
+                                                          help="1R = 历史平均亏损；每笔按当前资金的该比例承担 1R")
+                    
                     # 使用 session_state 里的最新值进行模拟
                     if st.button("🎰 开始模拟未来", use_container_width=True, type="primary"):
                         mc_engine = MonteCarloEngine(rounds_df)
+                        mc_resampler = mc_engine.make_resampler(
+                            mc_model, mean_block=mc_block, strata=mc_strata,
+                            sizing=mc_sizing, risk_fraction=mc_risk_pct / 100
+                        )
                         
                         # 获取同步后的值
                         final_runs = st.session_state.mc_sim_runs
                         final_trades = st.session_state.mc_sim_trades
                         
                         with st.spinner(f"正在模拟 {final_runs} 个平行宇宙，每个宇宙交易 {final_trades} 笔..."):
-                            res, msg = mc_engine.run_simulation(sim_start_equity, final_runs, final_trades)
+                            res, msg = mc_engine.run_simulation(
+                                sim_start_equity, final_runs, final_trades,
+                                seed=int(sim_seed) or None, resampler=mc_resampler
+                            )
                             
                         if res:
                             # --- 1. 核心指标卡片 ---
@@ -3049,9 +3148,9 @@ if selected_key:
                             st.markdown("**📈 资金曲线分布图**")
                             
                             # 准备 Plotly 数据
-                            # 为了性能，如果模拟次数太多，只画前 100 条线
-                            display_lines = 100 if final_runs > 100 else final_runs
-                            plot_lines = res['equity_curves'][:display_lines] 
+                            # 为了性能，如果模拟次数太多，只画前 100 条线 (v10.0: 引擎只保留这部分样本路径)
+                            plot_lines = res['sample_curves'][:100]
+                            display_lines = len(plot_lines)
                             
                             import plotly.graph_objects as go
                             
@@ -3068,8 +3167,21 @@ if selected_key:
                                     hoverinfo='skip'
                                 ))
                             
+                            # A2. v10.0 逐笔分位带 (5%-95% 浅色，25%-75% 深色)
+                            bands = res['bands']
+                            for lo_p, hi_p, fill in ((5, 95, 'rgba(33, 150, 243, 0.10)'), (25, 75, 'rgba(33, 150, 243, 0.22)')):
+                                fig_mc.add_trace(go.Scatter(
+                                    x=x_axis, y=bands[hi_p], mode='lines',
+                                    line=dict(width=0), showlegend=False, hoverinfo='skip'
+                                ))
+                                fig_mc.add_trace(go.Scatter(
+                                    x=x_axis, y=bands[lo_p], mode='lines',
+                                    line=dict(width=0), fill='tonexty', fillcolor=fill,
+                                    name=f'{lo_p}%-{hi_p}% 分位带'
+                                ))
+                            
                             # B. 绘制平均线 (亮色，粗线)
-                            avg_line = np.mean(res['equity_curves'], axis=0)
+                            avg_line = res['mean_curve']
                             fig_mc.add_trace(go.Scatter(
                                 x=x_axis, y=avg_line,
                                 mode='lines',
@@ -3092,11 +3204,99 @@ if selected_key:
                             
                             st.plotly_chart(fig_mc, use_container_width=True)
                             
+                            # --- 2b. v10.0 回撤时长与破产时间 ---
+                            d1, d2 = st.columns([1, 2])
+                            with d1:
+                                st.metric("⏳ 最长回撤期 (中位数)", f"{res['median_dd_duration']:.0f} 笔",
+                                          help="每条路径最长的连续水下 (低于前高) 笔数，取中位数")
+                                ttr = res['median_time_to_ruin']
+                                st.metric("💀 破产时间 (中位数)", f"第 {ttr:.0f} 笔" if ttr is not None else "未破产",
+                                          help="破产路径中，资金首次归零是第几笔交易")
+                            with d2:
+                                hist = res['dd_duration_hist']
+                                edges = hist['edges']
+                                fig_dd = go.Figure(go.Bar(
+                                    x=(edges[:-1] + edges[1:]) / 2, y=hist['counts'],
+                                    width=np.diff(edges) * 0.9, marker_color='#FF9800'
+                                ))
+                                fig_dd.update_layout(
+                                    title="最长回撤期分布 (笔数)", height=250,
+                                    margin=dict(t=40, b=10, l=10, r=10),
+                                    plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#E0E0E0')
+                                )
+                                st.plotly_chart(fig_dd, use_container_width=True)
+                            
+                            st.caption(f"🎲 本次随机种子: {res['seed']} (填入上方种子可复现这组模拟)")
+                            
                             # --- 3. 导师点评 ---
                             st.info(f"💡 **风控导师点评**：如果你的破产率 > 0%，请立即缩小仓位！目前最坏的情况下，你的账户会变成 ${res['worst_case']:,.0f}。")
                             
                         else:
                             st.error(msg)
+                    
+                    # --- v10.0 仓位敏感度扫描 (共用随机数，一次算完整张表) ---
+                    st.markdown("---")
+                    with st.expander("📐 仓位敏感度扫描 (破产率热力图 / Kelly)", expanded=False):
+                        st.caption("固定比例仓位 (1R = 历史平均亏损) 下，同一组随机抽样同时评估多个每笔风险比例与初始资金。")
+                        sw1, sw2, sw3, sw4 = st.columns(4)
+                        with sw1:
+                            sweep_fracs_text = st.text_input("每笔风险 (%)，逗号分隔", value="0.5, 1, 2, 3, 5", key="sweep_fracs")
+                        with sw2:
+                            sweep_eq_text = st.text_input("初始资金 ($)，逗号分隔", value="2000, 5000, 10000, 50000", key="sweep_equities")
+                        with sw3:
+                            sweep_ruin_equity = st.number_input("破产线 ($)", min_value=0.0, value=1000.0, step=500.0, key="sweep_ruin_equity",
+                                                                help="资金跌到该金额及以下视为破产 (无法继续按最小仓位交易)")
+                        with sw4:
+                            sweep_ruin_dd = st.number_input("回撤破产线 (%)", min_value=0, max_value=100, value=50, step=5, key="sweep_ruin_dd",
+                                                            help="最大回撤达到该比例也计为破产，0 表示不计")
+                        
+                        if st.button("📐 开始扫描", key="btn_sweep", use_container_width=True):
+                            try:
+                                sweep_fracs = [float(x) / 100 for x in sweep_fracs_text.replace('，', ',').split(',') if x.strip()]
+                                sweep_equities = [float(x) for x in sweep_eq_text.replace('，', ',').split(',') if x.strip()]
+                            except ValueError:
+                                sweep_fracs, sweep_equities = [], []
+                            
+                            sweep_engine = MonteCarloEngine(rounds_df)
+                            with st.spinner(f"正在扫描 {len(sweep_fracs)} × {len(sweep_equities)} 个组合..."):
+                                sweep, msg = sweep_engine.run_sweep(
+                                    sweep_fracs, sweep_equities,
+                                    sim_runs=st.session_state.mc_sim_runs, trades_per_run=st.session_state.mc_sim_trades,
+                                    seed=int(sim_seed) or None,
+                                    resampler=sweep_engine.make_resampler(mc_model, mean_block=mc_block, strata=mc_strata),
+                                    ruin_equity=sweep_ruin_equity,
+                                    ruin_drawdown=sweep_ruin_dd / 100 if sweep_ruin_dd > 0 else None
+                                )
+                            
+                            if sweep:
+                                import plotly.graph_objects as go
+                                frac_labels = [f"{f * 100:g}%" for f in sweep['fractions']]
+                                eq_labels = [f"${e:,.0f}" for e in sweep['start_equities']]
+                                
+                                fig_sweep = go.Figure(go.Heatmap(
+                                    z=sweep['ruin_prob'], x=eq_labels, y=frac_labels,
+                                    colorscale='RdYlGn_r', zmin=0, zmax=100,
+                                    text=np.round(sweep['ruin_prob'], 1), texttemplate="%{text}%",
+                                    colorbar=dict(title="破产率 %")
+                                ))
+                                fig_sweep.update_layout(
+                                    title=f"破产概率 (未来 {sweep['trades_per_run']} 笔，{sweep['sim_runs']} 次模拟)",
+                                    xaxis_title="初始资金", yaxis_title="每笔风险",
+                                    plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#E0E0E0'), height=400
+                                )
+                                st.plotly_chart(fig_sweep, use_container_width=True)
+                                
+                                # 回撤与收益只取决于仓位比例 (与初始资金成正比)
+                                st.dataframe(pd.DataFrame({
+                                    "每笔风险": frac_labels,
+                                    "最大回撤中位数": [f"{v:.1f}%" for v in sweep['median_max_dd']],
+                                    "最大回撤 95%": [f"{v:.1f}%" for v in sweep['p95_max_dd']],
+                                    "期末资金倍数 (中位数)": [f"{v:.2f}x" for v in sweep['median_growth']],
+                                }), use_container_width=True, hide_index=True)
+                                st.info(f"💡 按历史 R 分布 (1R ≈ ${sweep['risk_unit']:,.2f})，Kelly 最优每笔风险约 **{sweep['kelly_fraction'] * 100:.2f}%**；"
+                                        f"实盘通常只用 Kelly 的 1/4 ~ 1/2。")
+                            else:
+                                st.error(msg)
 else:
     # 登录引导页
     st.markdown("""
@@ -0,0 +1,212 @@
+import sys
+import numpy as np
+
+try:
+    import talib
+except ImportError:  # TA-Lib 是可选依赖，没装时走下面的 NumPy 实现
+    talib = None
+
+# 输出列 (与 calc_price_action_stats 原来的列名一致)
+PATTERN_COLUMNS = ['CDL_ENGULFING', 'CDL_HAMMER', 'CDL_DOJI', 'CDL_STAR', 'CDL_SHOOTINGSTAR']
+
+# TA-Lib 默认 K 线参数 (ta_global.c: TA_CandleDefaultSettings)
+# 名称: (区间类型, 均值周期, 系数)；区间类型 0=实体 1=高低 2=上下影线之和
+BODY_LONG = (0, 10, 1.0)
+BODY_SHORT = (0, 10, 1.0)
+SHADOW_LONG = (0, 0, 1.0)
+SHADOW_VERY_SHORT = (1, 10, 0.1)
+NEAR = (1, 5, 0.2)
+
+# 启明星/黄昏星的默认穿透比例 (TA-Lib optInPenetration)
+STAR_PENETRATION = 0.3
+
+
+class _Candles:
+    """一次性算好所有形态共用的派生数组 (实体、影线、颜色、各类区间)"""
+
+    def __init__(self, open_, high, low, close):
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.n = len(self.close)
+        white = self.close >= self.open
+        self.color = np.where(white, 1, -1)
+        self.body = np.abs(self.close - self.open)
+        self.body_top = np.where(white, self.close, self.open)
+        self.body_bottom = np.where(white, self.open, self.close)
+        self.upper_shadow = self.high - self.body_top
+        self.lower_shadow = self.body_bottom - self.low
+        self.hl_range = self.high - self.low
+        self._ranges = {
+            0: self.body,
+            1: self.hl_range,
+            2: self.upper_shadow + self.lower_shadow,
+        }
+
+    def average(self, setting, first_ref):
+        """
+        TA_CANDLEAVERAGE：第 j 根 K 线参照的是它之前 period 根的区间均值 (period 为 0 时取自身区间)
+        返回长度 n 的数组，只有 j >= first_ref 的位置有效
+        累加顺序与 TA-Lib 的滑动合计完全一致 (先求和初始窗口，再逐根 += 新 - 旧)，保证临界值上结果相同
+        """
+        range_type, period, factor = setting
+        r = self._ranges[range_type]
+        divisor = 2.0 if range_type == 2 else 1.0
+        out = np.zeros(self.n)
+        if period == 0:
+            out[:] = factor * r / divisor
+            return out
+        if first_ref >= self.n:
+            return out
+        steps = np.empty(self.n - first_ref)
+        steps[0] = np.cumsum(r[first_ref - period:first_ref])[-1]
+        j = np.arange(first_ref, self.n - 1)
+        steps[1:] = r[j] - r[j - period]
+        totals = np.cumsum(steps)
+        out[first_ref:] = factor * (totals / period) / divisor
+        return out
+
+
+# ===========================
+#  🕯️ 单个形态 (与 TA-Lib 同名函数逐根等价)
+# ===========================
+def _engulfing(k):
+    out = np.zeros(k.n, dtype=np.int32)
+    if k.n <= 2:
+        return out
+    o, c, col = k.open, k.close, k.color
+    i = np.arange(2, k.n)
+    p = i - 1
+    bull = (col[i] == 1) & (col[p] == -1) & (
+        ((c[i] >= o[p]) & (o[i] < c[p])) | ((c[i] > o[p]) & (o[i] <= c[p])))
+    bear = (col[i] == -1) & (col[p] == 1) & (
+        ((o[i] >= c[p]) & (c[i] < o[p])) | ((o[i] > c[p]) & (c[i] <= o[p])))
+    # 开/收盘价与前一根恰好相等时算"不完全吞没"，TA-Lib 记 ±80
+    full = (o[i] != c[p]) & (c[i] != o[p])
+    out[i] = np.where(bull | bear, col[i] * np.where(full, 100, 80), 0)
+    return out
+
+
+def _hammer(k):
+    lookback = max(BODY_SHORT[1], SHADOW_LONG[1], SHADOW_VERY_SHORT[1], NEAR[1]) + 1
+    out = np.zeros(k.n, dtype=np.int32)
+    if k.n <= lookback:
+        return out
+    i = np.arange(lookback, k.n)
+    body_avg = k.average(BODY_SHORT, lookback)
+    shadow_long = k.average(SHADOW_LONG, lookback)
+    shadow_short = k.average(SHADOW_VERY_SHORT, lookback)
+    near = k.average(NEAR, lookback - 1)
+    hit = ((k.body[i] < body_avg[i]) &
+           (k.lower_shadow[i] > shadow_long[i]) &
+           (k.upper_shadow[i] < shadow_short[i]) &
+           (k.body_bottom[i] <= k.low[i - 1] + near[i - 1]))
+    out[i] = np.where(hit, 100, 0)
+    return out
+
+
+def _shootingstar(k):
+    lookback = max(BODY_SHORT[1], SHADOW_LONG[1], SHADOW_VERY_SHORT[1]) + 1
+    out = np.zeros(k.n, dtype=np.int32)
+    if k.n <= lookback:
+        return out
+    i = np.arange(lookback, k.n)
+    body_avg = k.average(BODY_SHORT, lookback)
+    shadow_long = k.average(SHADOW_LONG, lookback)
+    shadow_short = k.average(SHADOW_VERY_SHORT, lookback)
+    hit = ((k.body[i] < body_avg[i]) &
+           (k.upper_shadow[i] > shadow_long[i]) &
+           (k.lower_shadow[i] < shadow_short[i]) &
+           (k.body_bottom[i] > k.body_top[i - 1]))
+    out[i] = np.where(hit, -100, 0)
+    return out
+
+
+def _stars(k, penetration=STAR_PENETRATION):
+    """启明星 (+100) 与黄昏星 (-100) 共用实体均值，一次算完"""
+    lookback = max(BODY_SHORT[1], BODY_LONG[1]) + 2
+    morning = np.zeros(k.n, dtype=np.int32)
+    evening = np.zeros(k.n, dtype=np.int32)
+    if k.n <= lookback:
+        return morning, evening
+    i = np.arange(lookback, k.n)
+    long_avg = k.average(BODY_LONG, lookback - 2)
+    short_mid = k.average(BODY_SHORT, lookback - 1)
+    short_last = k.average(BODY_SHORT, lookback)
+    body, col, c = k.body, k.color, k.close
+    first_long = body[i - 2] > long_avg[i - 2]
+    star_short = body[i - 1] <= short_mid[i - 1]
+    third_long = body[i] > short_last[i]
+    m = (first_long & (col[i - 2] == -1) & star_short &
+         (k.body_top[i - 1] < k.body_bottom[i - 2]) &
+         third_long & (col[i] == 1) &
+         (c[i] > c[i - 2] + body[i - 2] * penetration))
+    e = (first_long & (col[i - 2] == 1) & star_short &
+         (k.body_bottom[i - 1] > k.body_top[i - 2]) &
+         third_long & (col[i] == -1) &
+         (c[i] < c[i - 2] - body[i - 2] * penetration))
+    morning[i] = np.where(m, 100, 0)
+    evening[i] = np.where(e, -100, 0)
+    return morning, evening
+
+
+def _doji(k, length=10, factor=0.1, use_talib=False):
+    """
+    与 pandas_ta.cdl_doji 一致 (pandas_ta 的 doji 是自带实现，不走 TA-Lib)：
+    实体 < 0.1 × 含当根在内的 10 根高低区间均值；区间差值有 0 时整列加 epsilon
+    均值与 pandas_ta.sma 一样：装了 TA-Lib 用 talib.SMA，否则按窗口求均值
+    """
+    out = np.zeros(k.n)
+    if k.n < length:
+        return out
+    body = k.open - k.close
+    if (body == 0).any():
+        body = body + sys.float_info.epsilon
+    body = np.abs(body)
+    hl = k.hl_range
+    if (hl == 0).any():
+        hl = hl + sys.float_info.epsilon
+    hl = np.abs(hl)
+    if use_talib:
+        avg = talib.SMA(hl, timeperiod=length)
+    else:
+        avg = np.full(k.n, np.nan)
+        avg[length - 1:] = np.lib.stride_tricks.sliding_window_view(hl, length).mean(axis=1)
+    with np.errstate(invalid='ignore'):
+        out[body < factor * avg] = 100.0
+    return out
+
+
+# ===========================
+#  📦 对外入口
+# ===========================
+def detect_patterns(open_, high, low, close, use_talib=None):
+    """
+    v10.0 单遍 K 线形态识别：一次算好实体/影线/均值，再同时判定全部形态
+    :param use_talib: None=装了 TA-Lib 就用它算吞没/锤子/星线/流星 (与 pandas_ta 原来的调用路径一致)
+    :return: {列名: 长度 n 的数组}，列名见 PATTERN_COLUMNS；CDL_STAR = 启明星 + 黄昏星
+    """
+    k = _Candles(open_, high, low, close)
+    if use_talib is None:
+        use_talib = talib is not None
+    if use_talib and k.n:
+        args = (k.open, k.high, k.low, k.close)
+        engulfing = talib.CDLENGULFING(*args)
+        hammer = talib.CDLHAMMER(*args)
+        star = talib.CDLMORNINGSTAR(*args, penetration=STAR_PENETRATION) + \
+            talib.CDLEVENINGSTAR(*args, penetration=STAR_PENETRATION)
+        shootingstar = talib.CDLSHOOTINGSTAR(*args)
+    else:
+        engulfing = _engulfing(k)
+        hammer = _hammer(k)
+        morning, evening = _stars(k)
+        star = morning + evening
+        shootingstar = _shootingstar(k)
+    return {
+        'CDL_ENGULFING': engulfing,
+        'CDL_HAMMER': hammer,
+        'CDL_DOJI': _doji(k, use_talib=use_talib),
+        'CDL_STAR': star,
+        'CDL_SHOOTINGSTAR': shootingstar,
+    }
@@ -1,12 +1,65 @@
 import ccxt
+import numpy as np
 import pandas as pd
 import sqlite3
 import time
 import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from db_manager import get_db
+from round_engine import RoundEngine
+from rate_limiter import get_governor
+
+# v10.0: trades 表索引 (名称 -> 列)，按访问模式设计
+TRADE_INDEXES = {
+    # load_trades / 按账户删除：WHERE api_key_tag = ? ORDER BY timestamp
+    'idx_trades_tag_ts': '(api_key_tag, timestamp)',
+    # 回合引擎：按账户+币种分组计数、按时间续跑
+    'idx_trades_tag_symbol_ts': '(api_key_tag, symbol, timestamp)',
+    # 报告页：全账户 ORDER BY timestamp
+    'idx_trades_ts': '(timestamp)',
+}
+
+# v10.0: 热点查询 (名称, SQL, 示例参数)，check_query_plans 用来确认它们都走索引
+HOT_QUERIES = [
+    ('load_trades', "SELECT * FROM trades WHERE api_key_tag = ? ORDER BY timestamp DESC", ('abcd',)),
+    ('delete_account', "DELETE FROM trades WHERE api_key_tag = ?", ('abcd',)),
+    ('report_all_trades', "SELECT * FROM trades ORDER BY timestamp ASC", ()),
+    ('update_trade', "UPDATE trades SET notes = ? WHERE id = ? AND api_key_tag = ?", ('', '1', 'abcd')),
+    ('screenshot_lookup', "SELECT screenshot FROM trades WHERE id GLOB ? AND api_key_tag = ?", ('MANUAL_1*_OPEN', 'abcd')),
+    ('delete_trade', "DELETE FROM trades WHERE id GLOB ? AND api_key_tag = ?", ('MANUAL_1*', 'abcd')),
+    # round_engine.RoundEngine.sync
+    ('round_sync_counts', "SELECT symbol, COUNT(*), MAX(rowid) FROM trades WHERE api_key_tag = ? GROUP BY symbol", ('abcd',)),
+    ('round_sync_resume', '''SELECT rowid, id, timestamp, side, amount, pnl, fee FROM trades
+        WHERE api_key_tag = ? AND symbol = ? AND rowid > ? ORDER BY timestamp ASC, rowid ASC''', ('abcd', 'BTC/USDT:USDT', 0)),
+    ('round_sync_rebuild', '''SELECT rowid, id, timestamp, side, amount, pnl, fee FROM trades
+        WHERE api_key_tag = ? AND symbol = ? ORDER BY timestamp ASC, rowid ASC''', ('abcd', 'BTC/USDT:USDT')),
+    # round_engine.RoundEngine.load_rounds
+    ('round_meta_join', '''SELECT t.id, t.notes FROM rounds r
+        JOIN trades t ON t.id = r.round_id AND t.api_key_tag = r.api_key_tag WHERE r.api_key_tag = ?''', ('abcd',)),
+]
+
+
+def _glob_escape(text):
+    """转义 GLOB 通配符，让 ID 作为字面前缀匹配 (注意 GLOB 区分大小写，与 LIKE 不同)"""
+    return ''.join(f'[{ch}]' if ch in '*?[' else ch for ch in str(text))
+
 
 class TradeDataEngine:
-    def __init__(self, db_path=None):
+    # v10.0: 快速同步时并发抓取的币种数 (节奏仍由全局权重调度器控制)
+    SYNC_CONCURRENCY = 8
+    # v10.0: 并发抓取时每攒够这么多条成交就写一次库
+    SAVE_BATCH_SIZE = 500
+    # v10.0: 资金流水接口单次查询的最大时间跨度 (超过则分窗口)
+    INCOME_WINDOW_MS = 200 * 24 * 60 * 60 * 1000
+    # 成交接口按时间查询时单次最大跨度 (交易所限制 7 天)
+    TRADE_WINDOW_MS = 7 * 24 * 60 * 60 * 1000
+    # BNB 手续费换算：成交时间往前最多回看多久的 1m K 线
+    BNB_PRICE_TOLERANCE_MS = 120000
+
+    def __init__(self, db_path=None, market_engine=None):
         # --- 核心修改：强制使用绝对路径，避免"幽灵数据库"问题 ---
         if db_path is None:
             # 获取当前脚本所在目录的绝对路径
@@ -21,12 +74,43 @@ class TradeDataEngine:
             # 启动时打印路径以便调试
             print(f"数据库锁定位置: {db_path}")
         self.db_path = db_path
+        # v10.0: 共享长连接 (每线程一条，WAL 模式)
+        self.db = get_db(self.db_path)
         self._init_db()
+        # v10.0: 增量回合引擎 (rounds / round_state 表)
+        self.round_engine = RoundEngine(self.db)
+        # v10.0: K 线仓库 (BNB 手续费换算用，首次需要时再创建)
+        self.market_engine = market_engine
 
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
+        with self.db.transaction() as conn:
+            self._create_tables(conn.cursor())
+            self._create_indexes(conn.cursor())
+        # 让查询规划器拿到新索引的统计信息 (只在需要时才真正执行 ANALYZE)
+        self.db.connection().execute("PRAGMA optimize")
+
+    def _create_indexes(self, c):
+        """v10.0 索引管理：按热点查询的访问模式建索引 (已存在则跳过)"""
+        for name, columns in TRADE_INDEXES.items():
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON trades {columns}")
+
+    def check_query_plans(self):
+        """
+        v10.0 查询计划回归检查：对 HOT_QUERIES 逐条 EXPLAIN QUERY PLAN
+        出现对 trades 的无索引全表扫描，或为排序/分组建临时 B 树，都视为回归
+        :return: {查询名: [问题计划行, ...]} (为空表示全部通过)
+        """
+        conn = self.db.connection()
+        problems = {}
+        for name, sql, params in HOT_QUERIES:
+            details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            bad = [d for d in details
+                   if (d.startswith('SCAN') and 'INDEX' not in d) or 'TEMP B-TREE' in d]
+            if bad:
+                problems[name] = bad
+        return problems
+
+    def _create_tables(self, c):
         # 1. 交易数据表 (包含所有 v8.3 所需字段)
         c.execute('''
             CREATE TABLE IF NOT EXISTS trades (
@@ -104,9 +188,38 @@ class TradeDataEngine:
                 value TEXT
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+
+        # 6. 同步水位表 (v10.0: 每个账户/币种/数据类型记录已同步到哪里)
+        # kind: 'trades' 逐币种成交 / 'funding' 账户级资金费 (symbol 记为 '*')
+        # last_id: 已同步的最大成交 ID (fromId 翻页起点)
+        # last_ts: 已同步到的时间点；covered_from: 从这个时间点起的历史是完整的
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                api_key_tag TEXT,
+                symbol TEXT,
+                kind TEXT,
+                last_id INTEGER,
+                last_ts INTEGER,
+                covered_from INTEGER,
+                updated_at INTEGER,
+                PRIMARY KEY (api_key_tag, symbol, kind)
+            )
+        ''')
+
+        # 7. 价格行为统计缓存 (v10.0: calc_price_action_stats 的标量结果)
+        # data_version: K 线窗口 + 开仓价/数量/方向的指纹 (见 data_processor.pa_data_version)
+        # stats: 标量结果 JSON (不含图表 DataFrame，图表需要时现场重建)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS pa_stats (
+                api_key_tag TEXT,
+                round_id TEXT,
+                data_version TEXT,
+                risk_amount REAL,
+                stats TEXT,
+                created_at INTEGER,
+                PRIMARY KEY (api_key_tag, round_id, data_version, risk_amount)
+            )
+        ''')
 
     # ===========================
     #  🔑 账户管理功能
@@ -121,46 +234,41 @@ class TradeDataEngine:
         if not clean_key or not clean_secret or not clean_alias:
             return False, "❌ 所有字段都不能为空"
             
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
-            c.execute('INSERT OR REPLACE INTO api_configs (api_key, secret, alias) VALUES (?, ?, ?)', 
-                      (clean_key, clean_secret, clean_alias))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute('INSERT OR REPLACE INTO api_configs (api_key, secret, alias) VALUES (?, ?, ?)', 
+                             (clean_key, clean_secret, clean_alias))
             return True, f"✅ 账户【{clean_alias}】保存成功！"
         except Exception as e:
             return False, str(e)
-        finally:
-            conn.close()
 
     def get_all_accounts(self):
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query("SELECT alias, api_key FROM api_configs", conn)
-        conn.close()
-        return df
+        return pd.read_sql_query("SELECT alias, api_key FROM api_configs", self.db.connection())
 
     def get_credentials(self, api_key):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        c = self.db.connection().cursor()
         c.execute("SELECT secret FROM api_configs WHERE api_key = ?", (api_key,))
         result = c.fetchone()
-        conn.close()
         return result[0] if result else None
 
     def delete_account_full(self, api_key):
         key_tag = api_key.strip()[-4:]
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # 1. 删交易数据
-        c.execute("DELETE FROM trades WHERE api_key_tag = ?", (key_tag,))
-        trades_count = c.rowcount
-        
-        # 2. 删账号配置
-        c.execute("DELETE FROM api_configs WHERE api_key = ?", (api_key,))
-        
-        conn.commit()
-        conn.close()
+        self.round_engine.invalidate(key_tag)
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            
+            # 1. 删交易数据
+            c.execute("DELETE FROM trades WHERE api_key_tag = ?", (key_tag,))
+            trades_count = c.rowcount
+            
+            # 2. 删账号配置
+            c.execute("DELETE FROM api_configs WHERE api_key = ?", (api_key,))
+            
+            # 3. 删同步水位 (重新添加账号时从头同步)
+            c.execute("DELETE FROM sync_state WHERE api_key_tag = ?", (key_tag,))
+
+            # 4. 删价格行为统计缓存
+            c.execute("DELETE FROM pa_stats WHERE api_key_tag = ?", (key_tag,))
         return trades_count
 
     # ===========================
@@ -175,14 +283,14 @@ class TradeDataEngine:
                 'apiKey': clean_key,
                 'secret': clean_secret,
                 'timeout': 30000,
-                'enableRateLimit': True,
                 'options': {'defaultType': 'future'} 
             })
-            return exchange
+            # v10.0: 请求节奏交给全局权重调度器 (与 K 线同步共用同一份 IP 权重预算)
+            return get_governor().govern(exchange)
         except:
             return None
 
-    def fetch_and_save(self, api_key, secret, mode, target_coins_str=None, progress_callback=None):
+    def fetch_and_save(self, api_key, secret, mode, target_coins_str=None, progress_callback=None, concurrency=None):
         try:
             exchange = self.get_exchange(api_key, secret)
             if not exchange: 
@@ -218,61 +326,87 @@ class TradeDataEngine:
 
             key_tag = api_key.strip()[-4:]
             all_trades = []
+            new_count = 0
+            found_count = 0
+
+            # v10.0: 同步水位 {(symbol, kind): state}，本次同步成功的部分在保存后统一推进
+            sync_states = self.get_sync_states(key_tag)
+            state_updates = []
+            # 本次同步中失败的部分 (写进返回信息，不能只打印到控制台)
+            failures = []
 
-            # --- 辅助函数：抓取资金费用 (v8.3 新增) ---
-            def fetch_funding_income(symbol, since_ts, end_ts=None):
-                """抓取资金费用并转换为 Pseudo-Trade 格式"""
+            # --- 辅助函数：账户级资金费扫描 (v10.0：一次分页扫完整段时间，本地按币种拆分) ---
+            def sweep_funding(since_ts, end_ts):
+                """从资金费水位 (或 since_ts) 扫到 end_ts，成功后登记新水位"""
                 funding_trades = []
+                state = sync_states.get(('*', 'funding'))
+                # 已覆盖到 since_ts 之前的话，只需从上次扫到的位置继续
+                start = state['last_ts'] if state and (state['covered_from'] or end_ts) <= since_ts else since_ts
                 try:
-                    params = {'incomeType': 'FUNDING_FEE'}
-                    if end_ts: params['endTime'] = end_ts
-                    
-                    # 抓取 Income
-                    incomes = exchange.fetch_income(symbol, since=since_ts, limit=1000, params=params)
-                    
-                    for inc in incomes:
-                        # 转换格式
-                        funding_trades.append({
-                            'id': f"FUND_{inc['id']}", # 特殊 ID 防止冲突
-                            'timestamp': inc['timestamp'],
-                            'datetime': inc['datetime'],
-                            'symbol': inc['symbol'],
-                            'side': 'FUNDING', # 特殊方向
-                            'price': 0.0,
-                            'amount': 0.0,
-                            'cost': 0.0,
-                            'fee': None, # 资金费没有手续费
-                            'info': {'realizedPnl': inc['amount']}, # 将金额放入 PnL
-                            'type': 'funding'
-                        })
-                except Exception:
-                    pass
+                    by_symbol = self.fetch_funding_sweep(exchange, start, end_ts)
+                    for items in by_symbol.values():
+                        funding_trades.extend(items)
+                    state_updates.append(('*', 'funding', None, end_ts, start))
+                except Exception as e:
+                    print(f"⚠️ 资金费扫描失败: {e}")
+                    failures.append(f"资金费扫描: {e}")
                 return funding_trades
 
-            # --- 模式 A: 快速同步 ---
+            # --- 模式 A: 快速同步 (v10.0 并发抓取，边抓边存) ---
             if mode == 'recent':
                 if progress_callback: progress_callback(f"🚀 准备扫描 {total_count} 个合约 (USDT & USDC)...", 5)
                 since_time = int((datetime.now() - timedelta(days=7)).timestamp() * 1000)
                 
-                for i, symbol in enumerate(all_target_symbols):
-                    try:
-                        if i % 5 == 0 and progress_callback:
+                # ccxt 同步实例不保证线程安全：每个线程一个实例，共享已加载的市场名录
+                local = threading.local()
+                def thread_client():
+                    client = getattr(local, 'client', None)
+                    if client is None:
+                        client = self.get_exchange(api_key, secret)
+                        if client is None:
+                            raise RuntimeError("交易所对象创建失败")
+                        client.set_markets_from_exchange(exchange)
+                        local.client = client
+                    return client
+                
+                scan_end = exchange.milliseconds()
+                
+                def scan_symbol(symbol):
+                    # 逐币种抓交易 (资金费在下面统一扫描)
+                    # 有水位的币种从水位向后翻页；没有水位的从 7 天前开始
+                    state = sync_states.get((symbol, 'trades')) or {'last_id': None, 'last_ts': since_time, 'covered_from': since_time}
+                    fetched = self._fetch_trades_forward(thread_client(), symbol, state['last_id'], state['last_ts'], scan_end)
+                    last_id = max([state['last_id'] or 0] + [int(t['id']) for t in fetched]) or None
+                    return fetched, (symbol, 'trades', last_id, scan_end, state['covered_from'])
+                
+                # 1. 资金费：账户级一次扫描，只有真正产生过资金费的币种才会出现
+                pending = sweep_funding(since_time, scan_end)
+                found_count += len(pending)
+                
+                # 2. 交易：并发逐币种抓取
+                workers = concurrency or self.SYNC_CONCURRENCY
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = {pool.submit(scan_symbol, symbol): symbol for symbol in all_target_symbols}
+                    for i, future in enumerate(as_completed(futures), start=1):
+                        try:
+                            fetched, state_update = future.result()
+                        except Exception as e:
+                            # 失败的币种不推进水位 (下次重抓)，并记进返回信息
+                            failures.append(f"{futures[future]}: {e}")
+                            continue
+                        state_updates.append(state_update)
+                        if fetched:
+                            found_count += len(fetched)
+                            pending.extend(fetched)
+                        # 边抓边存 (写库只在当前线程进行)
+                        if len(pending) >= self.SAVE_BATCH_SIZE:
+                            new_count += self._save_to_db(pending, key_tag, exchange=exchange)
+                            pending = []
+                        if progress_callback and (i % 5 == 0 or i == total_count):
                             pct = 5 + int((i / total_count) * 90)
-                            progress_callback(f"🔍 [{i}/{total_count}] 扫描: {symbol}", pct)
-                        
-                        # 1. 抓交易
-                        trades = exchange.fetch_my_trades(symbol=symbol, since=since_time, limit=100)
-                        if trades: 
-                            all_trades.extend(trades)
-                        
-                        # 2. 抓资金费 (快速模式下也抓取，但加一点延时)
-                        funding = fetch_funding_income(symbol, since_time)
-                        if funding: 
-                            all_trades.extend(funding)
-                            
-                        time.sleep(0.05) 
-                    except Exception as e:
-                        continue
+                            progress_callback(f"🔍 [{i}/{total_count}] 已扫描，发现 {found_count} 条记录", pct)
+                if pending:
+                    new_count += self._save_to_db(pending, key_tag, exchange=exchange)
 
             # --- 模式 B: 深度同步 ---
             elif mode == 'deep':
@@ -299,7 +433,12 @@ class TradeDataEngine:
                 total_targets = len(target_symbols)
 
                 for i, symbol in enumerate(target_symbols):
-                    current_end = now_ts
+                    state = sync_states.get((symbol, 'trades'))
+                    failed = False
+                    symbol_trades = []
+                    
+                    # 1. 向后补历史：只补水位尚未覆盖的区间 (已覆盖满一年则直接跳过)
+                    current_end = state['covered_from'] if state else now_ts
                     while current_end > stop_ts:
                         current_start = current_end - window_size
                         if current_start < stop_ts: current_start = stop_ts 
@@ -308,31 +447,62 @@ class TradeDataEngine:
                         if progress_callback: progress_callback(msg, 50)
                         
                         try:
-                            # 1. 抓交易
+                            # 抓交易 (资金费在循环结束后统一扫描)
                             trades = exchange.fetch_my_trades(symbol=symbol, since=current_start, limit=1000, params={'endTime': current_end})
-                            if trades: all_trades.extend(trades)
-                            
-                            # 2. 抓资金费
-                            funding = fetch_funding_income(symbol, current_start, current_end)
-                            if funding: all_trades.extend(funding)
+                            if trades: symbol_trades.extend(trades)
                             
                             current_end = current_start
                             if current_end <= stop_ts: break
-                            time.sleep(0.3)
                         except Exception as e:
+                            failed = True
                             current_end = current_start 
                             time.sleep(0.5)
+                    
+                    # 2. 向前追新：从水位开始按 fromId 翻页 (没有变化时只需一次请求)
+                    if state:
+                        try:
+                            symbol_trades.extend(self._fetch_trades_forward(exchange, symbol, state['last_id'], state['last_ts'], now_ts))
+                        except Exception as e:
+                            failed = True
+                    
+                    all_trades.extend(symbol_trades)
+                    # 有窗口失败时不登记水位，下次深度同步重新补
+                    if failed:
+                        failures.append(f"{symbol}: 部分时间窗口抓取失败")
+                    else:
+                        last_id = max([(state or {}).get('last_id') or 0] + [int(t['id']) for t in symbol_trades]) or None
+                        state_updates.append((symbol, 'trades', last_id, now_ts, stop_ts))
+                
+                # 资金费：整年一次账户级扫描 (已扫过的部分从水位继续)
+                if progress_callback: progress_callback("💸 扫描资金费流水...", 90)
+                all_trades.extend(sweep_funding(stop_ts, now_ts))
 
-            if not all_trades: 
-                return f"✅ 扫描完成。未发现新数据。", 0
+            if all_trades:
+                if progress_callback: progress_callback(f"💾 正在保存 (含 BNB 换算 & 资金费)...", 95)
                 
-            if progress_callback: progress_callback(f"💾 正在保存 (含 BNB 换算 & 资金费)...", 95)
+                # --- 关键：传入 exchange 以便查询 BNB 汇率 ---
+                new_count = self._save_to_db(all_trades, key_tag, exchange=exchange)
             
-            # --- 关键：传入 exchange 以便查询 BNB 汇率 ---
-            new_count = self._save_to_db(all_trades, key_tag, exchange=exchange)
+            # 数据落库后再推进水位 (中途失败时下次会重抓，INSERT OR IGNORE 兜底去重)
+            self._update_sync_states(key_tag, state_updates)
+            
+            failure_note = ""
+            if failures:
+                shown = "；".join(failures[:5]) + (f" 等 {len(failures)} 项" if len(failures) > 5 else "")
+                failure_note = f" (⚠️ 部分失败: {shown})"
+            
+            if not all_trades and not found_count: 
+                if failures:
+                    return f"⚠️ 扫描未完成，未获取到新数据{failure_note}", 0
+                return f"✅ 扫描完成。未发现新数据。", 0
+            
+            # 只对有新成交的币种续跑回合状态机
+            if new_count > 0:
+                if progress_callback: progress_callback("🔁 正在更新交易回合...", 98)
+                self.round_engine.sync(key_tag)
             
             if progress_callback: progress_callback("✅ 完成！", 100)
-            return f"✅ 同步成功！新增 {new_count} 条记录", new_count
+            return f"✅ 同步成功！新增 {new_count} 条记录{failure_note}", new_count
             
         except Exception as e:
             import traceback
@@ -407,23 +577,188 @@ class TradeDataEngine:
             traceback.print_exc()
             return None, f"获取持仓失败: {str(e)}"
 
-    def _save_to_db(self, trades, key_tag, exchange=None):
+    # ===========================
+    #  🔖 同步水位
+    # ===========================
+    def get_sync_states(self, key_tag):
+        """读取账户的同步水位 {(symbol, kind): {last_id, last_ts, covered_from}}"""
+        c = self.db.connection().cursor()
+        c.execute("SELECT symbol, kind, last_id, last_ts, covered_from FROM sync_state WHERE api_key_tag = ?", (key_tag,))
+        return {(row[0], row[1]): {'last_id': row[2], 'last_ts': row[3], 'covered_from': row[4]} for row in c.fetchall()}
+
+    def _update_sync_states(self, key_tag, updates):
+        """
+        推进水位：[(symbol, kind, last_id, last_ts, covered_from), ...]
+        last_id / last_ts 只进不退，covered_from 只往更早扩展
+        """
+        if not updates:
+            return
+        now_ms = int(time.time() * 1000)
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO sync_state (api_key_tag, symbol, kind, last_id, last_ts, covered_from, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (api_key_tag, symbol, kind) DO UPDATE SET
+                    last_id = NULLIF(MAX(COALESCE(last_id, 0), COALESCE(excluded.last_id, 0)), 0),
+                    last_ts = MAX(COALESCE(last_ts, 0), COALESCE(excluded.last_ts, 0)),
+                    covered_from = MIN(COALESCE(covered_from, excluded.covered_from), COALESCE(excluded.covered_from, covered_from)),
+                    updated_at = excluded.updated_at
+            ''', [(key_tag, symbol, kind, last_id, last_ts, covered_from, now_ms)
+                  for symbol, kind, last_id, last_ts, covered_from in updates])
+
+    def _fetch_trades_forward(self, client, symbol, last_id, since_ts, end_ts, limit=1000):
+        """
+        从水位向后抓取成交
+        有 last_id 时直接按 fromId 翻页；没有时先按时间窗口找到第一笔成交，再切换为 fromId 翻页
+        """
+        trades = []
+        start = since_ts
+        while last_id is None and start < end_ts:
+            window_end = min(start + self.TRADE_WINDOW_MS, end_ts)
+            page = client.fetch_my_trades(symbol=symbol, since=start, limit=limit, params={'endTime': window_end})
+            if page:
+                trades.extend(page)
+                last_id = max(int(t['id']) for t in page)
+            start = window_end + 1
+        
+        while last_id is not None:
+            page = client.fetch_my_trades(symbol=symbol, limit=limit, params={'fromId': last_id + 1})
+            trades.extend(page)
+            if len(page) < limit:
+                break
+            last_id = max(int(t['id']) for t in page)
+        return trades
+
+    def fetch_funding_sweep(self, exchange, since_ts, end_ts=None, symbols=None, page_limit=1000):
+        """
+        v10.0 账户级资金费扫描：不指定币种，按时间分页拉取整段 FUNDING_FEE 流水，再在本地按币种拆分
+        走 ccxt 的 fetch_funding_history (即 /fapi/v1/income?incomeType=FUNDING_FEE，不传 symbol 时返回全账户)
+        :param symbols: 只保留这些合约 (None 表示全部)，'BTC/USDT' 与 'BTC/USDT:USDT' 写法都可以
+        :return: {symbol: [资金费 Pseudo-Trade, ...]}
+        """
+        end_ts = end_ts or exchange.milliseconds()
+        wanted = None
+        if symbols is not None:
+            wanted = {s.split(':')[0] for s in symbols}
+        
+        by_symbol = {}
+        seen_ids = set()
+        cursor = since_ts
+        while cursor <= end_ts:
+            window_end = min(end_ts, cursor + self.INCOME_WINDOW_MS)
+            incomes = exchange.fetch_funding_history(None, cursor, page_limit, {'endTime': window_end})
+            fresh = [inc for inc in incomes if inc['id'] not in seen_ids]
+            for inc in fresh:
+                seen_ids.add(inc['id'])
+                symbol = inc['symbol']
+                if wanted is not None and (symbol or '').split(':')[0] not in wanted:
+                    continue
+                by_symbol.setdefault(symbol, []).append(self._funding_to_trade(inc))
+            
+            if len(incomes) >= page_limit and fresh:
+                # 本窗口还有下一页：从本页最后一条的时间戳开始 (含)，同一毫秒的流水靠 id 去重
+                cursor = incomes[-1]['timestamp']
+            else:
+                cursor = window_end + 1
+        return by_symbol
+
+    @staticmethod
+    def _funding_to_trade(inc):
+        """资金费流水 -> Pseudo-Trade 格式 (v8.3)"""
+        return {
+            'id': f"FUND_{inc['id']}", # 特殊 ID 防止冲突
+            'timestamp': inc['timestamp'],
+            'datetime': inc['datetime'],
+            'symbol': inc['symbol'],
+            'side': 'FUNDING', # 特殊方向
+            'price': 0.0,
+            'amount': 0.0,
+            'cost': 0.0,
+            'fee': None, # 资金费没有手续费
+            'info': {'realizedPnl': inc['amount']}, # 将金额放入 PnL
+            'type': 'funding'
+        }
+
+    # ===========================
+    #  💱 BNB 手续费换算
+    # ===========================
+    def _get_market_engine(self):
+        if self.market_engine is None:
+            from market_engine import MarketDataEngine
+            self.market_engine = MarketDataEngine()
+        return self.market_engine
+
+    def _bnb_prices(self, timestamps, exchange=None, symbol='BNB/USDT'):
         """
-        保存交易数据 (v8.3: 本地优先查 BNB K线换算费用)
+        v10.0 批量查询 BNB 价格 (as-of 对齐：取成交时间之前 2 分钟内最近一根 1m K 线的收盘价)
+        1. 从本地 K 线仓库一次读出覆盖全部成交时间的 BNB 1m 序列
+        2. 本地缺失的时间段合并成少量区间，按区间批量向交易所补抓 (只用于本次换算，不写回仓库)
+        :return: 与 timestamps 对齐的价格数组 (查不到为 NaN)
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        count = 0
+        ts = np.asarray(timestamps, dtype=np.int64)
+        prices = np.full(len(ts), np.nan)
+        if len(ts) == 0:
+            return prices
+        tol = self.BNB_PRICE_TOLERANCE_MS
+        
+        def as_of(k_ts, k_close, mask):
+            idx = np.searchsorted(k_ts, ts[mask], side='right') - 1
+            ok = idx >= 0
+            ok[ok] = ts[mask][ok] - k_ts[idx[ok]] < tol
+            hit = np.flatnonzero(mask)[ok]
+            prices[hit] = k_close[idx[ok]]
         
-        # 预编译本地查询SQL (依赖 market_data 表)
-        check_local_sql = '''
-            SELECT close FROM market_data 
-            WHERE symbol = 'BNB/USDT' 
-            AND timestamp <= ? 
-            AND timestamp > ?
-            ORDER BY timestamp DESC LIMIT 1
-        '''
+        # 1️⃣ 本地仓库 (一次区间读取)
+        try:
+            klines = self._get_market_engine()._read_array(symbol, '1m', int(ts.min()) - tol, int(ts.max()))
+            if len(klines):
+                as_of(klines['timestamp'], klines['close'], np.ones(len(ts), dtype=bool))
+        except Exception as e:
+            print(f"⚠️ 读取本地 BNB K 线失败: {e}")
         
+        # 2️⃣ 本地缺失的部分按区间批量补抓
+        missing = np.isnan(prices)
+        if exchange is None or not missing.any():
+            return prices
+        fetched = []
+        for start, end in self._missing_spans(np.sort(ts[missing])):
+            since = start - tol
+            while since <= end:
+                try:
+                    candles = exchange.fetch_ohlcv(symbol, '1m', since=since, limit=1000)
+                except Exception:
+                    break
+                if not candles:
+                    break
+                fetched.extend(candles)
+                since = candles[-1][0] + 60000
+        if fetched:
+            arr = np.array(sorted({c[0]: c for c in fetched}.values()), dtype=np.float64)
+            as_of(arr[:, 0].astype(np.int64), arr[:, 4], missing)
+        return prices
+
+    @staticmethod
+    def _missing_spans(sorted_ts, max_gap_ms=1000 * 60000):
+        """把排好序的时间戳合并成区间 (相邻间隔超过 max_gap_ms 才拆开，间隔内一页 K 线就能覆盖)"""
+        spans = []
+        if len(sorted_ts) == 0:
+            return spans
+        breaks = np.flatnonzero(np.diff(sorted_ts) > max_gap_ms)
+        starts = np.r_[0, breaks + 1]
+        ends = np.r_[breaks, len(sorted_ts) - 1]
+        for s, e in zip(starts, ends):
+            spans.append((int(sorted_ts[s]), int(sorted_ts[e])))
+        return spans
+
+    def _save_to_db(self, trades, key_tag, exchange=None):
+        """
+        保存交易数据 (v8.3: BNB 手续费换算成 USDT)
+        v10.0 批量入库：先把所有成交规整成元组，BNB 手续费整批查价，最后一个事务 executemany 写入
+        :return: 新增条数 (由连接的 total_changes 差值得出，被 IGNORE 的重复行不计)
+        """
+        # 1️⃣ 规整：ccxt 成交 -> 入库元组 (单条数据异常直接跳过，与逐条写入时一致)
+        rows = []
+        bnb_rows = []  # 需要换算的 (rows 下标, 成交时间)
         for t in trades:
             try:
                 # 处理 PnL (如果是资金费，这里直接取 info 里的金额)
@@ -436,95 +771,88 @@ class TradeDataEngine:
                 # 资金费没有 Fee，只有 PnL
                 if t['side'] != 'FUNDING' and t.get('fee'):
                     fee_data = t.get('fee', {})
-                    raw_cost = float(fee_data.get('cost', 0))
-                    raw_currency = fee_data.get('currency', 'USDT')
+                    fee_cost = float(fee_data.get('cost', 0))
+                    fee_currency = fee_data.get('currency', 'USDT')
                     
-                    # 如果是 BNB 且有 exchange 对象，进行换算
-                    if raw_currency == 'BNB' and exchange and raw_cost > 0:
-                        trade_ts = t['timestamp']
-                        bnb_price = None
-                        
-                        # 1️⃣ 优先查本地 (极速)
-                        try:
-                            # 查前 2 分钟内的数据
-                            c.execute(check_local_sql, (trade_ts, trade_ts - 120000))
-                            row = c.fetchone()
-                            if row: bnb_price = row[0]
-                        except: pass
-                        
-                        # 2️⃣ 本地没有则查 API (兜底)
-                        if bnb_price is None:
-                            try:
-                                candles = exchange.fetch_ohlcv('BNB/USDT', '1m', since=trade_ts, limit=1)
-                                if candles: bnb_price = candles[0][4]
-                            except: pass
-                        
-                        # 3️⃣ 换算
-                        if bnb_price:
-                            fee_cost = raw_cost * bnb_price
-                            fee_currency = 'USDT' # 换算成功
-                        else:
-                            fee_cost = raw_cost
-                            fee_currency = 'BNB' # 换算失败，保留原样
-                    else:
-                        fee_cost = raw_cost
-                        fee_currency = raw_currency
+                    # 如果是 BNB 且有 exchange 对象，稍后整批换算
+                    if fee_currency == 'BNB' and exchange and fee_cost > 0:
+                        bnb_rows.append((len(rows), t['timestamp']))
                 
-                c.execute('''
-                    INSERT OR IGNORE INTO trades 
-                    (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (str(t['id']), t['timestamp'], t['datetime'], t['symbol'], t['side'], float(t['price'] or 0), float(t['amount'] or 0), float(t['cost'] or 0), fee_cost, fee_currency, pnl, key_tag))
-                if c.rowcount > 0: count += 1
+                rows.append([str(t['id']), t['timestamp'], t['datetime'], t['symbol'], t['side'],
+                             float(t['price'] or 0), float(t['amount'] or 0), float(t['cost'] or 0),
+                             fee_cost, fee_currency, pnl, key_tag])
             except Exception as e:
-                # print(f"❌ 写入失败: {e}")
                 continue
-        conn.commit()
-        conn.close()
-        return count
+        
+        # 2️⃣ BNB 手续费整批查价换算 (查不到的保留 BNB 原值)
+        if bnb_rows:
+            prices = self._bnb_prices([ts for _, ts in bnb_rows], exchange=exchange)
+            for (row_idx, _), bnb_price in zip(bnb_rows, prices):
+                if not np.isnan(bnb_price) and bnb_price:
+                    rows[row_idx][8] = rows[row_idx][8] * bnb_price
+                    rows[row_idx][9] = 'USDT' # 换算成功
+        
+        if not rows:
+            return 0
+        
+        # 3️⃣ 单事务批量写入
+        with self.db.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO trades 
+                (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            return conn.total_changes - before
 
     def load_trades(self, api_key):
-        conn = sqlite3.connect(self.db_path)
         key_tag = api_key.strip()[-4:] if api_key else ""
         try:
-            df = pd.read_sql_query("SELECT * FROM trades WHERE api_key_tag = ? ORDER BY timestamp DESC", conn, params=(key_tag,))
+            df = pd.read_sql_query("SELECT * FROM trades WHERE api_key_tag = ? ORDER BY timestamp DESC", self.db.connection(), params=(key_tag,))
         except: df = pd.DataFrame()
-        conn.close()
         return df
 
+    def load_rounds(self, api_key):
+        """
+        v10.0 读取交易回合 (增量版)
+        先把新成交增量并入 rounds 表，再读取；输出与 process_trades_to_rounds 相同
+        """
+        key_tag = api_key.strip()[-4:] if api_key else ""
+        try:
+            self.round_engine.sync(key_tag)
+            return self.round_engine.load_rounds(key_tag)
+        except Exception as e:
+            print(f"⚠️ 读取回合失败: {e}")
+            return pd.DataFrame()
+
     # ===========================
     #  📝 笔记与 AI 数据更新
     # ===========================
     def update_trade_note(self, trade_id, note_text, strategy_text=None, api_key=None):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
-            if api_key:
-                key_tag = api_key.strip()[-4:]
-                if strategy_text is not None:
-                    try:
-                        c.execute("UPDATE trades SET notes = ?, strategy = ? WHERE id = ? AND api_key_tag = ?", 
-                                (note_text, strategy_text, trade_id, key_tag))
-                    except sqlite3.OperationalError:
+            with self.db.transaction() as conn:
+                c = conn.cursor()
+                if api_key:
+                    key_tag = api_key.strip()[-4:]
+                    if strategy_text is not None:
+                        try:
+                            c.execute("UPDATE trades SET notes = ?, strategy = ? WHERE id = ? AND api_key_tag = ?", 
+                                    (note_text, strategy_text, trade_id, key_tag))
+                        except sqlite3.OperationalError:
+                            c.execute("UPDATE trades SET notes = ? WHERE id = ? AND api_key_tag = ?", 
+                                    (note_text, trade_id, key_tag))
+                    else:
                         c.execute("UPDATE trades SET notes = ? WHERE id = ? AND api_key_tag = ?", 
                                 (note_text, trade_id, key_tag))
                 else:
-                    c.execute("UPDATE trades SET notes = ? WHERE id = ? AND api_key_tag = ?", 
-                            (note_text, trade_id, key_tag))
-            else:
-                # 兼容旧逻辑
-                c.execute("UPDATE trades SET notes = ? WHERE id = ?", (note_text, trade_id))
-            conn.commit()
+                    # 兼容旧逻辑
+                    c.execute("UPDATE trades SET notes = ? WHERE id = ?", (note_text, trade_id))
             return True
         except Exception as e:
             return False
-        finally:
-            conn.close()
 
     def add_manual_trade(self, api_key, symbol, direction, pnl, date_str, strategy="", note=""):
         """手动录入交易"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
             key_tag = api_key.strip()[-4:] if api_key else "MANU"
             
@@ -540,50 +868,57 @@ class TradeDataEngine:
             base_id = f"MANUAL_{timestamp_ms}_{str(uuid.uuid4())[:8]}"
             side = "buy" if direction.lower() == "long" else "sell"
             
-            # 1. 开仓记录
-            open_id = f"{base_id}_OPEN"
-            c.execute('''
-                INSERT INTO trades 
-                (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag, strategy, notes, screenshot)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (open_id, timestamp_ms, datetime_iso, symbol, side, 0.0, 1.0, 0.0, 0.0, 'USDT', 0.0, key_tag, strategy, note, None))
+            with self.db.transaction() as conn:
+                c = conn.cursor()
+                # 1. 开仓记录
+                open_id = f"{base_id}_OPEN"
+                c.execute('''
+                    INSERT INTO trades 
+                    (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag, strategy, notes, screenshot)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (open_id, timestamp_ms, datetime_iso, symbol, side, 0.0, 1.0, 0.0, 0.0, 'USDT', 0.0, key_tag, strategy, note, None))
             
-            # 2. 平仓记录
-            close_id = f"{base_id}_CLOSE"
-            close_timestamp_ms = timestamp_ms + 60000 
-            close_datetime_iso = datetime.fromtimestamp(close_timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
-            close_side = "sell" if side == "buy" else "buy"
+                # 2. 平仓记录
+                close_id = f"{base_id}_CLOSE"
+                close_timestamp_ms = timestamp_ms + 60000 
+                close_datetime_iso = datetime.fromtimestamp(close_timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
+                close_side = "sell" if side == "buy" else "buy"
             
-            c.execute('''
-                INSERT INTO trades 
-                (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag, strategy, notes, screenshot)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (close_id, close_timestamp_ms, close_datetime_iso, symbol, close_side, 0.0, 1.0, 0.0, 0.0, 'USDT', float(pnl), key_tag, "", "", None))
+                c.execute('''
+                    INSERT INTO trades 
+                    (id, timestamp, datetime, symbol, side, price, amount, cost, fee, fee_currency, pnl, api_key_tag, strategy, notes, screenshot)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (close_id, close_timestamp_ms, close_datetime_iso, symbol, close_side, 0.0, 1.0, 0.0, 0.0, 'USDT', float(pnl), key_tag, "", "", None))
             
-            conn.commit()
             return True, "✅ 交易已成功录入！"
         except Exception as e:
             return False, f"❌ 录入失败: {str(e)}"
-        finally:
-            conn.close()
     
     def delete_screenshot(self, trade_id, api_key):
+        """
+        删除回合开仓单上的截图
+        v10.0: 开仓单按 ID 前缀用 GLOB 匹配 (区分大小写，原来的 LIKE 不区分)；
+        trade_id 应取自库里的 round_id/id 原值 (如 MANUAL_<ts>_<uuid 小写>)，不要自行改写大小写
+        """
         key_tag = api_key.strip()[-4:]
         base_id = trade_id.replace('_OPEN', '').replace('_CLOSE', '')
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
-            c.execute("SELECT screenshot FROM trades WHERE id LIKE ? AND api_key_tag = ?", (f"{base_id}%_OPEN", key_tag))
-            row = c.fetchone()
-            if not row:
-                c.execute("SELECT screenshot FROM trades WHERE id = ? AND api_key_tag = ?", (base_id, key_tag))
+            with self.db.transaction() as conn:
+                c = conn.cursor()
+                # GLOB 前缀匹配可以走 (id, api_key_tag) 唯一索引 (LIKE 不区分大小写，用不上)
+                open_pattern = f"{_glob_escape(base_id)}*_OPEN"
+                c.execute("SELECT screenshot FROM trades WHERE id GLOB ? AND api_key_tag = ?", (open_pattern, key_tag))
                 row = c.fetchone()
+                if not row:
+                    c.execute("SELECT screenshot FROM trades WHERE id = ? AND api_key_tag = ?", (base_id, key_tag))
+                    row = c.fetchone()
+                
+                filename = row[0] if row and row[0] else None
+                if filename:
+                    c.execute("UPDATE trades SET screenshot = '' WHERE id GLOB ? AND api_key_tag = ?", (open_pattern, key_tag))
+                    c.execute("UPDATE trades SET screenshot = '' WHERE id = ? AND api_key_tag = ?", (base_id, key_tag))
             
-            if row and row[0]:
-                filename = row[0]
-                c.execute("UPDATE trades SET screenshot = '' WHERE id LIKE ? AND api_key_tag = ?", (f"{base_id}%_OPEN", key_tag))
-                c.execute("UPDATE trades SET screenshot = '' WHERE id = ? AND api_key_tag = ?", (base_id, key_tag))
-                conn.commit()
+            if filename:
                 try:
                     upload_dir = os.path.join(os.path.dirname(self.db_path), 'uploads')
                     file_path = os.path.join(upload_dir, filename)
@@ -593,8 +928,6 @@ class TradeDataEngine:
             return False, "未找到截图记录"
         except Exception as e:
             return False, str(e)
-        finally:
-            conn.close()
     
     def save_screenshot(self, uploaded_file, trade_id):
         try:
@@ -613,8 +946,6 @@ class TradeDataEngine:
     
     def update_trade_extended(self, trade_id, api_key, update_data):
         """v3.0 核心更新接口"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
             key_tag = api_key.strip()[-4:] if api_key else ""
             is_manual = str(trade_id).startswith('MANUAL_')
@@ -626,7 +957,10 @@ class TradeDataEngine:
                 'mae', 'mfe', 'etd', 'mad', 'efficiency', 'mae_atr', 'mfe_atr',
                 'rvol', 'pattern_signal'
             ]
-            fields_to_update = {k: v for k, v in update_data.items() if k in allowed_fields}
+            # v10.0: 只更新表里真实存在的列 (mad/efficiency/mae_atr 等扩展指标在未迁移的库里没有对应列，
+            # 完整结果另存在 pa_stats 表中)
+            trade_cols = {row[1] for row in self.db.connection().execute('PRAGMA table_info(trades)').fetchall()}
+            fields_to_update = {k: v for k, v in update_data.items() if k in allowed_fields and k in trade_cols}
             
             if not fields_to_update: return False, "⚠️ 没有有效的数据需要更新"
             
@@ -639,12 +973,18 @@ class TradeDataEngine:
                 
                 set_clause = ", ".join([f"{col} = ?" for col in fields_to_update.keys()])
                 values = list(fields_to_update.values()) + [target_open_id, key_tag]
-                c.execute(f"UPDATE trades SET {set_clause} WHERE id = ? AND api_key_tag = ?", values)
+                with self.db.transaction() as conn:
+                    c = conn.cursor()
+                    c.execute(f"UPDATE trades SET {set_clause} WHERE id = ? AND api_key_tag = ?", values)
+                    
+                    if 'pnl' in fields_to_update:
+                        target_close_id = target_open_id.replace('_OPEN', '_CLOSE')
+                        c.execute("UPDATE trades SET pnl = ? WHERE id = ? AND api_key_tag = ?", 
+                                 (fields_to_update['pnl'], target_close_id, key_tag))
                 
-                if 'pnl' in fields_to_update:
-                    target_close_id = target_open_id.replace('_OPEN', '_CLOSE')
-                    c.execute("UPDATE trades SET pnl = ? WHERE id = ? AND api_key_tag = ?", 
-                             (fields_to_update['pnl'], target_close_id, key_tag))
+                # 改动了成交结构 (币种/方向/时间/盈亏)，回合需要重建
+                if any(k in fields_to_update for k in ['symbol', 'side', 'timestamp', 'pnl']):
+                    self.round_engine.invalidate(key_tag)
             else:
                 safe_update = {k: v for k, v in fields_to_update.items() 
                               if k not in ['symbol', 'side', 'pnl', 'amount', 'fee', 'cost']}
@@ -652,27 +992,60 @@ class TradeDataEngine:
                 
                 set_clause = ", ".join([f"{col} = ?" for col in safe_update.keys()])
                 values = list(safe_update.values()) + [trade_id, key_tag]
-                c.execute(f"UPDATE trades SET {set_clause} WHERE id = ? AND api_key_tag = ?", values)
+                with self.db.transaction() as conn:
+                    conn.execute(f"UPDATE trades SET {set_clause} WHERE id = ? AND api_key_tag = ?", values)
             
-            conn.commit()
             return True, "✅ 复盘数据已保存！"
         except Exception as e:
             return False, f"❌ 更新失败: {str(e)}"
-        finally:
-            conn.close()
 
     def delete_trade(self, trade_id, api_key):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        """
+        删除 ID 以 trade_id 开头的所有成交 (手动交易的 _OPEN/_CLOSE 两条) 及其价格行为统计缓存
+        v10.0: 前缀匹配由 LIKE 改为 GLOB 以走索引，因此区分大小写；trade_id 需与库中 ID 大小写一致
+        """
         try:
             key_tag = api_key.strip()[-4:] if api_key else ""
-            c.execute("DELETE FROM trades WHERE id LIKE ? AND api_key_tag = ?", (f"{trade_id}%", key_tag))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM trades WHERE id GLOB ? AND api_key_tag = ?", (f"{_glob_escape(trade_id)}*", key_tag))
+                conn.execute("DELETE FROM pa_stats WHERE round_id GLOB ? AND api_key_tag = ?", (f"{_glob_escape(trade_id)}*", key_tag))
             return True, "✅ 交易已删除！"
         except Exception as e:
             return False, str(e)
-        finally:
-            conn.close()
+
+    # ===========================
+    #  🔬 价格行为统计缓存 (v10.0)
+    # ===========================
+    def get_pa_stats(self, round_id, api_key, data_version, risk_amount):
+        """读取已缓存的价格行为统计 (标量字典)，没有命中返回 None"""
+        key_tag = api_key.strip()[-4:] if api_key else ""
+        row = self.db.connection().execute('''
+            SELECT stats FROM pa_stats
+            WHERE api_key_tag = ? AND round_id = ? AND data_version = ? AND risk_amount = ?
+        ''', (key_tag, round_id, data_version, float(risk_amount))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_pa_stats(self, round_id, api_key, data_version, risk_amount, stats):
+        """
+        缓存一次价格行为统计的标量结果 (stats 里的 DataFrame 等非标量字段不入库)
+        同一回合旧版本数据 (K 线或交易被修改前) 的结果一并清理
+        """
+        key_tag = api_key.strip()[-4:] if api_key else ""
+        scalars = {}
+        for k, v in stats.items():
+            if isinstance(v, np.generic):
+                v = v.item()
+            if v is None or isinstance(v, (bool, int, float, str)):
+                scalars[k] = v
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM pa_stats WHERE api_key_tag = ? AND round_id = ? AND data_version != ?",
+                         (key_tag, round_id, data_version))
+            conn.execute('''
+                INSERT OR REPLACE INTO pa_stats (api_key_tag, round_id, data_version, risk_amount, stats, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key_tag, round_id, data_version, float(risk_amount), json.dumps(scalars, ensure_ascii=False),
+                  int(time.time() * 1000)))
+        return scalars
 
     # ===========================
     #  🧠 AI 报告管理 (v9.0 增强版)
@@ -680,105 +1053,207 @@ class TradeDataEngine:
     
     def save_ai_report(self, title, report_type, start_date, end_date, trade_count, total_pnl, win_rate, ai_feedback, api_key):
         """保存 AI 生成的阶段性报告"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         try:
             key_tag = api_key.strip()[-4:] if api_key else "MANU"
             created_at = int(datetime.now().timestamp() * 1000)
             
-            c.execute('''
-                INSERT INTO ai_reports 
-                (title, report_type, start_date, end_date, trade_count, total_pnl, win_rate, ai_feedback, created_at, api_key_tag)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (title, report_type, start_date, end_date, trade_count, total_pnl, win_rate, ai_feedback, created_at, key_tag))
+            with self.db.transaction() as conn:
+                conn.execute('''
+                    INSERT INTO ai_reports 
+                    (title, report_type, start_date, end_date, trade_count, total_pnl, win_rate, ai_feedback, created_at, api_key_tag)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (title, report_type, start_date, end_date, trade_count, total_pnl, win_rate, ai_feedback, created_at, key_tag))
             
-            conn.commit()
             return True, "✅ 报告已归档"
         except Exception as e:
             import traceback
             traceback.print_exc()
             return False, f"保存失败: {str(e)}"
-        finally:
-            conn.close()
     
     def get_ai_reports(self, api_key, limit=20):
         """获取历史分析报告"""
-        conn = sqlite3.connect(self.db_path)
         key_tag = api_key.strip()[-4:] if api_key else "MANU"
         try:
             df = pd.read_sql_query(
                 "SELECT * FROM ai_reports WHERE api_key_tag = ? ORDER BY created_at DESC LIMIT ?", 
-                conn, params=(key_tag, limit)
+                self.db.connection(), params=(key_tag, limit)
             )
         except:
             df = pd.DataFrame()
-        conn.close()
         return df
 
     def delete_ai_report(self, report_id, api_key):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         key_tag = api_key.strip()[-4:] if api_key else "MANU"
         try:
-            c.execute("DELETE FROM ai_reports WHERE id = ? AND api_key_tag = ?", (report_id, key_tag))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM ai_reports WHERE id = ? AND api_key_tag = ?", (report_id, key_tag))
             return True, "🗑️ 报告已删除"
         except Exception as e:
             return False, f"删除失败: {str(e)}"
-        finally:
-            conn.close()
             
     # ===========================
     #  ⚙️ 系统配置管理
     # ===========================
     def get_setting(self, key, default_value=""):
-        conn = sqlite3.connect(self.db_path)
         try:
-            c = conn.cursor()
+            c = self.db.connection().cursor()
             c.execute("SELECT value FROM system_settings WHERE key = ?", (key,))
             result = c.fetchone()
             return result[0] if result else default_value
         except: return default_value
-        finally: conn.close()
     
     def set_setting(self, key, value):
-        conn = sqlite3.connect(self.db_path)
         try:
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO system_settings (key, value) VALUES (?, ?)", (key, str(value)))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute("INSERT OR REPLACE INTO system_settings (key, value) VALUES (?, ?)", (key, str(value)))
             return True
         except: return False
-        finally: conn.close()
     
     # ===========================
     #  📚 策略库管理
     # ===========================
     def get_all_strategies(self):
-        conn = sqlite3.connect(self.db_path)
         try:
-            df = pd.read_sql_query("SELECT * FROM strategies", conn)
+            df = pd.read_sql_query("SELECT * FROM strategies", self.db.connection())
             if not df.empty: return dict(zip(df['name'], df['description']))
             return {}
         except: return {}
-        finally: conn.close()
     
     def save_strategy(self, name, description):
-        conn = sqlite3.connect(self.db_path)
         try:
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO strategies (name, description) VALUES (?, ?)", (name, description))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute("INSERT OR REPLACE INTO strategies (name, description) VALUES (?, ?)", (name, description))
             return True, "✅ 策略已保存"
         except Exception as e: return False, str(e)
-        finally: conn.close()
     
     def delete_strategy(self, name):
-        conn = sqlite3.connect(self.db_path)
         try:
-            c = conn.cursor()
-            c.execute("DELETE FROM strategies WHERE name = ?", (name,))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM strategies WHERE name = ?", (name,))
             return True, "🗑️ 策略已删除"
         except Exception as e: return False, str(e)
-        finally: conn.close()
\ No newline at end of file
+
+
+class _StubFundingExchange:
+    """
+    自检用的假交易所：只实现同步流程用到的几个 ccxt 方法
+    资金费流水按 Binance income 接口的语义返回 ([startTime, endTime] 内按时间升序，最多 limit 条)
+    """
+
+    def __init__(self, incomes, now_ts, fail_funding=False, markets=None, fail_symbols=()):
+        self.incomes = sorted(incomes, key=lambda inc: (inc['timestamp'], inc['id']))
+        self.now_ts = now_ts
+        self.fail_funding = fail_funding
+        self.markets = markets or {}
+        self.fail_symbols = set(fail_symbols)
+        self.funding_calls = 0
+
+    def milliseconds(self):
+        return self.now_ts
+
+    def load_markets(self):
+        return self.markets
+
+    def set_markets_from_exchange(self, other):
+        pass
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None, params={}):
+        if symbol in self.fail_symbols:
+            raise ccxt.NetworkError(f"stub: {symbol} timed out")
+        return []
+
+    def fetch_funding_history(self, symbol=None, since=None, limit=None, params={}):
+        self.funding_calls += 1
+        if self.fail_funding:
+            raise ccxt.AuthenticationError("stub: invalid api key")
+        end = params.get('endTime', self.now_ts)
+        page = [inc for inc in self.incomes if since <= inc['timestamp'] <= end]
+        return page[:limit]
+
+
+def _check_funding_sweep(tmp_dir):
+    """资金费账户级扫描自检：分页 (含同毫秒翻页边界)、按币种拆分、失败时写进同步结果"""
+    day = 24 * 60 * 60 * 1000
+    now_ts = int(time.time() * 1000)
+    since_ts = now_ts - 365 * day
+    rng = np.random.default_rng(9)
+    symbols = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDC:USDC']
+    incomes = []
+    for i, ts in enumerate(np.sort(rng.integers(since_ts, now_ts, 2600))):
+        incomes.append({'id': str(10_000 + i), 'timestamp': int(ts), 'datetime': '',
+                        'symbol': symbols[i % 3], 'amount': round(float(rng.normal(0, 1)), 6)})
+    # 让一页的最后一条与下一页第一条落在同一毫秒
+    incomes[999]['timestamp'] = incomes[1000]['timestamp'] = incomes[998]['timestamp']
+    
+    engine = TradeDataEngine(os.path.join(tmp_dir, 'funding_check.db'))
+    stub = _StubFundingExchange(incomes, now_ts)
+    by_symbol = engine.fetch_funding_sweep(stub, since_ts, now_ts)
+    got = sorted(t['id'] for items in by_symbol.values() for t in items)
+    assert got == sorted(f"FUND_{inc['id']}" for inc in incomes), "资金费扫描遗漏或重复"
+    assert all(t['symbol'] == sym for sym, items in by_symbol.items() for t in items)
+    only_btc = engine.fetch_funding_sweep(stub, since_ts, now_ts, symbols=['BTC/USDT'])
+    assert list(only_btc) == ['BTC/USDT:USDT']
+    
+    # 完整同步流程：资金费落库、水位推进；扫描失败时结果里要带上失败信息
+    engine.get_exchange = lambda api_key, secret: stub
+    msg, count = engine.fetch_and_save('test-key-abcd', 'secret', 'recent')
+    stored = engine.db.connection().execute("SELECT COUNT(*) FROM trades WHERE id GLOB 'FUND_*'").fetchone()[0]
+    assert count > 0 and count == stored, msg
+    assert engine.get_sync_states('abcd')[('*', 'funding')]['last_ts'] == now_ts
+    engine.get_exchange = lambda api_key, secret: _StubFundingExchange(incomes, now_ts, fail_funding=True)
+    msg, count = engine.fetch_and_save('test-key-abcd', 'secret', 'recent')
+    assert count == 0 and "资金费扫描" in msg and not msg.startswith("✅"), msg
+    engine.db.close_all()
+    print(f"✅ 资金费扫描: {len(got)} 条 / {stub.funding_calls} 次请求 | 失败提示: {msg}")
+
+
+def _check_sync_failures(tmp_dir):
+    """快速同步自检：线程客户端创建失败、单个币种抓取失败都要写进返回信息，不能当作未发现新数据"""
+    markets = {s: {'contract': True, 'base': s.split('/')[0]} for s in ['BTC/USDT:USDT', 'ETH/USDT:USDT']}
+    engine = TradeDataEngine(os.path.join(tmp_dir, 'sync_check.db'))
+    stub = _StubFundingExchange([], int(time.time() * 1000), markets=markets)
+    # 主实例正常，线程实例全部创建失败 (get_exchange 返回 None)
+    clients = iter([stub])
+    engine.get_exchange = lambda api_key, secret: next(clients, None)
+    msg, _ = engine.fetch_and_save('test-key-abcd', 'secret', 'recent')
+    assert "部分失败" in msg and "BTC/USDT:USDT" in msg and "ETH/USDT:USDT" in msg, msg
+    # 单个币种网络错误：只有它被报告，也不推进它的水位
+    stub = _StubFundingExchange([], int(time.time() * 1000), markets=markets, fail_symbols=['ETH/USDT:USDT'])
+    engine.get_exchange = lambda api_key, secret: stub
+    msg, _ = engine.fetch_and_save('test-key-abcd', 'secret', 'recent')
+    states = engine.get_sync_states('abcd')
+    assert "ETH/USDT:USDT" in msg and "BTC/USDT:USDT" not in msg, msg
+    assert ('BTC/USDT:USDT', 'trades') in states and ('ETH/USDT:USDT', 'trades') not in states
+    engine.db.close_all()
+    print(f"✅ 同步失败提示: {msg}")
+
+
+# 查询计划回归检查 + 同步流程自检：python data_engine.py
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    
+    from data_processor import _make_synthetic_fills
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = TradeDataEngine(os.path.join(tmp_dir, 'plan_check.db'))
+        # 灌入几个账户的模拟成交，让规划器基于真实分布选择索引
+        fills = _make_synthetic_fills(20000)
+        fills['datetime'] = ''
+        fills['price'] = fills['cost'] = 1.0
+        fills['fee'] = None
+        fills['info'] = [{'realizedPnl': pnl} for pnl in fills['pnl']]
+        for key_tag in ['aaaa', 'abcd', 'zzzz']:
+            engine._save_to_db(fills.to_dict('records'), key_tag)
+            engine.round_engine.sync(key_tag)
+        engine.db.connection().execute("PRAGMA optimize")
+        
+        problems = engine.check_query_plans()
+        for name, sql, params in HOT_QUERIES:
+            plan = [row[3] for row in engine.db.connection().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            flag = "❌" if name in problems else "✅"
+            print(f"{flag} {name}: {' | '.join(plan)}")
+        engine.db.close_all()
+        _check_funding_sweep(tmp_dir)
+        _check_sync_failures(tmp_dir)
+    sys.exit(1 if problems else 0)
@@ -1,15 +1,128 @@
+import hashlib
 import pandas as pd
 import numpy as np
-import pandas_ta as ta  # 👈 必须要有这个库
+from candle_patterns import PATTERN_COLUMNS, detect_patterns
+from swing_engine import TREND_LABELS, classify_structure, find_swings
 
-def process_trades_to_rounds(df):
+# 回合中透传自开仓单的价格行为指标 (缺失时输出 None)
+ROUND_METRIC_COLS = ['mae', 'mfe', 'etd', 'mad', 'efficiency', 'rvol']
+
+# 透传自开仓单的复盘标签
+ROUND_META_COLS = ['notes', 'strategy', 'ai_analysis', 'screenshot',
+                   'process_tag', 'mental_state', 'setup_rating', 'mistake_tags', 'rr_ratio']
+
+# 数量按 1e-8 精度整数化后再累加，避免浮点累计误差；阈值等价于逐行版的 0.0000001
+QTY_SCALE = 100000000
+QTY_EPSILON_UNITS = 10
+# 按回合累加盈亏时，活跃回合少于这个数就改为逐段累加 (见 _segment_sums)
+SEGMENT_TAIL_ROUNDS = 8
+
+def process_trades_to_rounds(df, engine='vectorized'):
     """
-    v7.1 核心算法：高性能交易回合生成引擎 (修复字段透传缺失问题)
+    v10.0 核心算法：向量化交易回合生成引擎
+    回合边界 = 每个币种带符号累计持仓回到 0 的位置，用 groupby().cumsum() 一次算出，
+    再按回合从左到右累加盈亏和手续费 (见 _segment_sums)，输出列与逐行版完全一致
+    :param engine: 'vectorized' (默认) 或 'loop' (逐行参考实现，用于对照)
     """
+    if engine == 'loop':
+        return _process_trades_to_rounds_loop(df)
     if df is None or df.empty:
         return pd.DataFrame()
     
-    # 1. 向量化预处理
+    df = _prepare_fills(df)
+    # 与 groupby('symbol') 的遍历顺序一致：币种升序，组内保持时间顺序
+    df = df[df['symbol'].notna()]
+    df = df.sort_values(by='symbol', kind='mergesort').reset_index(drop=True)
+    n = len(df)
+    if n == 0:
+        return pd.DataFrame()
+    
+    # 1. 带符号数量 -> 每个币种的累计持仓
+    is_buy = (df['side'].astype(str).str.lower() == 'buy').to_numpy()
+    amount = df['amount'].astype(float).to_numpy()
+    signed_units = np.rint(np.where(is_buy, amount, -amount) * QTY_SCALE).astype(np.int64)
+    position = pd.Series(signed_units).groupby(df['symbol'].to_numpy(), sort=False).cumsum().to_numpy()
+    position_before = position - signed_units
+    
+    # 2. 回合切分：成交前持仓为 0 的那一笔就是开仓单 (开仓单本身不会触发平仓)
+    starts = np.flatnonzero(np.abs(position_before) < QTY_EPSILON_UNITS)
+    ends = np.append(starts[1:] - 1, n - 1)
+    closed = (ends > starts) & (np.abs(position[ends]) < QTY_EPSILON_UNITS)
+    if not closed.any():
+        return pd.DataFrame()
+    
+    # 3. 按回合聚合
+    open_idx = starts[closed]
+    close_idx = ends[closed]
+    pnl_sum = _segment_sums(df['pnl'].astype(float).to_numpy(), open_idx, close_idx)
+    fee_sum = _segment_sums(df['fee'].astype(float).to_numpy(), open_idx, close_idx)
+    timestamps = df['timestamp'].to_numpy()
+    start_time = timestamps[open_idx]
+    end_time = timestamps[close_idx]
+    duration_minutes = (end_time - start_time) / 1000 / 60
+    
+    opens = df.iloc[open_idx].reset_index(drop=True)
+    results_df = pd.DataFrame({
+        'round_id': opens['id'].astype(str),
+        'symbol': opens['symbol'],
+        'direction': np.where(is_buy[open_idx], '做多 (Long)', '做空 (Short)'),
+        'open_time': start_time,
+        'close_time': end_time,
+        'open_date_str': format_timestamp_ms(start_time),
+        'close_date_str': format_timestamp_ms(end_time),
+        'duration_min': round_vec(duration_minutes, 1),
+        'duration_str': format_duration_vec(duration_minutes),
+        'total_pnl': round_vec(pnl_sum, 2),
+        'total_fee': round_vec(fee_sum, 2),
+        'net_pnl': round_vec(pnl_sum - fee_sum, 2),
+        'trade_count': close_idx - open_idx + 1,
+        'status': 'Closed',
+    })
+    for col in ROUND_META_COLS:
+        results_df[col] = opens[col]
+    for col in ROUND_METRIC_COLS:
+        results_df[col] = opens[col].astype(float) if opens[col].notna().any() else None
+    results_df['pattern_signal'] = opens['pattern_signal']
+    
+    # 列顺序与逐行版保持一致
+    results_df = results_df[[
+        'round_id', 'symbol', 'direction', 'open_time', 'close_time', 'open_date_str', 'close_date_str',
+        'duration_min', 'duration_str', 'total_pnl', 'total_fee', 'net_pnl', 'trade_count', 'status',
+        'notes', 'strategy', 'ai_analysis', 'screenshot',
+        'process_tag', 'mental_state', 'setup_rating', 'mistake_tags', 'rr_ratio',
+        'mae', 'mfe', 'etd', 'mad', 'efficiency', 'rvol', 'pattern_signal'
+    ]]
+    return results_df.sort_values(by='close_time', ascending=False)
+
+def _segment_sums(values, starts, ends):
+    """
+    每段 values[start..end] 严格按从左到右的顺序累加 (与逐行版 current += x 的加法顺序一致)
+    np.add.reduceat 段内用成对求和，末位误差会让少数回合在 round(.., 2) 之后差 1 分
+    做法：回合按长度降序排列，第 k 轮给所有长度 > k 的回合加上各自的第 k 笔 (活跃回合总是前缀)；
+    只剩少数超长回合时改为逐段 np.add.accumulate (同样是顺序累加)，避免 Python 循环次数随最长回合增长
+    """
+    lengths = ends - starts + 1
+    order = np.argsort(-lengths, kind='stable')
+    seg_starts = starts[order]
+    seg_lengths = lengths[order]
+    # active[k] = 长度 > k 的回合数
+    active = len(lengths) - np.searchsorted(np.sort(lengths), np.arange(seg_lengths[0]), side='right')
+    acc = np.zeros(len(lengths))
+    k = 0
+    while k < len(active) and active[k] > SEGMENT_TAIL_ROUNDS:
+        m = active[k]
+        acc[:m] += values[seg_starts[:m] + k]
+        k += 1
+    if k < len(active):
+        for i in range(active[k]):
+            tail = values[seg_starts[i] + k: seg_starts[i] + seg_lengths[i]]
+            acc[i] = np.add.accumulate(np.concatenate(([acc[i]], tail)))[-1]
+    out = np.empty_like(acc)
+    out[order] = acc
+    return out
+
+def _prepare_fills(df):
+    """成交预处理：按时间排序并填充缺失字段 (两种引擎共用)"""
     df = df.sort_values(by='timestamp', ascending=True).reset_index(drop=True)
     
     # 填充缺失值 (包含 v3.0/v7.0/v8.0 所有关键字段)
@@ -29,6 +142,16 @@ def process_trades_to_rounds(df):
             df[col] = val
         else:
             df[col] = df[col].fillna(val)
+    return df
+
+def _process_trades_to_rounds_loop(df):
+    """
+    v7.1 核心算法：交易回合生成引擎 (逐行参考实现，修复字段透传缺失问题)
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+    
+    df = _prepare_fills(df)
             
     rounds = []
     grouped = df.groupby('symbol')
@@ -158,6 +281,69 @@ def format_duration(minutes):
     else:
         return f"{int(minutes/1440)}天{int((minutes%1440)/60)}小时"
 
+def format_duration_vec(minutes):
+    """format_duration 的向量化版本 (一次处理整列，输出完全相同)"""
+    m = np.asarray(minutes, dtype=float)
+    def as_str(values):
+        return pd.Series(np.trunc(values).astype(np.int64)).astype(str).to_numpy(dtype=object)
+    short = as_str(m) + "分"
+    medium = as_str(m / 60) + "小时" + as_str(m % 60) + "分"
+    long = as_str(m / 1440) + "天" + as_str((m % 1440) / 60) + "小时"
+    return np.where(m < 60, short, np.where(m < 1440, medium, long))
+
+def round_vec(values, ndigits):
+    """
+    与内置 round 结果逐位一致的向量化版本
+    np.round 在 .5 边界上与 round 不同，只对这些边界值回退到内置 round
+    """
+    x = np.array(values, dtype=float)
+    out = np.round(x, ndigits)
+    frac = np.abs(x * (10.0 ** ndigits)) % 1.0
+    ties = np.flatnonzero(np.abs(frac - 0.5) < 1e-6)
+    if len(ties):
+        out[ties] = [round(float(v), ndigits) for v in x[ties]]
+    return out
+
+def format_timestamp_ms(ts_ms):
+    """毫秒时间戳整列格式化为 'YYYY-mm-dd HH:MM' (等价于逐个 strftime，但走 NumPy 的 C 实现)"""
+    minutes = np.asarray(ts_ms, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[m]')
+    text = np.datetime_as_string(minutes, unit='m')  # 'YYYY-mm-ddTHH:MM'
+    if len(text):
+        text.view('<U1').reshape(len(text), -1)[:, 10] = ' '
+    return text.astype(object)
+
+# 形态列 -> 信号名 (入场前 3 根 K 线内出现即记录，按此顺序输出)
+PATTERN_NAMES = {
+    'CDL_ENGULFING': "吞没", 'CDL_HAMMER': "锤子", 'CDL_DOJI': "十字星",
+    'CDL_STAR': "星", 'CDL_SHOOTINGSTAR': "流星"
+}
+
+# v10.0: 价格行为统计的算法版本 (计算逻辑改动时 +1，已缓存的旧结果随之失效)
+PA_STATS_VERSION = 2
+
+# v10.0: 窗口前需要的最少预热 K 线数 (RVOL 20 根均量需要前 19 根；ATR 14 根 13 根；形态最长回看 12 根)
+PA_WARMUP_BARS = 19
+
+def pa_data_version(candles_df, trade_direction, entry_price, amount):
+    """
+    价格行为统计的输入指纹 (pa_stats 缓存键的一部分)
+    覆盖 K 线窗口内容 (补数据/修正 K 线后自动变化) 与开仓价/数量/方向 (编辑交易后自动变化)
+    """
+    ohlcv = candles_df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+    digest = hashlib.blake2b(np.ascontiguousarray(ohlcv).tobytes(), digest_size=16)
+    digest.update(f"{PA_STATS_VERSION}|{trade_direction}|{float(entry_price)!r}|{float(amount)!r}".encode())
+    return digest.hexdigest()
+
+def _rolling_mean(values, window):
+    """
+    滑动均值：一次累加求出全部窗口和 (O(n))，前 window-1 个位置为 NaN (与 pandas rolling(window).mean() 一致)
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
 def calc_price_action_stats(candles_df, trade_direction, entry_price, exit_price, open_ts, close_ts, amount, risk_amount):
     """
     v8.5 深度价格行为分析 (修复版 + 趋势结构增强)
@@ -165,77 +351,65 @@ def calc_price_action_stats(candles_df, trade_direction, entry_price, exit_price
     if candles_df is None or candles_df.empty:
         return None
     
-    # === 🛡️ 保险箱 1: 基础指标 (ATR & RVOL) - 纯 Pandas 稳定版 ===
+    # 0. 定位持仓窗口 (v10.0: 先定位窗口，指标只在 窗口 + 最小预热 上计算，不改动也不复制窗口外的 K 线)
+    lookback_bars = 60
+    lookback_ms = lookback_bars * 60 * 1000
+    ts = candles_df['timestamp'].to_numpy()
+    win_lo = int(np.searchsorted(ts, open_ts - lookback_ms, side='left'))
+    win_hi = int(np.searchsorted(ts, close_ts + (5*60*1000), side='right'))
+    if win_hi <= win_lo:
+        return None
+    # 预热够 PA_WARMUP_BARS 根时窗口内每根的指标都与整段计算相同；不够时从头算，
+    # 并且至少算到第一个有效 ATR (窗口很靠前时 ATR 用它回填，与原来整列 bfill 的结果一致)
+    calc_lo = max(0, win_lo - PA_WARMUP_BARS)
+    calc_hi = win_hi if calc_lo > 0 else max(win_hi, min(len(candles_df), 14))
+    work = candles_df.iloc[calc_lo:calc_hi]
+    high = work['high'].to_numpy(dtype=np.float64)
+    low = work['low'].to_numpy(dtype=np.float64)
+    close = work['close'].to_numpy(dtype=np.float64)
+    volume = work['volume'].to_numpy(dtype=np.float64)
+    
+    # === 🛡️ 保险箱 1: 基础指标 (ATR & RVOL) - 滚动窗口版 ===
     try:
         # 1. 计算 ATR (平均真实波幅) - 不依赖 ta-lib，防止报错
-        # TR = Max(High-Low, abs(High-PrevClose), abs(Low-PrevClose))
-        high = candles_df['high']
-        low = candles_df['low']
-        close = candles_df['close']
-        prev_close = close.shift(1)
-        
-        tr1 = high - low
-        tr2 = (high - prev_close).abs()
-        tr3 = (low - prev_close).abs()
-        
-        # 选取三者中的最大值作为 TR
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        # ATR = TR 的 14 周期移动平均
-        candles_df['atr'] = tr.rolling(window=14).mean()
-        
-        # 2. 计算 RVOL (相对成交量)
-        # 处理分母为 0 的情况，避免报错
-        vol_ma = candles_df['volume'].rolling(window=20).mean()
-        vol_ma = vol_ma.replace(0, np.nan) 
+        # TR = Max(High-Low, abs(High-PrevClose), abs(Low-PrevClose))，第一根没有前收盘，取 High-Low
+        tr = high - low
+        if len(tr) > 1:
+            prev_close = close[:-1]
+            tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)))
+        # ATR = TR 的 14 周期移动平均，计算初期的 NaN 用第一个有效值回填
+        atr = _rolling_mean(tr, 14)
+        valid = np.flatnonzero(~np.isnan(atr))
+        if len(valid):
+            atr[:valid[0]] = atr[valid[0]]
         
-        candles_df['rvol'] = candles_df['volume'] / vol_ma
-        
-        # 填补计算初期的 NaN
-        candles_df['atr'] = candles_df['atr'].bfill()
-        candles_df['rvol'] = candles_df['rvol'].fillna(1.0)
+        # 2. 计算 RVOL (相对成交量)，均量为 0 或计算初期记为 1.0
+        vol_ma = _rolling_mean(volume, 20)
+        vol_ma[vol_ma == 0] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rvol = volume / vol_ma
+        rvol[np.isnan(rvol)] = 1.0
         
     except Exception as e:
         print(f"⚠️ 基础指标计算严重失败: {e}")
-        candles_df['atr'] = entry_price * 0.01 
-        candles_df['rvol'] = 1.0
+        atr = np.full(len(work), entry_price * 0.01)
+        rvol = np.full(len(work), 1.0)
     
     # === 🛡️ 保险箱 2: K线形态 (Pattern) ===
-    # 修复逻辑：不依赖固定列名，直接取返回结果的第一列
-    pattern_cols = ['CDL_ENGULFING', 'CDL_HAMMER', 'CDL_DOJI', 'CDL_STAR', 'CDL_SHOOTINGSTAR']
-    for col in pattern_cols:
-        candles_df[col] = 0 
+    # v10.0: 单遍识别全部形态 (原来对 pandas_ta.cdl_pattern 调用 6 次，每次整列扫描一遍)
+    patterns = {col: np.zeros(len(work), dtype=np.int64) for col in PATTERN_COLUMNS}
     try:
-        # 1. 吞没 (Engulfing)
-        res = candles_df.ta.cdl_pattern(name="engulfing")
-        if res is not None and not res.empty: candles_df['CDL_ENGULFING'] = res.iloc[:, 0]
-        
-        # 2. 锤子 (Hammer)
-        res = candles_df.ta.cdl_pattern(name="hammer")
-        if res is not None and not res.empty: candles_df['CDL_HAMMER'] = res.iloc[:, 0]
-        
-        # 3. 十字星 (Doji)
-        res = candles_df.ta.cdl_pattern(name="doji")
-        if res is not None and not res.empty: candles_df['CDL_DOJI'] = res.iloc[:, 0]
-        
-        # 4. 启明/黄昏星 (Star)
-        res_m = candles_df.ta.cdl_pattern(name="morningstar")
-        res_e = candles_df.ta.cdl_pattern(name="eveningstar")
-        star_val = 0
-        if res_m is not None and not res_m.empty: star_val += res_m.iloc[:, 0]
-        if res_e is not None and not res_e.empty: star_val += res_e.iloc[:, 0]
-        candles_df['CDL_STAR'] = star_val
-        
-        # 5. 流星线 (Shooting Star)
-        res = candles_df.ta.cdl_pattern(name="shootingstar")
-        if res is not None and not res.empty: candles_df['CDL_SHOOTINGSTAR'] = res.iloc[:, 0]
+        patterns = detect_patterns(work['open'], high, low, close)
     except Exception as e:
         print(f"⚠️ 形态识别部分失败 (非致命): {e}")
     
-    # 3. 截取持仓期间
-    lookback_bars = 60
-    lookback_ms = lookback_bars * 60 * 1000 
-    trade_mask = (candles_df['timestamp'] >= open_ts - lookback_ms) & (candles_df['timestamp'] <= close_ts + (5*60*1000))
-    period_df = candles_df.loc[trade_mask].copy()
+    # 只有窗口内的行会复制出来，指标列按窗口偏移切片后挂上
+    window = slice(win_lo - calc_lo, win_hi - calc_lo)
+    period_df = work.iloc[window].copy()
+    period_df['atr'] = atr[window]
+    period_df['rvol'] = rvol[window]
+    for col in PATTERN_COLUMNS:
+        period_df[col] = patterns[col][window]
     
     if period_df.empty:
         return None
@@ -248,51 +422,31 @@ def calc_price_action_stats(candles_df, trade_direction, entry_price, exit_price
     nearest_sup = None
     
     try:
-        # 1. 识别分形高低点 (Fractals)
-        window = 5 
-        # 滚动窗口判断是否为局部极值
-        period_df['is_high'] = period_df['high'].rolling(window*2+1, center=True).max() == period_df['high']
-        period_df['is_low'] = period_df['low'].rolling(window*2+1, center=True).min() == period_df['low']
+        # 1. 识别分形高低点 (Fractals) - v10.0: 单遍流式摆动点识别 (swing_engine)
+        tracker = find_swings(period_df['high'].to_numpy(), period_df['low'].to_numpy(),
+                              period_df['timestamp'].to_numpy())
+        period_df['is_high'] = tracker.flags('high')
+        period_df['is_low'] = tracker.flags('low')
         
-        # 只看入场前的数据来判断结构
-        pre_entry_df = period_df[period_df['timestamp'] < open_ts]
+        # 只看入场前的摆动点来判断结构，获取最近的 3 个高点和 3 个低点
+        last_highs = tracker.last('high', 3, before_ts=open_ts)
+        last_lows = tracker.last('low', 3, before_ts=open_ts)
         
-        if not pre_entry_df.empty:
-            # 获取最近的 3 个高点和 3 个低点
-            last_highs = pre_entry_df[pre_entry_df['is_high']]['high'].tail(3).tolist()
-            last_lows = pre_entry_df[pre_entry_df['is_low']]['low'].tail(3).tolist()
-            
-            # --- A. 支撑阻力判断 ---
-            nearest_res = min([r for r in last_highs if r > entry_price], default=None)
-            nearest_sup = max([s for s in last_lows if s < entry_price], default=None)
-            
-            dist_to_res = (nearest_res - entry_price) / entry_price * 100 if nearest_res else 999
-            dist_to_sup = (entry_price - nearest_sup) / entry_price * 100 if nearest_sup else 999
-            
-            if nearest_res and dist_to_res < 0.5:
-                structure_info = f"⚠️ 逼近阻力位 ({nearest_res:.2f})"
-            elif nearest_sup and dist_to_sup < 0.5:
-                structure_info = f"✅ 踩在支撑位 ({nearest_sup:.2f})"
-            elif nearest_res and nearest_sup:
-                structure_info = "⇕ 区间震荡中"
-            # --- B. 趋势结构判断 (新增逻辑) ---
-            # 判断 HH/HL (Higher High, Higher Low)
-            if len(last_highs) >= 2 and len(last_lows) >= 2:
-                curr_h, prev_h = last_highs[-1], last_highs[-2]
-                curr_l, prev_l = last_lows[-1], last_lows[-2]
-                
-                # 上升结构
-                if curr_h > prev_h and curr_l > prev_l:
-                    trend_info = "📈 上升结构 (HH+HL)"
-                # 下降结构
-                elif curr_h < prev_h and curr_l < prev_l:
-                    trend_info = "📉 下降结构 (LH+LL)"
-                # 扩张/喇叭口
-                elif curr_h > prev_h and curr_l < prev_l:
-                    trend_info = "📣 扩张结构 (HH+LL)"
-                # 收敛/三角
-                elif curr_h < prev_h and curr_l > prev_l:
-                    trend_info = "📐 收敛结构 (LH+HL)"
+        # --- A. 支撑阻力判断 ---
+        nearest_res = min([r for r in last_highs if r > entry_price], default=None)
+        nearest_sup = max([s for s in last_lows if s < entry_price], default=None)
+        
+        dist_to_res = (nearest_res - entry_price) / entry_price * 100 if nearest_res else 999
+        dist_to_sup = (entry_price - nearest_sup) / entry_price * 100 if nearest_sup else 999
+        
+        if nearest_res and dist_to_res < 0.5:
+            structure_info = f"⚠️ 逼近阻力位 ({nearest_res:.2f})"
+        elif nearest_sup and dist_to_sup < 0.5:
+            structure_info = f"✅ 踩在支撑位 ({nearest_sup:.2f})"
+        elif nearest_res and nearest_sup:
+            structure_info = "⇕ 区间震荡中"
+        # --- B. 趋势结构判断 (HH/HL) ---
+        trend_info = TREND_LABELS.get(classify_structure(last_highs, last_lows), trend_info)
                     
     except Exception as e:
         print(f"⚠️ 结构分析失败: {e}")
@@ -301,19 +455,16 @@ def calc_price_action_stats(candles_df, trade_direction, entry_price, exit_price
     pattern_signal_str = "无显著形态"
     try:
         # 只扫描入场前3根K线内的信号
-        target_indices = period_df[period_df['timestamp'] >= open_ts].index
-        if len(target_indices) > 0:
-            entry_idx_loc = period_df.index.get_indexer([target_indices[0]])[0]
-            scan_range = period_df.iloc[max(0, entry_idx_loc-3) : entry_idx_loc+1]
-            patterns_found = set()
-            for idx, row in scan_range.iterrows():
-                if row.get('CDL_ENGULFING', 0) != 0: patterns_found.add("吞没")
-                if row.get('CDL_HAMMER', 0) != 0: patterns_found.add("锤子")
-                if row.get('CDL_DOJI', 0) != 0: patterns_found.add("十字星")
-                if row.get('CDL_STAR', 0) != 0: patterns_found.add("星")
-                if row.get('CDL_SHOOTINGSTAR', 0) != 0: patterns_found.add("流星")
+        period_ts = period_df['timestamp'].to_numpy()
+        entry_idx_loc = int(np.searchsorted(period_ts, open_ts, side='left'))
+        if entry_idx_loc < len(period_ts):
+            lo = max(0, entry_idx_loc - 3)
+            patterns_found = [
+                name for col, name in PATTERN_NAMES.items()
+                if (period_df[col].to_numpy()[lo:entry_idx_loc + 1] != 0).any()
+            ]
             if patterns_found:
-                pattern_signal_str = ",".join(list(patterns_found))
+                pattern_signal_str = ",".join(patterns_found)
     except:
         pass
     
@@ -377,3 +528,60 @@ def calc_price_action_stats(candles_df, trade_direction, entry_price, exit_price
         "Support": nearest_sup,
         "High": period_high, "Low": period_low, "Charts": period_df
     }
+
+# ==============================================================================
+# 自检：向量化回合引擎 vs 逐行参考实现 (等价性 + 性能基准)
+#   python data_processor.py [成交笔数，默认 1000000]
+# ==============================================================================
+def _make_synthetic_fills(n_fills, n_symbols=50, seed=42):
+    """生成模拟成交：每个回合 1~4 笔开/加仓 + 1~3 笔平仓，夹杂资金费记录"""
+    rng = np.random.default_rng(seed)
+    symbols = [f"COIN{i}/USDT:USDT" for i in range(n_symbols)]
+    rows_sym, rows_side, rows_amt = [], [], []
+    total = 0
+    while total < n_fills:
+        sym = symbols[rng.integers(n_symbols)]
+        open_side, close_side = ('buy', 'sell') if rng.random() < 0.5 else ('sell', 'buy')
+        legs_in = rng.integers(1, 5)
+        lots = rng.integers(1, 1000, size=legs_in) / 1000
+        legs_out = np.array_split(np.full(int(round(lots.sum() * 1000)), 0.001), rng.integers(1, 4))
+        for lot in lots:
+            rows_sym.append(sym); rows_side.append(open_side); rows_amt.append(lot)
+        if rng.random() < 0.3:
+            rows_sym.append(sym); rows_side.append('FUNDING'); rows_amt.append(0.0)
+        for leg in legs_out:
+            if len(leg):
+                rows_sym.append(sym); rows_side.append(close_side); rows_amt.append(round(leg.sum(), 3))
+        total = len(rows_sym)
+    n = len(rows_sym)
+    return pd.DataFrame({
+        'id': [f"T{i}" for i in range(n)],
+        'timestamp': 1_600_000_000_000 + np.arange(n, dtype=np.int64) * 1000,
+        'symbol': rows_sym,
+        'side': rows_side,
+        'amount': rows_amt,
+        'pnl': np.round(rng.normal(0, 5, size=n), 4),
+        'fee': np.round(rng.random(n) * 0.1, 4),
+    })
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    n_fills = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    fills = _make_synthetic_fills(n_fills)
+    print(f"生成模拟成交: {len(fills):,} 笔")
+
+    t0 = time.perf_counter()
+    fast = process_trades_to_rounds(fills)
+    t_fast = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    slow = process_trades_to_rounds(fills, engine='loop')
+    t_slow = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(
+        fast.reset_index(drop=True), slow.reset_index(drop=True),
+        check_dtype=False, check_exact=True
+    )
+    print(f"✅ 等价性校验通过: {len(fast):,} 个回合")
+    print(f"⏱️ 向量化: {t_fast:.2f}s | 逐行: {t_slow:.2f}s | 加速 {t_slow / max(t_fast, 1e-9):.1f}x")
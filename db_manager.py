@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+class _ThreadConnection:
+    """
+    一个线程的长连接 + 事务嵌套深度，只由该线程的 threading.local 强引用
+    线程结束后 thread-local 被回收，finalize 随即关闭连接 (Streamlit 每次 rerun 换新线程，不会越积越多)
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.close = weakref.finalize(self, _close_quietly, conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+class SQLiteConnectionManager:
+    """
+    v10.0 核心组件：SQLite 长连接管理器
+    负责：
+    1. 每个线程持有一条长连接 (Streamlit 每次 rerun 不再反复 connect/close)，线程结束时自动关闭
+    2. 连接建立时一次性设置 WAL 模式和常用 PRAGMA
+    3. 提供上下文管理器形式的事务接口 (支持嵌套，只有最外层提交)
+    """
+
+    # 同一个数据库文件全局共享一个管理器 (TradeDataEngine / MarketDataEngine 都从这里拿)
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",       # 读写并发，不再互相阻塞
+        "PRAGMA synchronous=NORMAL",     # WAL 模式下足够安全，写入快很多
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-65536",      # 64MB 页缓存
+        "PRAGMA mmap_size=268435456",    # 256MB 内存映射读
+        "PRAGMA foreign_keys=ON",
+    )
+
+    def __init__(self, db_path, timeout=30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        # 只弱引用各线程的连接，close_all 用；线程退出后条目自动消失
+        self._all_conns = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db_path):
+        """按数据库路径获取共享的管理器实例"""
+        with cls._registry_lock:
+            manager = cls._registry.get(db_path)
+            if manager is None:
+                manager = cls(db_path)
+                cls._registry[db_path] = manager
+            return manager
+
+    def _slot(self):
+        """当前线程的连接槽位 (首次调用时创建连接并初始化 PRAGMA)"""
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            # isolation_level=None: 关闭 sqlite3 模块的隐式事务，由 transaction() 显式控制
+            # check_same_thread=False: 连接仍只在本线程使用，但线程退出后的关闭可能发生在别的线程
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            for pragma in self.PRAGMAS:
+                try:
+                    conn.execute(pragma)
+                except sqlite3.Error:
+                    pass
+            slot = _ThreadConnection(conn)
+            self._local.slot = slot
+            with self._lock:
+                self._all_conns.add(slot)
+        return slot
+
+    def connection(self):
+        """获取当前线程的长连接"""
+        return self._slot().conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        事务上下文：正常退出自动 COMMIT，异常自动 ROLLBACK
+        嵌套调用时只有最外层真正开启/提交事务
+        """
+        slot = self._slot()
+        conn = slot.conn
+        depth = slot.depth
+        if depth == 0:
+            conn.execute("BEGIN")
+        slot.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            slot.depth = depth
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            slot.depth = depth
+            if depth == 0:
+                conn.commit()
+
+    def close_all(self):
+        """关闭所有线程的连接 (一般只在进程退出或测试时调用)"""
+        with self._lock:
+            slots, self._all_conns = list(self._all_conns), weakref.WeakSet()
+        for slot in slots:
+            slot.close()
+        self._local = threading.local()
+
+
+def get_db(db_path):
+    """快捷入口：获取指定数据库的共享连接管理器"""
+    return SQLiteConnectionManager.get(db_path)
@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from kline_store import KLINE_DTYPE
+
+# 进程内 K 线缓存默认容量 (1m K 线每根 48 字节，256MB 约 500 万根)
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class KlineRangeCache:
+    """
+    v10.0 核心组件：进程内 K 线区间缓存 (LRU)
+    负责：
+    1. 每个 (币种, 周期) 维护若干段互不重叠的连续区间，每段是一块按时间排序的结构化数组
+    2. 请求落在已缓存区间内时直接二分切片返回；与已有区间重叠/相邻时只读取缺口，再合并成一段
+    3. 按总字节数做 LRU 淘汰
+    4. 仓库写入新 K 线时，丢弃与写入时间范围重叠的区间 (下次读取时重新从仓库加载)
+    5. 读取时核对仓库的序列版本戳，其他进程 (回填脚本、进程池) 写入过就整序列作废
+    同一个仓库在进程内共享一个缓存 (详情页、回放、AI 上下文各自的 MarketDataEngine 实例都命中同一份)
+    """
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name, max_bytes=DEFAULT_CACHE_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # (symbol, timeframe) -> {区间起点: (区间起点, 区间终点, 数组)}
+        self._series = {}
+        # LRU 顺序: (symbol, timeframe, 区间起点) -> 字节数
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._rows_read = 0
+        self._evictions = 0
+        self._stale = 0
+        # (symbol, timeframe) -> 缓存区间加载时仓库的序列版本戳
+        self._stamps = {}
+
+    @classmethod
+    def get(cls, name):
+        """按仓库位置获取进程内共享的缓存"""
+        with cls._registry_lock:
+            cache = cls._registry.get(name)
+            if cache is None:
+                cache = cls(name)
+                cls._registry[name] = cache
+            return cache
+
+    # ===========================
+    #  📖 读取
+    # ===========================
+    def read(self, symbol, timeframe, start_ts, end_ts, loader, stamp=None):
+        """
+        读取 [start_ts, end_ts] 区间的 K 线 (只读的结构化数组视图)
+        :param loader: loader(symbol, timeframe, start_ts, end_ts) -> KLINE_DTYPE 数组，缓存缺口时调用
+        :param stamp: 仓库当前的序列版本戳 (任何进程写入该序列都会改变)，与缓存时不同则先丢弃该序列；None 不校验
+        """
+        start_ts, end_ts = int(start_ts), int(end_ts)
+        if end_ts < start_ts:
+            return np.empty(0, dtype=KLINE_DTYPE)
+        with self._lock:
+            if stamp is not None:
+                cached_stamp = self._stamps.get((symbol, timeframe), stamp)
+                if cached_stamp != stamp and (symbol, timeframe) in self._series:
+                    self._stale += 1
+                    self.invalidate(symbol, timeframe)
+                self._stamps[(symbol, timeframe)] = stamp
+            segments = self._series.get((symbol, timeframe), {})
+            # 与请求重叠或首尾相接的已缓存区间 (按起点排序)
+            touching = sorted(
+                (seg for seg in segments.values() if seg[0] <= end_ts + 1 and seg[1] >= start_ts - 1),
+                key=lambda seg: seg[0]
+            )
+            for seg in touching:
+                if seg[0] <= start_ts and seg[1] >= end_ts:
+                    self._hits += 1
+                    self._lru.move_to_end((symbol, timeframe, seg[0]))
+                    return self._slice(seg[2], start_ts, end_ts)
+
+            # 合并：新区间覆盖请求和所有相接的旧区间，只从仓库读取中间的缺口
+            self._misses += 1
+            lo = min([start_ts] + [seg[0] for seg in touching])
+            hi = max([end_ts] + [seg[1] for seg in touching])
+            parts = []
+            cursor = lo
+            for seg_lo, seg_hi, arr in touching:
+                if seg_lo > cursor:
+                    parts.append(self._load(loader, symbol, timeframe, cursor, seg_lo - 1))
+                parts.append(arr)
+                cursor = seg_hi + 1
+            if cursor <= hi:
+                parts.append(self._load(loader, symbol, timeframe, cursor, hi))
+
+            for seg_lo, _, _ in touching:
+                self._drop(symbol, timeframe, seg_lo)
+            merged = np.concatenate(parts) if len(parts) > 1 else np.array(parts[0], dtype=KLINE_DTYPE)
+            merged.flags.writeable = False
+            self._put(symbol, timeframe, lo, hi, merged)
+            return self._slice(merged, start_ts, end_ts)
+
+    def _load(self, loader, symbol, timeframe, start_ts, end_ts):
+        arr = loader(symbol, timeframe, start_ts, end_ts)
+        self._rows_read += len(arr)
+        return arr
+
+    @staticmethod
+    def _slice(arr, start_ts, end_ts):
+        ts = arr['timestamp']
+        lo = np.searchsorted(ts, start_ts, side='left')
+        hi = np.searchsorted(ts, end_ts, side='right')
+        return arr[lo:hi]
+
+    # ===========================
+    #  🧹 容量与失效
+    # ===========================
+    def _put(self, symbol, timeframe, lo, hi, arr):
+        self._series.setdefault((symbol, timeframe), {})[lo] = (lo, hi, arr)
+        self._lru[(symbol, timeframe, lo)] = arr.nbytes
+        self._bytes += arr.nbytes
+        # 淘汰最久未用的区间 (刚放进来的这一段即使超过容量也保留，保证本次请求可用)
+        while self._bytes > self.max_bytes and len(self._lru) > 1:
+            old_symbol, old_tf, old_lo = next(iter(self._lru))
+            self._drop(old_symbol, old_tf, old_lo)
+            self._evictions += 1
+
+    def _drop(self, symbol, timeframe, lo):
+        self._bytes -= self._lru.pop((symbol, timeframe, lo), 0)
+        segments = self._series.get((symbol, timeframe))
+        if segments is not None:
+            segments.pop(lo, None)
+            if not segments:
+                del self._series[(symbol, timeframe)]
+
+    def invalidate(self, symbol=None, timeframe=None, start_ts=None, end_ts=None):
+        """
+        丢弃缓存区间
+        不传参数清空全部；传 symbol/timeframe 只清该序列；再传时间范围时只清与之重叠的区间
+        """
+        with self._lock:
+            for sym, tf in list(self._series):
+                if symbol is not None and sym != symbol:
+                    continue
+                if timeframe is not None and tf != timeframe:
+                    continue
+                for seg_lo, seg_hi, _ in list(self._series[(sym, tf)].values()):
+                    if start_ts is not None and seg_hi < start_ts:
+                        continue
+                    if end_ts is not None and seg_lo > end_ts:
+                        continue
+                    self._drop(sym, tf, seg_lo)
+
+    def metrics(self):
+        """缓存使用情况 (用于界面展示与排查)"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_bytes': self.max_bytes,
+                'bytes': self._bytes,
+                'segments': len(self._lru),
+                'hits': self._hits,
+                'misses': self._misses,
+                'rows_read': self._rows_read,
+                'evictions': self._evictions,
+                'stale': self._stale,
+            }
+
+
+def get_kline_cache(name):
+    """快捷入口：获取指定仓库的共享 K 线缓存"""
+    return KlineRangeCache.get(name)
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+
+# 定长列式记录：每根 K 线 48 字节
+KLINE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+
+class ColumnarKlineStore:
+    """
+    v10.0 列式 K 线仓库 (可选后端)
+    目录结构: root/<币种>/<周期>/<YYYY-MM>.npy，每个文件是按时间排序的定长结构化数组
+    读取时用内存映射打开，二分查找时间戳列后直接切片 (单月范围零拷贝)
+    """
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    # ===========================
+    #  📁 路径与分月
+    # ===========================
+    @staticmethod
+    def _safe_name(symbol):
+        return symbol.replace('/', '_').replace(':', '_')
+
+    def _series_dir(self, symbol, timeframe):
+        return os.path.join(self.root_dir, self._safe_name(symbol), timeframe)
+
+    @staticmethod
+    def _month_keys(ts_array):
+        """毫秒时间戳 -> 'YYYY-MM' 分月键"""
+        months = np.asarray(ts_array, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[M]')
+        return np.datetime_as_string(months, unit='M')
+
+    def _month_files(self, symbol, timeframe):
+        """该序列已有的分月文件 (按月份升序)"""
+        series_dir = self._series_dir(symbol, timeframe)
+        if not os.path.isdir(series_dir):
+            return []
+        return sorted(f[:-4] for f in os.listdir(series_dir) if f.endswith('.npy'))
+
+    def _load_month(self, symbol, timeframe, month, mmap=True):
+        path = os.path.join(self._series_dir(symbol, timeframe), f"{month}.npy")
+        if not os.path.exists(path):
+            return np.empty(0, dtype=KLINE_DTYPE)
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    # ===========================
+    #  ✍️ 写入
+    # ===========================
+    def write(self, symbol, timeframe, rows, replace=False):
+        """
+        合并写入 K 线
+        :param rows: [[ts, o, h, l, c, v], ...] 或 KLINE_DTYPE 结构化数组
+        :param replace: False 时已存在的时间戳保持不变 (等价 INSERT OR IGNORE)，True 时覆盖
+        :return: 写入的行数
+        """
+        if rows is None or len(rows) == 0:
+            return 0
+        if isinstance(rows, np.ndarray) and rows.dtype == KLINE_DTYPE:
+            new = rows
+        else:
+            raw = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+            new = np.empty(len(raw), dtype=KLINE_DTYPE)
+            new['timestamp'] = raw[:, 0].astype(np.int64)
+            for i, name in enumerate(KLINE_DTYPE.names[1:], start=1):
+                new[name] = raw[:, i]
+
+        series_dir = self._series_dir(symbol, timeframe)
+        os.makedirs(series_dir, exist_ok=True)
+
+        months = self._month_keys(new['timestamp'])
+        for month in np.unique(months):
+            chunk = new[months == month]
+            old = self._load_month(symbol, timeframe, month, mmap=False)
+            # 新数据放前面 + stable 排序后按时间戳去重，保留的是"优先"的那一份
+            merged = np.concatenate([chunk, old] if replace else [old, chunk])
+            order = np.argsort(merged['timestamp'], kind='stable')
+            merged = merged[order]
+            keep = np.ones(len(merged), dtype=bool)
+            keep[1:] = merged['timestamp'][1:] != merged['timestamp'][:-1]
+            merged = merged[keep]
+
+            # 先写临时文件再原子替换，正在读取的内存映射不受影响
+            path = os.path.join(series_dir, f"{month}.npy")
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, merged)
+            os.replace(tmp_path, path)
+        return len(new)
+
+    # ===========================
+    #  📖 读取
+    # ===========================
+    def read(self, symbol, timeframe, start_ts, end_ts):
+        """读取 [start_ts, end_ts] 区间的 K 线 (结构化数组，单月时为内存映射视图)"""
+        months = self._month_files(symbol, timeframe)
+        if not months:
+            return np.empty(0, dtype=KLINE_DTYPE)
+        first, last = self._month_keys([start_ts, end_ts])
+        parts = []
+        for month in months:
+            if month < first or month > last:
+                continue
+            arr = self._load_month(symbol, timeframe, month)
+            ts = arr['timestamp']
+            lo = np.searchsorted(ts, start_ts, side='left')
+            hi = np.searchsorted(ts, end_ts, side='right')
+            if hi > lo:
+                parts.append(arr[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=KLINE_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def series_version(self, symbol, timeframe):
+        """
+        序列版本戳：序列目录的修改时间 (ns)，每次写入的 os.replace 都会更新，跨进程可见
+        没有数据返回 None
+        """
+        try:
+            return os.stat(self._series_dir(symbol, timeframe)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def last_timestamp(self, symbol, timeframe):
+        """该序列最新一根 K 线的时间戳 (没有数据返回 None)"""
+        for month in reversed(self._month_files(symbol, timeframe)):
+            arr = self._load_month(symbol, timeframe, month)
+            if len(arr):
+                return int(arr['timestamp'][-1])
+        return None
@@ -1,9 +1,36 @@
 import ccxt
-import sqlite3
+import ccxt.async_support as ccxt_async
+import asyncio
 import pandas as pd
 import time
 import os
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from db_manager import get_db
+from kline_store import ColumnarKlineStore, KLINE_DTYPE
+from kline_cache import get_kline_cache
+from rate_limiter import get_governor
+import numpy as np
+
+# v10.0: 并发同步时写入线程攒批的行数 (跨币种合并提交)
+ASYNC_FLUSH_ROWS = 50000
+
+# v10.0: K 线区间查询 (固定 SQL 文本 + 参数绑定，sqlite3 语句缓存可直接复用)
+# 条件与主键 (symbol, timeframe, timestamp) 完全对齐：两个等值 + 一个范围
+KLINE_RANGE_SQL = '''
+    SELECT timestamp, open, high, low, close, volume FROM klines
+    WHERE symbol = ? AND timeframe = ? AND timestamp >= ? AND timestamp <= ?
+    ORDER BY timestamp ASC
+'''
+
+# v10.0: 由 1m 增量聚合维护的高周期 (周期 -> 桶宽毫秒)
+DERIVED_TIMEFRAMES = {
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
 
 class MarketDataEngine:
     """
@@ -11,9 +38,12 @@ class MarketDataEngine:
     负责：
     1. 批量下载并维护全量 K 线数据 (Local Data Warehouse)
     2. 提供毫秒级的 K 线查询服务 (不再依赖实时 API)
-    3. 自动处理交易所权重限制 (Rate Limits)
+    3. 自动处理交易所权重限制 (Rate Limits，v10.0 起统一由权重预算调度器管理)
+    4. v10.0 可选列式存储后端 (按币种/按月的定长数组文件，内存映射读取)
+    5. v10.0 同步 1m 后增量维护 5m/15m/1h/4h/1d 预聚合 K 线
+    6. v10.0 多币种并发同步 (asyncio + 权重预算限速 + 单写入线程)
     """
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, storage=None):
         # --- 核心修改：自动定位到 data 目录，确保数据持久化 ---
         base_dir = os.path.dirname(os.path.abspath(__file__))
         
@@ -28,39 +58,62 @@ class MarketDataEngine:
             self.db_path = os.path.join(base_dir, db_path)
             
         print(f"📉 市场数据仓库位置: {self.db_path}")
+        # v10.0: 与 TradeDataEngine 共用同一套长连接管理
+        self.db = get_db(self.db_path)
+        
+        # v10.0: 存储后端 ('sqlite' / 'columnar')
+        # 不指定时自动检测：仓库旁存在 klines_columnar 目录 (执行过迁移) 就用列式后端
+        self.columnar_dir = os.path.join(os.path.dirname(self.db_path), 'klines_columnar')
+        if storage is None:
+            storage = 'columnar' if os.path.isdir(self.columnar_dir) else 'sqlite'
+        self.storage = storage
+        self.columnar = ColumnarKlineStore(self.columnar_dir) if storage == 'columnar' else None
+        # 列式后端按月整文件重写，攒够一批再落盘；SQLite 逐页提交
+        self.flush_rows = 50000 if self.columnar is not None else 1000
+        # v10.0: 进程内 K 线区间缓存 (按仓库位置共享，同一币种反复查询不再读盘)
+        self.cache = get_kline_cache(self.columnar_dir if self.columnar is not None else self.db_path)
         
         # 初始化公开交易所实例 (用于下载 K 线，无需 API Key)
-        self.public_exchange = ccxt.binance({
-            'enableRateLimit': True,
+        # v10.0: 所有请求经过全局权重调度器 (与交易同步共用同一份 IP 权重预算)
+        self.governor = get_governor()
+        self.public_exchange = self.governor.govern(ccxt.binance({
             'options': {'defaultType': 'future'}  # 默认抓取合约 K 线
-        })
+        }))
         self._init_db()
 
     def _init_db(self):
         """初始化 K 线专用数据库"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # 创建 K 线表 (复合主键防止重复)
-        # 包含: 币种, 周期, 时间戳, 开, 高, 低, 收, 量
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS klines (
-                symbol TEXT,
-                timeframe TEXT,
-                timestamp INTEGER,
-                open REAL,
-                high REAL,
-                low REAL,
-                close REAL,
-                volume REAL,
-                PRIMARY KEY (symbol, timeframe, timestamp)
-            )
-        ''')
-        # 创建索引加速查询
-        c.execute('CREATE INDEX IF NOT EXISTS idx_symbol_ts ON klines (symbol, timestamp)')
-        
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            
+            # 创建 K 线表 (复合主键防止重复)
+            # 包含: 币种, 周期, 时间戳, 开, 高, 低, 收, 量
+            # v10.0: 新库使用 WITHOUT ROWID，数据直接按主键聚簇存放，区间读取是连续的 B 树扫描
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS klines (
+                    symbol TEXT,
+                    timeframe TEXT,
+                    timestamp INTEGER,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume REAL,
+                    PRIMARY KEY (symbol, timeframe, timestamp)
+                ) WITHOUT ROWID
+            ''')
+            # v10.0: 旧的 (symbol, timestamp) 索引不含周期，多周期共表后会扫到其他周期的数据；
+            # 所有查询都走主键 (symbol, timeframe, timestamp)，这个索引只会拖慢写入
+            c.execute('DROP INDEX IF EXISTS idx_symbol_ts')
+            # v10.0: 每个序列的写入版本号 (与 K 线在同一事务内 +1)，其他进程据此判断自己的 K 线缓存是否过期
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS kline_versions (
+                    symbol TEXT,
+                    timeframe TEXT,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (symbol, timeframe)
+                ) WITHOUT ROWID
+            ''')
 
     def sync_symbol_history(self, symbol, timeframe='1m', days=365, progress_callback=None):
         """
@@ -70,14 +123,10 @@ class MarketDataEngine:
         :param days: 回溯天数 (默认 1 年)
         :param progress_callback: 回调函数，用于前端显示进度条 (msg, percent)
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
         try:
             # 1. 确定抓取起点
             # 先查库里最新的时间是多久
-            c.execute("SELECT MAX(timestamp) FROM klines WHERE symbol = ? AND timeframe = ?", (symbol, timeframe))
-            last_ts = c.fetchone()[0]
+            last_ts = self._last_timestamp(symbol, timeframe)
             
             now = self.public_exchange.milliseconds()
             
@@ -104,20 +153,11 @@ class MarketDataEngine:
                     if not ohlcv:
                         break
                     
-                    # 写入数据库 (批量插入)
-                    data_to_insert = []
-                    for k in ohlcv:
-                        # (symbol, timeframe, ts, o, h, l, c, v)
-                        data_to_insert.append((
-                            symbol, timeframe, k[0], k[1], k[2], k[3], k[4], k[5]
-                        ))
-                    
-                    c.executemany('''
-                        INSERT OR IGNORE INTO klines 
-                        (symbol, timeframe, timestamp, open, high, low, close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', data_to_insert)
-                    conn.commit()
+                    # 写入仓库 (攒批插入)
+                    all_ohlcv.extend(ohlcv)
+                    if len(all_ohlcv) >= self.flush_rows:
+                        self._store_klines(symbol, timeframe, all_ohlcv)
+                        all_ohlcv = []
                     
                     # 更新进度
                     last_fetched_ts = ohlcv[-1][0]
@@ -128,9 +168,6 @@ class MarketDataEngine:
                         pct = min(0.99, covered / total_duration)
                         progress_callback(f"📥 {symbol}: 同步至 {datetime.fromtimestamp(last_fetched_ts/1000).strftime('%Y-%m-%d')}", pct)
                     
-                    # 稍微休息一下，虽然 ccxt 开启了 enableRateLimit，但大量循环还是稳一点好
-                    time.sleep(0.1)
-                    
                     # 如果抓到的最新数据已经接近现在，停止
                     if now - last_fetched_ts < 60000:
                         break
@@ -139,46 +176,340 @@ class MarketDataEngine:
                     print(f"⚠️ 抓取片段失败: {e}")
                     time.sleep(1) # 出错多睡一会
             
+            self._store_klines(symbol, timeframe, all_ohlcv)
+            
+            # v10.0: 1m 落库后顺手刷新高周期 (只重算最后一根未走完的桶之后的部分)
+            if timeframe == '1m':
+                self.update_derived_timeframes(symbol)
             return True, f"✅ {symbol} 同步完成"
         except Exception as e:
             return False, f"❌ 同步失败: {str(e)}"
+
+    # ===========================
+    #  ⚡ 多币种并发同步
+    # ===========================
+    def sync_symbols_async(self, symbols, timeframe='1m', days=365, concurrency=8, progress_callback=None):
+        """
+        并发同步多个币种的历史 K 线
+        请求节奏由全局权重调度器决定 (不再逐页 sleep)，所有写入由单独的写入线程攒批完成
+        :param concurrency: 同时在抓取的币种数
+        :param progress_callback: 回调函数 (msg, percent)，percent 为整体进度
+        :return: {symbol: (ok, msg)}
+        """
+        return asyncio.run(self._sync_symbols_async(symbols, timeframe, days, concurrency, progress_callback))
+
+    async def _sync_symbols_async(self, symbols, timeframe, days, concurrency, progress_callback):
+        exchange = self.governor.govern(ccxt_async.binance({
+            'options': {'defaultType': 'future'}
+        }))
+        queue = asyncio.Queue(maxsize=concurrency * 4)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = {}
+        progress = {symbol: 0.0 for symbol in symbols}
+        
+        def report(msg, symbol, pct):
+            progress[symbol] = pct
+            if progress_callback:
+                progress_callback(msg, sum(progress.values()) / max(len(progress), 1))
+        
+        async def worker(symbol):
+            async with semaphore:
+                await self._fetch_symbol_async(exchange, queue, symbol, timeframe, days, report)
+        
+        writer = asyncio.create_task(self._kline_writer(queue, timeframe, results))
+        try:
+            await asyncio.gather(*(worker(symbol) for symbol in symbols))
         finally:
-            conn.close()
+            await queue.put(None)
+            await writer
+            await exchange.close()
+        return results
+
+    async def _fetch_symbol_async(self, exchange, queue, symbol, timeframe, days, report, limit=1000, max_retries=5,
+                                  max_throttles=10):
+        """
+        单个币种的抓取协程：分页拉取后把数据交给写入队列
+        :param max_retries: 连续普通错误 (网络等) 的重试上限
+        :param max_throttles: 连续限频 (429/418) 的重试上限，每次都会先按 Retry-After 或 60 秒退避；IP 被持续封禁时放弃该币种
+        """
+        try:
+            last_ts = self._last_timestamp(symbol, timeframe)
+            now = exchange.milliseconds()
+            start_ts = last_ts + 1 if last_ts else now - (days * 24 * 60 * 60 * 1000)
+            total_duration = max(now - start_ts, 1)
+            current_since = start_ts
+            retries = 0
+            throttles = 0
+            
+            while current_since < now:
+                try:
+                    ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, since=current_since, limit=limit)
+                except (ccxt.DDoSProtection, ccxt.RateLimitExceeded) as e:
+                    # 触发交易所限频 (429/418)：调度器已按 Retry-After 暂停，没有该响应头时整体退避一分钟
+                    throttles += 1
+                    if throttles > max_throttles:
+                        raise
+                    print(f"⚠️ {symbol} 触发限频 ({throttles}/{max_throttles}): {e}")
+                    if self.governor.metrics()['blocked_for'] <= 0:
+                        self.governor.block(60)
+                    continue
+                except Exception as e:
+                    retries += 1
+                    if retries > max_retries:
+                        raise
+                    print(f"⚠️ 抓取片段失败: {e}")
+                    await asyncio.sleep(min(2 ** retries, 30))
+                    continue
+                retries = 0
+                throttles = 0
+                
+                if not ohlcv:
+                    break
+                await queue.put(('rows', symbol, ohlcv))
+                
+                last_fetched_ts = ohlcv[-1][0]
+                current_since = last_fetched_ts + 1
+                report(f"📥 {symbol}: 同步至 {datetime.fromtimestamp(last_fetched_ts/1000).strftime('%Y-%m-%d')}",
+                       symbol, min(0.99, (last_fetched_ts - start_ts) / total_duration))
+                
+                if now - last_fetched_ts < 60000:
+                    break
+            
+            await queue.put(('done', symbol, (True, f"✅ {symbol} 同步完成")))
+        except Exception as e:
+            await queue.put(('done', symbol, (False, f"❌ 同步失败: {str(e)}")))
+        report(f"✔️ {symbol} 结束", symbol, 1.0)
+
+    async def _kline_writer(self, queue, timeframe, results):
+        """
+        唯一的写入协程：把各币种的分页数据攒成大批，在专用线程里一次事务写入
+        某个币种抓取结束时，落盘它的剩余数据并刷新预聚合周期
+        """
+        loop = asyncio.get_running_loop()
+        buffers = {}
+        buffered = 0
+        failed = {}
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                kind, symbol, payload = item
+                if kind == 'rows':
+                    buffers.setdefault(symbol, []).extend(payload)
+                    buffered += len(payload)
+                    if buffered >= ASYNC_FLUSH_ROWS:
+                        batch, buffers, buffered = buffers, {}, 0
+                        try:
+                            await loop.run_in_executor(pool, self._write_batch, timeframe, batch)
+                        except Exception as e:
+                            # 写入失败不能让写入协程退出 (否则抓取协程会卡在满队列上)
+                            for sym in batch:
+                                failed[sym] = (False, f"❌ 写入失败: {str(e)}")
+                else:
+                    rows = buffers.pop(symbol, [])
+                    buffered -= len(rows)
+                    try:
+                        await loop.run_in_executor(pool, self._finish_symbol, symbol, timeframe, rows)
+                        results[symbol] = failed.get(symbol, payload)
+                    except Exception as e:
+                        results[symbol] = (False, f"❌ 写入失败: {str(e)}")
+
+    def _write_batch(self, timeframe, batch):
+        """多个币种的数据合并在一个事务里写入"""
+        with self.db.transaction():
+            for symbol, rows in batch.items():
+                self._store_klines(symbol, timeframe, rows)
+        # 提交之前其他线程仍可能读到旧数据并放回缓存，提交后再作废一次
+        for symbol, rows in batch.items():
+            if len(rows):
+                self._invalidate_cache(symbol, timeframe, rows)
+
+    def _finish_symbol(self, symbol, timeframe, rows):
+        self._store_klines(symbol, timeframe, rows)
+        if timeframe == '1m':
+            self.update_derived_timeframes(symbol)
 
     def get_klines_df(self, symbol, start_ts, end_ts, timeframe='1m'):
         """
         本地极速查询：获取指定时间段的 K 线 DataFrame
+        timeframe 为 5m/15m/1h/4h/1d 时直接读预聚合表；尚未生成时从 1m 现场聚合
         """
-        conn = sqlite3.connect(self.db_path)
-        
         # 加上 buffer (前后多取一点，保证画图完整)
         buffer = 60 * 1000 * 60 # 60分钟 buffer
         q_start = start_ts - buffer
         q_end = end_ts + buffer
         
+        if timeframe in DERIVED_TIMEFRAMES:
+            # 起点落在某根高周期 K 线中间时，这根 K 线也要包含 (与对 1m 做 resample 的结果一致)
+            bucket = DERIVED_TIMEFRAMES[timeframe]
+            q_start = q_start // bucket * bucket
+            if self._last_timestamp(symbol, timeframe) is None:
+                raw = self.get_klines_array(symbol, q_start, q_end, '1m')
+                return self._klines_frame(self._aggregate(raw, bucket))
+        
         try:
-            query = f"""
-                SELECT timestamp, open, high, low, close, volume 
-                FROM klines 
-                WHERE symbol = '{symbol}' 
-                AND timeframe = '{timeframe}'
-                AND timestamp >= {q_start}
-                AND timestamp <= {q_end}
-                ORDER BY timestamp ASC
-            """
-            df = pd.read_sql_query(query, conn)
-            
-            if not df.empty:
-                # 转换时间格式，方便 Pandas 处理
-                df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-            
-            return df
-            
+            # 缓存里的数组是只读共享的，DataFrame 拿一份自己的拷贝 (调用方会增删改列)
+            return self._klines_frame(self.get_klines_array(symbol, q_start, q_end, timeframe).copy())
         except Exception as e:
             print(f"查询失败: {e}")
             return pd.DataFrame()
-        finally:
-            conn.close()
+
+    def get_klines_array(self, symbol, start_ts, end_ts, timeframe='1m'):
+        """
+        读取 [start_ts, end_ts] 区间的 K 线 (KLINE_DTYPE 只读数组，不加 buffer)
+        经过进程内区间缓存：命中时直接切片，部分命中时只读取缺口
+        每次先取仓库的序列版本戳，其他进程写入过该序列时缓存整序列重新加载
+        """
+        stamp = self._series_version(symbol, timeframe)
+        return self.cache.read(symbol, timeframe, start_ts, end_ts, self._read_array, stamp)
+
+    # ===========================
+    #  🗄️ 存储后端
+    # ===========================
+    def _last_timestamp(self, symbol, timeframe):
+        """仓库中该序列最新一根 K 线的时间戳"""
+        if self.columnar is not None:
+            return self.columnar.last_timestamp(symbol, timeframe)
+        c = self.db.connection().cursor()
+        c.execute("SELECT MAX(timestamp) FROM klines WHERE symbol = ? AND timeframe = ?", (symbol, timeframe))
+        return c.fetchone()[0]
+
+    def _series_version(self, symbol, timeframe):
+        """仓库中该序列的版本戳 (任何进程写入都会改变；从未写入过时为 0)"""
+        if self.columnar is not None:
+            return self.columnar.series_version(symbol, timeframe) or 0
+        row = self.db.connection().execute(
+            "SELECT version FROM kline_versions WHERE symbol = ? AND timeframe = ?", (symbol, timeframe)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _store_klines(self, symbol, timeframe, ohlcv, replace=False):
+        """
+        写入一批 K 线 [[ts, o, h, l, c, v], ...] 或 KLINE_DTYPE 结构化数组
+        :param replace: False 时已存在的时间戳忽略，True 时覆盖 (预聚合的未完成桶需要覆盖)
+        """
+        if ohlcv is None or len(ohlcv) == 0:
+            return
+        if self.columnar is not None:
+            self.columnar.write(symbol, timeframe, ohlcv, replace=replace)
+            self._invalidate_cache(symbol, timeframe, ohlcv)
+            return
+        if isinstance(ohlcv, np.ndarray):
+            ohlcv = ohlcv.tolist()
+        # (symbol, timeframe, ts, o, h, l, c, v)
+        data_to_insert = [(symbol, timeframe, k[0], k[1], k[2], k[3], k[4], k[5]) for k in ohlcv]
+        verb = "REPLACE" if replace else "IGNORE"
+        with self.db.transaction() as conn:
+            conn.executemany(f'''
+                INSERT OR {verb} INTO klines 
+                (symbol, timeframe, timestamp, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', data_to_insert)
+            conn.execute('''
+                INSERT INTO kline_versions (symbol, timeframe, version) VALUES (?, ?, 1)
+                ON CONFLICT(symbol, timeframe) DO UPDATE SET version = version + 1
+            ''', (symbol, timeframe))
+        self._invalidate_cache(symbol, timeframe, ohlcv)
+
+    def _invalidate_cache(self, symbol, timeframe, ohlcv):
+        """写入后作废与写入时间范围重叠的缓存区间 (K 线按时间排序，首尾即范围)"""
+        first_ts, last_ts = int(ohlcv[0][0]), int(ohlcv[-1][0])
+        self.cache.invalidate(symbol, timeframe, min(first_ts, last_ts), max(first_ts, last_ts))
+
+    def _read_array(self, symbol, timeframe, start_ts, end_ts):
+        """读取 [start_ts, end_ts] 区间的 K 线为 KLINE_DTYPE 结构化数组"""
+        if self.columnar is not None:
+            return self.columnar.read(symbol, timeframe, start_ts, end_ts)
+        # 游标逐行直接灌进定长数组，不经过 DataFrame / 中间 list
+        cursor = self.db.connection().execute(KLINE_RANGE_SQL, (symbol, timeframe, int(start_ts), int(end_ts)))
+        return np.fromiter(cursor, dtype=KLINE_DTYPE)
+
+    # ===========================
+    #  🧱 高周期预聚合
+    # ===========================
+    @staticmethod
+    def _aggregate(arr, bucket_ms):
+        """
+        把按时间排序的 K 线聚合到 bucket_ms 宽的桶 (按 UTC 整点对齐，与 pandas resample 一致)
+        开=首根开, 高=最高, 低=最低, 收=末根收, 量=求和；没有成交的桶不输出
+        """
+        if len(arr) == 0:
+            return np.empty(0, dtype=KLINE_DTYPE)
+        buckets = arr['timestamp'] // bucket_ms * bucket_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(arr)] - 1
+        out = np.empty(len(starts), dtype=KLINE_DTYPE)
+        out['timestamp'] = buckets[starts]
+        out['open'] = arr['open'][starts]
+        out['high'] = np.maximum.reduceat(arr['high'], starts)
+        out['low'] = np.minimum.reduceat(arr['low'], starts)
+        out['close'] = arr['close'][ends]
+        out['volume'] = np.add.reduceat(arr['volume'], starts)
+        return out
+
+    def update_derived_timeframes(self, symbol):
+        """
+        增量维护高周期 K 线：每个周期从自己最后一根 (可能未走完) 的桶起点重算
+        1m 只读取一次 (从所有周期中最早的重算起点开始)
+        :return: {周期: 写入根数}
+        """
+        resume_from = {}
+        for tf, bucket in DERIVED_TIMEFRAMES.items():
+            last = self._last_timestamp(symbol, tf)
+            # 从未生成过的周期：从 1m 的第一根开始全量构建
+            resume_from[tf] = (last // bucket * bucket) if last is not None else 0
+        
+        raw = self._read_array(symbol, '1m', min(resume_from.values()), np.iinfo(np.int64).max)
+        written = {}
+        if len(raw) == 0:
+            return written
+        
+        ts = raw['timestamp']
+        for tf, bucket in DERIVED_TIMEFRAMES.items():
+            lo = np.searchsorted(ts, resume_from[tf], side='left')
+            agg = self._aggregate(raw[lo:], bucket)
+            self._store_klines(symbol, tf, agg, replace=True)
+            written[tf] = len(agg)
+        return written
+
+    @staticmethod
+    def _klines_frame(arr):
+        """结构化数组 -> DataFrame (各列直接引用数组内存，不复制)"""
+        if len(arr) == 0:
+            return pd.DataFrame()
+        df = pd.DataFrame({name: arr[name] for name in KLINE_DTYPE.names}, copy=False)
+        df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def migrate_to_columnar(self, progress_callback=None):
+        """
+        把 SQLite 仓库中的全部 K 线导出到列式仓库 (按币种/周期/月份分文件)
+        完成后本实例及之后新建的实例都会自动使用列式后端
+        """
+        conn = self.db.connection()
+        series = conn.execute("SELECT DISTINCT symbol, timeframe FROM klines").fetchall()
+        store = ColumnarKlineStore(self.columnar_dir)
+        total_rows = 0
+        for i, (symbol, timeframe) in enumerate(series):
+            if progress_callback:
+                progress_callback(f"📦 迁移 {symbol} {timeframe}...", i / max(len(series), 1))
+            cur = conn.execute('''
+                SELECT timestamp, open, high, low, close, volume FROM klines
+                WHERE symbol = ? AND timeframe = ? ORDER BY timestamp ASC
+            ''', (symbol, timeframe))
+            while True:
+                rows = cur.fetchmany(200000)
+                if not rows:
+                    break
+                store.write(symbol, timeframe, rows)
+                total_rows += len(rows)
+        self.storage = 'columnar'
+        self.columnar = store
+        self.cache = get_kline_cache(self.columnar_dir)
+        if progress_callback:
+            progress_callback(f"✅ 迁移完成，共 {total_rows} 根 K 线", 1.0)
+        return total_rows
 
 # 测试代码
 if __name__ == "__main__":
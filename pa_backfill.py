@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_processor import calc_price_action_stats, pa_data_version
+
+# 与详情页一致：开仓前多取 200 分钟 (ATR 预热)，get_klines_df 再前后各加 60 分钟 buffer
+PA_LOOKBACK_MS = 200 * 60 * 1000
+PA_BUFFER_MS = 60 * 60 * 1000
+
+# 每个进程任务最多处理的回合数 (交易特别多的币种拆成几块，避免单个任务拖尾)
+ROUNDS_PER_TASK = 200
+
+
+def clean_symbol(raw_symbol):
+    """交易记录币种 -> K 线仓库币种 (与详情页的清洗逻辑一致，如 'BNB/USDT:USDT' -> 'BNB/USDT')"""
+    clean = str(raw_symbol).split(':')[0]
+    if "USDT" in clean and "/" not in clean:
+        clean = clean.replace("USDT", "/USDT")
+    return clean
+
+
+def _pa_window(open_time, close_time):
+    """详情页实际读取的 K 线区间 [open-200min-buffer, close+buffer]"""
+    return open_time - PA_LOOKBACK_MS - PA_BUFFER_MS, close_time + PA_BUFFER_MS
+
+
+# ===========================
+#  ⚙️ 进程任务
+# ===========================
+def _calc_rounds(klines, specs, risk_amount):
+    """
+    在子进程里计算一批同币种回合的价格行为指标
+    :param klines: 该批回合覆盖区间的 KLINE_DTYPE 数组 (整个币种只从仓库读取一次)
+    :param specs: [(round_id, direction, entry_price, amount, open_time, close_time), ...]
+    :return: [(round_id, data_version, stats 或 None, 错误信息), ...]
+    """
+    from market_engine import MarketDataEngine
+
+    ts = klines['timestamp']
+    results = []
+    for round_id, direction, entry_price, amount, open_time, close_time in specs:
+        try:
+            start_ts, end_ts = _pa_window(open_time, close_time)
+            lo = np.searchsorted(ts, start_ts, side='left')
+            hi = np.searchsorted(ts, end_ts, side='right')
+            candles = MarketDataEngine._klines_frame(np.array(klines[lo:hi]))
+            if candles.empty:
+                results.append((round_id, None, None, "本地仓库没有对应 K 线"))
+                continue
+            version = pa_data_version(candles, direction, entry_price, amount)
+            exit_price = candles.iloc[-1]['close']
+            stats = calc_price_action_stats(
+                candles, direction, entry_price, exit_price,
+                open_time, close_time, amount, risk_amount
+            )
+            if stats:
+                stats.pop('Charts', None)
+            results.append((round_id, version, stats, None if stats else "持仓区间内没有 K 线"))
+        except Exception as e:
+            results.append((round_id, None, None, str(e)))
+    return results
+
+
+# ===========================
+#  🧮 批量回填
+# ===========================
+def backfill_price_action(engine, api_key, risk_amount=100.0, only_missing=True,
+                          workers=None, market_engine=None, progress_callback=None):
+    """
+    v10.0 批量回填价格行为指标 (MAE/MFE/ETD/RVOL/形态)
+    1. 读取所有已平仓回合，按币种分组，每个币种的 K 线只从仓库读取一次
+    2. 按币种 (大币种再切块) 分发到进程池并行计算
+    3. 每完成一个任务就在一个事务里写回 pa_stats 和 trades (update_trade_extended)
+    :param only_missing: True 时跳过 trades 表里已经有 MAE 的回合
+    :return: {'total': 需要计算的回合数, 'done': 成功数, 'failed': {round_id: 原因}, 'seconds': 耗时}
+    """
+    t_start = time.time()
+    report = {'total': 0, 'done': 0, 'failed': {}, 'seconds': 0.0}
+
+    rounds = engine.load_rounds(api_key)
+    trades = engine.load_trades(api_key)
+    if rounds.empty or trades.empty:
+        return report
+
+    # 开仓单上的开仓价/数量/已有 MAE (详情页同样从开仓单读取)
+    open_fills = trades.drop_duplicates('id').set_index('id')
+    rounds = rounds[rounds['round_id'].isin(open_fills.index)].copy()
+    rounds['entry_price'] = pd.to_numeric(open_fills.loc[rounds['round_id'], 'price'].values, errors='coerce')
+    rounds['amount'] = pd.to_numeric(open_fills.loc[rounds['round_id'], 'amount'].values, errors='coerce')
+    if only_missing and 'mae' in open_fills.columns:
+        existing_mae = pd.to_numeric(open_fills.loc[rounds['round_id'], 'mae'].values, errors='coerce')
+        rounds = rounds[np.isnan(existing_mae)]
+    rounds = rounds[(rounds['entry_price'] > 0) & (rounds['amount'] > 0)]
+    rounds['kline_symbol'] = rounds['symbol'].map(clean_symbol)
+    report['total'] = len(rounds)
+    if rounds.empty:
+        return report
+
+    if market_engine is None:
+        from market_engine import MarketDataEngine
+        market_engine = MarketDataEngine()
+
+    # 1. 按币种分组，每组按时间切块，每块只带自己覆盖区间的 K 线
+    tasks = []
+    for symbol, group in rounds.sort_values('open_time').groupby('kline_symbol', sort=False):
+        window_start, _ = _pa_window(int(group['open_time'].min()), 0)
+        _, window_end = _pa_window(0, int(group['close_time'].max()))
+        # 直接读仓库，不经过进程内区间缓存 (整段历史会把详情页的缓存挤掉)
+        klines = market_engine._read_array(symbol, '1m', window_start, window_end)
+        ts = klines['timestamp']
+        for i in range(0, len(group), ROUNDS_PER_TASK):
+            chunk = group.iloc[i:i + ROUNDS_PER_TASK]
+            lo_ts, _ = _pa_window(int(chunk['open_time'].min()), 0)
+            _, hi_ts = _pa_window(0, int(chunk['close_time'].max()))
+            lo = np.searchsorted(ts, lo_ts, side='left')
+            hi = np.searchsorted(ts, hi_ts, side='right')
+            specs = list(zip(chunk['round_id'], chunk['direction'], chunk['entry_price'].astype(float),
+                             chunk['amount'].astype(float), chunk['open_time'].astype(int), chunk['close_time'].astype(int)))
+            tasks.append((symbol, np.array(klines[lo:hi]), specs))
+
+    # 2. 并行计算 + 3. 分批写回
+    def write_back(results):
+        with engine.db.transaction():
+            for round_id, version, stats, error in results:
+                if stats is None:
+                    report['failed'][round_id] = error
+                    continue
+                engine.save_pa_stats(round_id, api_key, version, risk_amount, stats)
+                base_id = round_id.replace('_OPEN', '').replace('_CLOSE', '')
+                success, msg = engine.update_trade_extended(base_id, api_key, {
+                    'mae': float(stats['MAE']),
+                    'mfe': float(stats['MFE']),
+                    'etd': float(stats['ETD']),
+                    'mae_atr': float(stats['MAE_ATR']),
+                    'mfe_atr': float(stats['MFE_ATR']),
+                    'mad': float(stats['MAD']),
+                    'efficiency': float(stats['Efficiency']),
+                    'rvol': float(stats.get('RVOL', 1.0)),
+                    'pattern_signal': stats.get('Pattern', '无显著形态'),
+                })
+                if success:
+                    report['done'] += 1
+                else:
+                    report['failed'][round_id] = msg
+
+    finished = 0
+    def report_progress(symbol, n):
+        if progress_callback:
+            elapsed = time.time() - t_start
+            progress_callback(f"🔬 {symbol} +{n} | {finished}/{report['total']} 笔 | {elapsed:.0f}s",
+                              finished / max(report['total'], 1))
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        for symbol, klines, specs in tasks:
+            write_back(_calc_rounds(klines, specs, risk_amount))
+            finished += len(specs)
+            report_progress(symbol, len(specs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = {pool.submit(_calc_rounds, klines, specs, risk_amount): (symbol, specs)
+                       for symbol, klines, specs in tasks}
+            for future in as_completed(futures):
+                symbol, specs = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    # 子进程崩溃 (如内存不足) 时整块记为失败，不影响其他币种
+                    results = [(spec[0], None, None, str(e)) for spec in specs]
+                write_back(results)
+                finished += len(specs)
+                report_progress(symbol, len(specs))
+
+    report['seconds'] = time.time() - t_start
+    return report
+
+
+# 命令行：python pa_backfill.py [--all] [--risk 100] [--workers N]
+#   默认只计算还没有 MAE 的回合；--all 全部重算
+if __name__ == "__main__":
+    from data_engine import TradeDataEngine
+
+    def arg_value(name, default):
+        if name in sys.argv:
+            return type(default)(sys.argv[sys.argv.index(name) + 1])
+        return default
+
+    engine = TradeDataEngine()
+    accounts = engine.get_all_accounts()
+    if accounts.empty:
+        print("❌ 没有找到任何账户，请先在 app.py 里添加 API Key 并同步交易。")
+        sys.exit(0)
+
+    def show_progress(msg, pct):
+        print(f"\r   [{int(pct*100)}%] {msg}".ljust(70), end="")
+
+    for alias, api_key in zip(accounts['alias'], accounts['api_key']):
+        print(f"🦅 账户【{alias}】开始回填价格行为指标...")
+        result = backfill_price_action(
+            engine, api_key,
+            risk_amount=arg_value('--risk', 100.0),
+            only_missing='--all' not in sys.argv,
+            workers=arg_value('--workers', 0) or None,
+            progress_callback=show_progress,
+        )
+        print("")
+        print(f"   ✅ 完成 {result['done']}/{result['total']} 笔，用时 {result['seconds']:.1f}s")
+        for round_id, reason in list(result['failed'].items())[:10]:
+            print(f"   ⚠️ {round_id}: {reason}")
+        if len(result['failed']) > 10:
+            print(f"   ... 另有 {len(result['failed']) - 10} 笔失败")
@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import time
+
+# Binance U 本位合约：单 IP 每分钟 2400 权重
+DEFAULT_WEIGHT_PER_MINUTE = 2400
+
+# 交易所返回的"本分钟已用权重"响应头 (大小写不敏感)
+USED_WEIGHT_HEADER = 'x-mbx-used-weight-1m'
+
+# v10.0: Binance 各 API 族 (合约 fapi / 币本位 dapi / 现货 api / 杠杆与钱包 sapi) 的 IP 权重各自独立计费
+DEFAULT_FAMILY = 'fapi'
+FAMILY_WEIGHT_PER_MINUTE = {
+    'fapi': DEFAULT_WEIGHT_PER_MINUTE,
+    'dapi': 2400,
+    'api': 6000,
+    'sapi': 12000,
+}
+# sapi 的已用权重放在单独的响应头里，其余族用 USED_WEIGHT_HEADER
+FAMILY_USED_WEIGHT_HEADERS = {
+    'sapi': 'x-sapi-used-ip-weight-1m',
+}
+# ccxt 的 api 名前缀 -> API 族 (public/private 等没有前缀的是现货 api)
+FAMILY_PREFIXES = ('fapi', 'dapi', 'sapi', 'eapi', 'papi')
+
+
+def api_family(api):
+    """ccxt 的 api 名 (如 'fapiPublic'、'sapiV2'、'public') -> API 族"""
+    name = api[0] if isinstance(api, (list, tuple)) else str(api)
+    for prefix in FAMILY_PREFIXES:
+        if name.startswith(prefix):
+            return prefix
+    return 'api'
+
+
+class _FamilyLedger:
+    """单个 API 族的分钟窗口账本"""
+
+    def __init__(self, weight_per_minute, safety):
+        self.weight_per_minute = weight_per_minute
+        self.budget = weight_per_minute * safety
+        self.window = None
+        self.used = 0.0
+        self.server_used = None
+        self.blocked_until = 0.0
+
+    def roll(self, now):
+        window = int(now // 60)
+        if window != self.window:
+            self.window, self.used, self.server_used = window, 0.0, None
+        return window
+
+
+class RateGovernor:
+    """
+    v10.0 核心组件：交易所权重预算调度器
+    负责：
+    1. 按分钟窗口记账 (与交易所计费方式一致)，预算够就立即放行，不够就等到下一个窗口
+    2. 每个请求按 ccxt 端点定义计算真实权重 (如 K 线随 limit 分档)，并按端点统计
+    3. 读取响应头里交易所实际记录的已用权重，以及 429/418 的 Retry-After，校正本地账本
+    4. 同一进程内的交易同步、资金费同步、K 线同步共享一个预算 (权重是按 IP 计的)
+    5. 账本按 API 族 (fapi/dapi/api/sapi) 分开，各自的上限和响应头只校正对应的族
+    """
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name, weight_per_minute=DEFAULT_WEIGHT_PER_MINUTE, safety=0.8, family_limits=None):
+        self.name = name
+        self.weight_per_minute = weight_per_minute
+        # 只用预算的一部分，给同 IP 的其他客户端 (网页端、其他脚本) 留余量
+        self.safety = safety
+        self.budget = weight_per_minute * safety
+        self.family_limits = dict(FAMILY_WEIGHT_PER_MINUTE, **(family_limits or {}))
+        self.family_limits[DEFAULT_FAMILY] = weight_per_minute
+        self._lock = threading.Lock()
+        self._ledgers = {}
+        self._requests = 0
+        self._total_weight = 0.0
+        self._throttled_seconds = 0.0
+        self._endpoints = {}
+
+    @classmethod
+    def get(cls, name='binance_future'):
+        """按名称获取进程内共享的调度器"""
+        with cls._registry_lock:
+            governor = cls._registry.get(name)
+            if governor is None:
+                governor = cls(name)
+                cls._registry[name] = governor
+            return governor
+
+    # ===========================
+    #  ⚖️ 预算调度
+    # ===========================
+    def _ledger(self, family):
+        """API 族的账本 (调用方持有 self._lock)；未登记上限的族按默认 2400"""
+        ledger = self._ledgers.get(family)
+        if ledger is None:
+            limit = self.family_limits.get(family, DEFAULT_WEIGHT_PER_MINUTE)
+            ledger = self._ledgers[family] = _FamilyLedger(limit, self.safety)
+        return ledger
+
+    def _reserve(self, weight, endpoint, family):
+        """尝试占用预算；成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.time()
+            ledger = self._ledger(family)
+            if now < ledger.blocked_until:
+                return ledger.blocked_until - now
+            window = ledger.roll(now)
+            # 单个请求超过整份预算时也放行 (否则永远等不到)，只要窗口是空的
+            if ledger.used + weight <= ledger.budget or ledger.used == 0:
+                ledger.used += weight
+                self._requests += 1
+                self._total_weight += weight
+                stats = self._endpoints.setdefault(endpoint, {'requests': 0, 'weight': 0.0})
+                stats['requests'] += 1
+                stats['weight'] += weight
+                return 0.0
+            return (window + 1) * 60 - now + 0.05
+
+    def acquire(self, weight=1, endpoint='other', family=DEFAULT_FAMILY):
+        """申请权重 (同步阻塞版，供线程内的 ccxt 实例使用)"""
+        while True:
+            wait = self._reserve(weight, endpoint, family)
+            if wait <= 0:
+                return
+            with self._lock:
+                self._throttled_seconds += wait
+            time.sleep(wait)
+
+    async def acquire_async(self, weight=1, endpoint='other', family=DEFAULT_FAMILY):
+        """申请权重 (asyncio 版，供 ccxt.async_support 实例使用)"""
+        while True:
+            wait = self._reserve(weight, endpoint, family)
+            if wait <= 0:
+                return
+            with self._lock:
+                self._throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    def observe(self, headers, family=DEFAULT_FAMILY):
+        """读取响应头，用交易所记录的已用权重校正该请求所属 API 族的账本"""
+        if not headers:
+            return
+        lowered = {str(k).lower(): v for k, v in headers.items()}
+        with self._lock:
+            now = time.time()
+            ledger = self._ledger(family)
+            ledger.roll(now)
+            used = lowered.get(FAMILY_USED_WEIGHT_HEADERS.get(family, USED_WEIGHT_HEADER))
+            if used is not None:
+                try:
+                    ledger.server_used = float(used)
+                    ledger.used = max(ledger.used, ledger.server_used)
+                except ValueError:
+                    pass
+            retry_after = lowered.get('retry-after')
+            if retry_after is not None:
+                try:
+                    ledger.blocked_until = max(ledger.blocked_until, now + float(retry_after))
+                except ValueError:
+                    pass
+
+    def block(self, seconds, family=DEFAULT_FAMILY):
+        """触发限频但没有 Retry-After 时，手动暂停该 API 族的所有请求一段时间"""
+        with self._lock:
+            ledger = self._ledger(family)
+            ledger.blocked_until = max(ledger.blocked_until, time.time() + seconds)
+
+    def metrics(self):
+        """
+        预算使用情况 (用于界面展示与排查)
+        顶层的窗口字段是默认族 (合约 fapi) 的，各族明细见 'families'
+        """
+        with self._lock:
+            now = time.time()
+            families = {}
+            for family in sorted(set(self._ledgers) | {DEFAULT_FAMILY}):
+                ledger = self._ledger(family)
+                ledger.roll(now)
+                families[family] = {
+                    'weight_per_minute': ledger.weight_per_minute,
+                    'budget': ledger.budget,
+                    'used_weight_1m': ledger.used,
+                    'server_used_weight_1m': ledger.server_used,
+                    'utilization': ledger.used / ledger.weight_per_minute,
+                    'blocked_for': max(0.0, ledger.blocked_until - now),
+                }
+            return {
+                'name': self.name,
+                **families[DEFAULT_FAMILY],
+                'requests': self._requests,
+                'total_weight': self._total_weight,
+                'throttled_seconds': self._throttled_seconds,
+                'endpoints': {k: dict(v) for k, v in self._endpoints.items()},
+                'families': families,
+            }
+
+    # ===========================
+    #  🔌 接入 ccxt
+    # ===========================
+    def govern(self, exchange):
+        """
+        让 ccxt 实例 (同步或 async_support 版) 的所有 REST 请求经过本调度器
+        每个请求按 ccxt 的 api 名归到对应 API 族记账 (现货/sapi 请求不占用合约预算)
+        关闭 ccxt 自带的固定间隔节流，改为按权重预算放行
+        """
+        exchange.enableRateLimit = False
+        original = exchange.fetch2
+        governor = self
+
+        if asyncio.iscoroutinefunction(original):
+            async def fetch2(path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+                weight = exchange.calculate_rate_limiter_cost(api, method, path, params, config)
+                family = api_family(api)
+                await governor.acquire_async(weight, f"{api}:{path}", family)
+                try:
+                    return await original(path, api, method, params, headers, body, config)
+                finally:
+                    governor.observe(exchange.last_response_headers, family)
+        else:
+            def fetch2(path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+                weight = exchange.calculate_rate_limiter_cost(api, method, path, params, config)
+                family = api_family(api)
+                governor.acquire(weight, f"{api}:{path}", family)
+                try:
+                    return original(path, api, method, params, headers, body, config)
+                finally:
+                    governor.observe(exchange.last_response_headers, family)
+
+        exchange.fetch2 = fetch2
+        return exchange
+
+
+def get_governor(name='binance_future'):
+    """快捷入口：获取共享的权重调度器"""
+    return RateGovernor.get(name)
@@ -1,82 +1,708 @@
+import os
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# v10.0: 资金曲线逐笔分位带 (百分位)
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+# v10.0: 分块模拟参数
+# 每块最多生成多少个格子 (runs × trades)，2M 个 float64 约 16MB，峰值内存与 sim_runs 无关
+CHUNK_CELLS = 2_000_000
+# 每一步资金分布的直方图桶数 (分位带用) / 期末资金直方图桶数 (期末分位数用，精度更高)
+BAND_BINS = 256
+FINAL_BINS = 65536
+# 分位带最多在多少个步上做直方图 (均匀抽取，含首尾两步)，其余步线性插值；笔数不超过它时每一步都做
+BAND_STEPS = 512
+# 留给界面画图的样本路径数
+SAMPLE_PATHS = 100
+# 每个任务 (一个独立随机流) 的格子数上限：任务划分只取决于参数，与进程数无关，保证结果可复现
+TASK_CELLS = 32_000_000
+# 仓位扫描：最大回撤直方图桶数 / 期末资金倍数 (log10) 直方图桶数与范围
+SWEEP_DD_BINS = 1000
+SWEEP_GROWTH_BINS = 4800
+SWEEP_LOG10_RANGE = (-6.0, 6.0)
+
+
+def path_statistics(equity_curves, start_equity):
+    """
+    v10.0 路径统计：整个 (runs × trades) 矩阵一次算完，不再逐条曲线逐笔循环
+    :return: {
+        'max_dd': 每条曲线的最大回撤比例 (前高从初始资金算起),
+        'max_dd_duration': 每条曲线最长的水下 (低于前高) 连续笔数,
+        'ruin_step': 每条曲线首次资金 ≤ 0 是第几笔 (没有破产为 0)
+    }
+    """
+    n_trades = equity_curves.shape[1]
+
+    # 1. 破产时间：第一次触及 0 的位置
+    ruined = equity_curves <= 0
+    ruin_step = np.where(ruined.any(axis=1), ruined.argmax(axis=1) + 1, 0)
+    del ruined
+
+    # 2. 前高 = 初始资金与累计最高的较大者
+    peaks = np.maximum.accumulate(equity_curves, axis=1)
+    np.maximum(peaks, start_equity, out=peaks)
+    at_peak = equity_curves >= peaks
+
+    # 3. 最大回撤 = 1 - min(资金 / 前高)，复用 peaks 的内存
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.divide(equity_curves, peaks, out=peaks)
+    max_dd = np.maximum(1.0 - ratio.min(axis=1), 0.0)
+    del peaks, ratio
+
+    # 4. 水下时长：相邻两次"站上前高"之间的笔数取最大 (起点视为第 -1 笔站上前高，末尾补第 n_trades 笔)
+    #    只处理站上前高的位置 (随机游走下远少于总格子数)，不再为整个矩阵建一份整数数组
+    rows_n = equity_curves.shape[0]
+    pos = np.flatnonzero(at_peak)
+    del at_peak
+    max_dd_duration = np.full(rows_n, n_trades, dtype=np.int64)
+    if len(pos):
+        row, col = np.divmod(pos, n_trades)
+        first = np.empty(len(pos), dtype=bool)
+        first[0] = True
+        np.not_equal(row[1:], row[:-1], out=first[1:])
+        gap = np.empty(len(pos), dtype=np.int64)
+        gap[0] = col[0]
+        np.subtract(col[1:], col[:-1] + 1, out=gap[1:])
+        gap[first] = col[first]
+        starts = np.flatnonzero(first)
+        last = np.append(starts[1:] - 1, len(pos) - 1)
+        max_dd_duration[row[starts]] = np.maximum(np.maximum.reduceat(gap, starts), n_trades - 1 - col[last])
+
+    return {
+        'max_dd': max_dd,
+        'max_dd_duration': max_dd_duration,
+        'ruin_step': ruin_step,
+    }
+
+
+def _bincount_median(counts):
+    """按计数表 (下标即取值) 求中位数，与 np.median 对原始数据的结果一致"""
+    total = int(counts.sum())
+    if total == 0:
+        return None
+    cum = np.cumsum(counts)
+    lo = int(np.searchsorted(cum, (total - 1) // 2 + 1))
+    hi = int(np.searchsorted(cum, total // 2 + 1))
+    return (lo + hi) / 2.0
+
+
+class SimulationAccumulator:
+    """
+    v10.0 分块模拟的累计统计量 (大小只与 trades_per_run 有关，与 sim_runs 无关)
+    负责：
+    1. 每块资金曲线算完路径统计后折叠进计数/求和 (破产数、回撤时长、破产时间、均值曲线)
+    2. 期末资金与资金分布用固定边界的直方图做分位数草图 (分位带只在 band_steps 这些步上做，见 BAND_STEPS)
+    3. 保留前 sample_paths 条路径给界面画图
+    直方图边界由第一块数据决定 (见 bounds_from_block)，多块/多进程合并时必须共用同一组边界
+    复利仓位 (资金不会为负) 且期末资金跨越多个数量级时改用 log10 分桶，归零的路径单独计数；否则线性分桶
+    """
+
+    def __init__(self, start_equity, trades_per_run, bounds, sample_paths=SAMPLE_PATHS):
+        self.start_equity = start_equity
+        self.trades = trades_per_run
+        step_lo, step_hi, self.final_bounds = bounds
+        # 分位带的采样步 (0-based 列号)：按平方间距抽取，前面密后面疏 (分布宽度约随 √笔数 增长，前几十笔变化最快)
+        # 最后一步一定在内 (期末资金的截断也用它的最小/最大值)
+        grid = np.linspace(0.0, 1.0, min(trades_per_run, BAND_STEPS)) ** 2
+        self.band_steps = np.unique(np.round(grid * (trades_per_run - 1)).astype(np.int64))
+        self.step_lo, self.step_hi = step_lo[self.band_steps], step_hi[self.band_steps]
+        self.sample_paths = sample_paths
+        self.runs = 0
+        self.sum_curve = np.zeros(trades_per_run)
+        n_band = len(self.band_steps)
+        self.step_min = np.full(n_band, np.inf)
+        self.step_max = np.full(n_band, -np.inf)
+        self.step_hist = np.zeros(n_band * BAND_BINS, dtype=np.int64)
+        self.final_hist = np.zeros(FINAL_BINS, dtype=np.int64)
+        self.final_zero = 0
+        self.duration_counts = np.zeros(trades_per_run + 1, dtype=np.int64)
+        self.ruin_counts = np.zeros(trades_per_run + 1, dtype=np.int64)
+        self.sum_max_dd = 0.0
+        self.worst_max_dd = 0.0
+        self.samples = []
+
+    @staticmethod
+    def bounds_from_block(equity_curves, compounding=False):
+        """
+        用第一块的逐步最小/最大值各向外扩一个全距，作为直方图边界 (后续块超出部分计入首/尾桶)
+        :param compounding: 是否复利模型 (资金按比例变化、最低为 0)；只有复利模型才可能用 log10 分桶
+        :return: (逐步下界, 逐步上界, 期末资金边界 (下界, 上界, 是否 log10 分桶))
+        """
+        lo = equity_curves.min(axis=0)
+        hi = equity_curves.max(axis=0)
+        spread = np.maximum(hi - lo, 1e-9 * np.maximum(np.abs(lo), 1.0))
+        final = equity_curves[:, -1]
+        positive = final[final > 0]
+        if compounding and (final >= 0).all() and len(positive) and positive.max() > 100 * positive.min():
+            log_lo, log_hi = np.log10(positive.min()), np.log10(positive.max())
+            final_bounds = (log_lo - (log_hi - log_lo), log_hi + (log_hi - log_lo), True)
+        else:
+            final_bounds = (lo[-1] - spread[-1], hi[-1] + spread[-1], False)
+        return lo - spread, hi + spread, final_bounds
+
+    @staticmethod
+    def _bin_index(values, lo, hi, bins):
+        idx = ((values - lo) * (bins / (hi - lo))).astype(np.int64)
+        return np.clip(idx, 0, bins - 1, out=idx)
+
+    # ===========================
+    #  ➕ 累计
+    # ===========================
+    def update(self, equity_curves):
+        """折叠一块资金曲线 (rows × trades_per_run)"""
+        rows = equity_curves.shape[0]
+        stats = path_statistics(equity_curves, self.start_equity)
+        self.runs += rows
+        self.sum_curve += equity_curves.sum(axis=0)
+        # 只取采样步的列 (笔数不超过 BAND_STEPS 时就是整块)
+        sampled = equity_curves if len(self.band_steps) == self.trades else equity_curves[:, self.band_steps]
+        np.minimum(self.step_min, sampled.min(axis=0), out=self.step_min)
+        np.maximum(self.step_max, sampled.max(axis=0), out=self.step_max)
+        self.duration_counts += np.bincount(stats['max_dd_duration'], minlength=self.trades + 1)
+        self.ruin_counts += np.bincount(stats['ruin_step'], minlength=self.trades + 1)
+        self.sum_max_dd += float(stats['max_dd'].sum())
+        self.worst_max_dd = max(self.worst_max_dd, float(stats['max_dd'].max()))
+
+        # 期末资金：单独一组更细的直方图 (log10 分桶时归零的路径单独计数，不进直方图)
+        final_lo, final_hi, final_log = self.final_bounds
+        final = equity_curves[:, -1]
+        if final_log:
+            ruined_final = final <= 0
+            self.final_zero += int(ruined_final.sum())
+            final = np.log10(final[~ruined_final])
+        self.final_hist += np.bincount(
+            self._bin_index(final, final_lo, final_hi, FINAL_BINS),
+            minlength=FINAL_BINS
+        )
+        # 采样步：桶号 + 采样序号 * BAND_BINS，一次 bincount 累计全部采样步
+        idx = self._bin_index(sampled, self.step_lo, self.step_hi, BAND_BINS)
+        idx += np.arange(len(self.band_steps), dtype=np.int64) * BAND_BINS
+        self.step_hist += np.bincount(idx.ravel(), minlength=len(self.band_steps) * BAND_BINS)
+        del sampled, idx
+
+        need = self.sample_paths - sum(len(s) for s in self.samples)
+        if need > 0:
+            self.samples.append(np.array(equity_curves[:need]))
+
+    def merge(self, other):
+        """合并另一份累计量 (边界必须相同)；样本路径按合并顺序补足"""
+        self.runs += other.runs
+        self.sum_curve += other.sum_curve
+        np.minimum(self.step_min, other.step_min, out=self.step_min)
+        np.maximum(self.step_max, other.step_max, out=self.step_max)
+        self.step_hist += other.step_hist
+        self.final_hist += other.final_hist
+        self.final_zero += other.final_zero
+        self.duration_counts += other.duration_counts
+        self.ruin_counts += other.ruin_counts
+        self.sum_max_dd += other.sum_max_dd
+        self.worst_max_dd = max(self.worst_max_dd, other.worst_max_dd)
+        for sample in other.samples:
+            need = self.sample_paths - sum(len(s) for s in self.samples)
+            if need <= 0:
+                break
+            self.samples.append(sample[:need])
+        return self
+
+    # ===========================
+    #  📊 分位数
+    # ===========================
+    @staticmethod
+    def _hist_quantiles(counts, lo, hi, percentiles):
+        """
+        直方图 (..., bins) 上取分位数：找到累计计数越过目标的桶，在桶内线性插值
+        :return: {百分位: 数组 (counts 去掉最后一维后的形状)}
+        """
+        bins = counts.shape[-1]
+        cum = np.cumsum(counts, axis=-1)
+        total = cum[..., -1]
+        width = (hi - lo) / bins
+        out = {}
+        for p in percentiles:
+            target = total * (p / 100.0)
+            b = np.minimum((cum < target[..., None]).sum(axis=-1), bins - 1)
+            below = np.where(b > 0, np.take_along_axis(cum, np.maximum(b - 1, 0)[..., None], axis=-1)[..., 0], 0)
+            in_bin = np.take_along_axis(counts, b[..., None], axis=-1)[..., 0]
+            frac = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.5)
+            out[p] = lo + (b + frac) * width
+        return out
+
+    def _final_quantiles(self, percentiles):
+        """期末资金分位数：线性分桶直接取；log10 分桶时先扣掉归零路径的名次，再在正值直方图里取"""
+        final_lo, final_hi, final_log = self.final_bounds
+        if not final_log:
+            return self._hist_quantiles(self.final_hist, final_lo, final_hi, percentiles)
+        positive = int(self.final_hist.sum())
+        total = positive + self.final_zero
+        out = {}
+        for p in percentiles:
+            target = total * (p / 100.0)
+            if target <= self.final_zero or positive == 0:
+                out[p] = 0.0
+                continue
+            inner = (target - self.final_zero) / positive * 100
+            out[p] = 10 ** self._hist_quantiles(self.final_hist, final_lo, final_hi, (inner,))[inner]
+        return out
+
+    def result(self):
+        """汇总成 run_simulation 的结果字典"""
+        runs = self.runs
+        ruin_steps = self.ruin_counts[1:]
+        ruined = int(ruin_steps.sum())
+        finals = self._final_quantiles((5, 50, 95))
+        bands = self._hist_quantiles(self.step_hist.reshape(len(self.band_steps), BAND_BINS),
+                                     self.step_lo, self.step_hi, BAND_PERCENTILES)
+        # 桶内插值不会超出实际出现过的最小/最大值
+        finals = {p: np.clip(v, self.step_min[-1], self.step_max[-1]) for p, v in finals.items()}
+        bands = {p: np.clip(v, self.step_min, self.step_max) for p, v in bands.items()}
+        # 采样步之间线性插值回每一步 (界面按笔画带)
+        if len(self.band_steps) < self.trades:
+            all_steps = np.arange(self.trades)
+            bands = {p: np.interp(all_steps, self.band_steps, v) for p, v in bands.items()}
+
+        # 回撤时长分布：与对原始数据 np.histogram(bins=min(30, 最大值+1)) 相同
+        values = np.flatnonzero(self.duration_counts)
+        dd_counts, dd_edges = np.histogram(values, bins=min(30, int(values.max()) + 1),
+                                           weights=self.duration_counts[values])
+
+        median_ttr = _bincount_median(np.concatenate(([0], ruin_steps))) if ruined else None
+        return {
+            "sample_curves": np.concatenate(self.samples) if self.samples else np.empty((0, self.trades)),
+            "mean_curve": self.sum_curve / runs,
+            "bands": bands,
+            "risk_of_ruin": ruined / runs * 100,
+            "median_final": float(finals[50]),
+            "worst_case": float(finals[5]),  # 最倒霉的 5% 的情况
+            "best_case": float(finals[95]),  # 最幸运的 5% 的情况
+            "avg_max_dd": self.sum_max_dd / runs * 100,
+            "worst_max_dd": self.worst_max_dd * 100,
+            "dd_duration_hist": {"counts": dd_counts.astype(np.int64), "edges": dd_edges},
+            "median_dd_duration": _bincount_median(self.duration_counts),
+            "ruin_step_counts": self.ruin_counts,
+            "median_time_to_ruin": median_ttr,
+            "sim_runs": runs,
+            "trades_per_run": self.trades
+        }
+
+
+# ===========================
+#  🎲 重采样模型 (v10.0)
+# ===========================
+# 界面可选的抽样模型
+RESAMPLING_MODELS = {
+    'bootstrap': "独立抽样 (i.i.d. Bootstrap)",
+    'block': "平稳块抽样 (保留连亏/连赢)",
+    'stratified': "分层抽样 (按策略/币种)",
+}
+
+
+class BootstrapResampler:
+    """
+    独立同分布 Bootstrap：逐笔从历史盈亏 (美元) 中有放回抽样 (v5.0 原始模型)
+    所有重采样模型共用同一接口：draw_indices 给出一块 (rows × trades) 的抽样下标，block 生成资金曲线
+    """
+
+    def __init__(self, pnl):
+        self.pnl = np.asarray(pnl, dtype=np.float64)
+
+    def draw_indices(self, rng, rows, trades):
+        return rng.integers(0, len(self.pnl), size=(rows, trades))
+
+    def block(self, rng, rows, trades, start_equity):
+        """生成一块资金曲线 (固定美元盈亏，逐笔累加)"""
+        equity_curves = self.pnl[self.draw_indices(rng, rows, trades)]
+        # 原地累加，不再多占一份矩阵
+        np.cumsum(equity_curves, axis=1, out=equity_curves)
+        equity_curves += start_equity
+        return equity_curves
+
+
+class StationaryBlockResampler(BootstrapResampler):
+    """
+    平稳块 Bootstrap (Politis-Romano)：按时间顺序整段抽取历史交易，块长服从均值 mean_block 的几何分布
+    连亏/连赢在块内原样保留；抽到序列末尾时循环接回开头
+    """
+
+    def __init__(self, pnl, mean_block=5.0):
+        super().__init__(pnl)
+        self.mean_block = max(float(mean_block), 1.0)
+
+    def draw_indices(self, rng, rows, trades):
+        n = len(self.pnl)
+        starts = rng.integers(0, n, size=(rows, trades))
+        new_block = rng.random((rows, trades)) < 1.0 / self.mean_block
+        new_block[:, 0] = True
+        # 每一步所在块的起始步：新块位置记自身步号，再做累计最大
+        steps = np.arange(trades)
+        block_start = np.where(new_block, steps, 0)
+        np.maximum.accumulate(block_start, axis=1, out=block_start)
+        idx = np.take_along_axis(starts, block_start, axis=1)
+        idx += steps - block_start
+        idx %= n
+        return idx
+
+
+class StratifiedResampler(BootstrapResampler):
+    """
+    分层抽样：每条路径里各层 (策略/币种) 的笔数按历史占比 (或指定 weights) 固定分配，
+    层内 Bootstrap，再随机打乱先后顺序；路径之间不再有"这次碰巧多抽了某个策略"的额外波动
+    """
+
+    def __init__(self, pnl, labels, weights=None):
+        labels = np.asarray(labels).astype(str)
+        order = np.argsort(labels, kind='mergesort')
+        super().__init__(np.asarray(pnl, dtype=np.float64)[order])
+        self.strata, self.offsets, self.sizes = np.unique(labels[order], return_index=True, return_counts=True)
+        if weights:
+            w = np.array([float(weights.get(name, 0.0)) for name in self.strata])
+        else:
+            w = self.sizes.astype(np.float64)
+        if w.sum() <= 0:
+            raise ValueError("分层权重全部为 0")
+        self.weights = w / w.sum()
+
+    def allocation(self, trades):
+        """每层在一条路径里的笔数 (最大余数法，合计正好 trades)"""
+        raw = self.weights * trades
+        counts = np.floor(raw).astype(np.int64)
+        rest = trades - counts.sum()
+        if rest > 0:
+            counts[np.argsort(-(raw - counts), kind='mergesort')[:rest]] += 1
+        return counts
+
+    def draw_indices(self, rng, rows, trades):
+        labels = np.repeat(np.arange(len(self.strata)), self.allocation(trades))
+        layout = rng.permuted(np.broadcast_to(labels, (rows, trades)), axis=1)
+        u = rng.random((rows, trades))
+        return self.offsets[layout] + (u * self.sizes[layout]).astype(np.int64)
+
+
+class RMultipleResampler:
+    """
+    R 倍数 + 固定比例仓位：历史盈亏换算成 R (1R = risk_unit 美元)，每笔按当前资金的 risk_fraction 承担 1R，
+    资金按 (1 + f × R) 复利演化；单笔亏损超过全部资金时归零并保持为 0
+    抽样顺序沿用 sampler (独立/块/分层)
+    """
+
+    # 资金按比例变化、最低归零 (SimulationAccumulator 据此决定期末资金能否用 log10 分桶)
+    compounding = True
+
+    def __init__(self, sampler, risk_fraction=0.01, risk_unit=None):
+        self.sampler = sampler
+        self.risk_fraction = float(risk_fraction)
+        pnl = sampler.pnl
+        if not risk_unit:
+            # 没有逐笔止损数据时，以历史平均亏损作为 1R
+            losses = pnl[pnl < 0]
+            risk_unit = -losses.mean() if len(losses) else np.abs(pnl).mean()
+        self.risk_unit = float(risk_unit) if risk_unit else 1.0
+        self.r_multiples = pnl / self.risk_unit
+
+    def block(self, rng, rows, trades, start_equity):
+        growth = self.r_multiples[self.sampler.draw_indices(rng, rows, trades)]
+        growth *= self.risk_fraction
+        growth += 1.0
+        np.maximum(growth, 0.0, out=growth)
+        np.cumprod(growth, axis=1, out=growth)
+        growth *= start_equity
+        return growth
+
+
+def _simulation_task(resampler, start_equity, trades_per_run, runs, seed_seq, bounds, sample_paths):
+    """
+    一个模拟任务：用自己的种子跑 runs 条路径，分块折叠进累计量 (可在子进程里执行)
+    """
+    rng = np.random.default_rng(seed_seq)
+    block_rows = max(1, CHUNK_CELLS // trades_per_run)
+    acc = SimulationAccumulator(start_equity, trades_per_run, bounds, sample_paths)
+    done = 0
+    while done < runs:
+        rows = min(block_rows, runs - done)
+        equity_curves = resampler.block(rng, rows, trades_per_run, start_equity)
+        acc.update(equity_curves)
+        done += rows
+        del equity_curves
+    return acc
+
+
+# ===========================
+#  📐 仓位扫描 (v10.0)
+# ===========================
+def kelly_fraction(r_multiples, grid=2000):
+    """
+    按历史 R 倍数求使期望对数增长 E[log(1 + f·R)] 最大的每笔风险比例 (Kelly)
+    :return: (Kelly 比例, 该比例下每笔的期望对数增长)
+    """
+    r = np.asarray(r_multiples, dtype=np.float64)
+    worst = r.min()
+    # f 不能让最差的一笔把资金亏穿
+    f_max = min(1.0, 0.999 / -worst) if worst < 0 else 1.0
+    fs = np.linspace(0.0, f_max, grid)
+    growth = np.log1p(np.outer(fs, r)).mean(axis=1)
+    best = int(np.argmax(growth))
+    return float(fs[best]), float(growth[best])
+
+
+class SweepAccumulator:
+    """
+    仓位扫描的累计统计量：每个仓位比例 × 每条破产阈值的破产计数，每个仓位比例的最大回撤/期末倍数直方图
+    资金曲线按初始资金 = 1 的"倍数"计算，初始资金只体现在破产阈值 (ruin_equity / 初始资金) 上
+    """
+
+    def __init__(self, fractions, thresholds, ruin_drawdown):
+        self.fractions = np.asarray(fractions, dtype=np.float64)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.ruin_drawdown = ruin_drawdown
+        self.runs = 0
+        self.ruin_counts = np.zeros((len(self.fractions), len(self.thresholds)), dtype=np.int64)
+        self.dd_hist = np.zeros((len(self.fractions), SWEEP_DD_BINS), dtype=np.int64)
+        self.growth_hist = np.zeros((len(self.fractions), SWEEP_GROWTH_BINS), dtype=np.int64)
+        self.sum_max_dd = np.zeros(len(self.fractions))
+
+    def update(self, r_block):
+        """同一块 R 倍数 (rows × trades) 依次套用每个仓位比例"""
+        self.runs += r_block.shape[0]
+        growth = np.empty_like(r_block)
+        log_lo, log_hi = SWEEP_LOG10_RANGE
+        for i, f in enumerate(self.fractions):
+            np.multiply(r_block, f, out=growth)
+            growth += 1.0
+            np.maximum(growth, 0.0, out=growth)
+            np.cumprod(growth, axis=1, out=growth)
+
+            min_growth = growth.min(axis=1)
+            final = growth[:, -1].copy()
+            peaks = np.maximum.accumulate(growth, axis=1)
+            np.maximum(peaks, 1.0, out=peaks)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                max_dd = np.maximum(1.0 - np.divide(growth, peaks, out=peaks).min(axis=1), 0.0)
+            del peaks
+
+            ruined = min_growth[:, None] <= self.thresholds[None, :]
+            if self.ruin_drawdown is not None:
+                ruined |= (max_dd >= self.ruin_drawdown)[:, None]
+            self.ruin_counts[i] += ruined.sum(axis=0)
+            self.sum_max_dd[i] += max_dd.sum()
+            self.dd_hist[i] += np.bincount(
+                SimulationAccumulator._bin_index(max_dd, 0.0, 1.0, SWEEP_DD_BINS), minlength=SWEEP_DD_BINS)
+            with np.errstate(divide='ignore'):
+                log_final = np.log10(final)
+            self.growth_hist[i] += np.bincount(
+                SimulationAccumulator._bin_index(np.nan_to_num(log_final, neginf=log_lo), log_lo, log_hi, SWEEP_GROWTH_BINS),
+                minlength=SWEEP_GROWTH_BINS)
+
+    def merge(self, other):
+        self.runs += other.runs
+        self.ruin_counts += other.ruin_counts
+        self.dd_hist += other.dd_hist
+        self.growth_hist += other.growth_hist
+        self.sum_max_dd += other.sum_max_dd
+        return self
+
+    def result(self):
+        dd = SimulationAccumulator._hist_quantiles(self.dd_hist, 0.0, 1.0, (50, 95))
+        log_lo, log_hi = SWEEP_LOG10_RANGE
+        growth = SimulationAccumulator._hist_quantiles(self.growth_hist, log_lo, log_hi, (50,))
+        return {
+            "ruin_prob": self.ruin_counts / self.runs * 100,
+            "avg_max_dd": self.sum_max_dd / self.runs * 100,
+            "median_max_dd": np.clip(dd[50], 0.0, 1.0) * 100,
+            "p95_max_dd": np.clip(dd[95], 0.0, 1.0) * 100,
+            "median_growth": 10 ** growth[50],
+            "sim_runs": self.runs,
+        }
+
+
+def _sweep_task(resampler, fractions, thresholds, ruin_drawdown, trades_per_run, runs, seed_seq):
+    """
+    一个扫描任务：按与 _simulation_task 相同的分块抽一次 R 序列，全部仓位比例共用 (可在子进程里执行)
+    """
+    rng = np.random.default_rng(seed_seq)
+    block_rows = max(1, CHUNK_CELLS // trades_per_run)
+    acc = SweepAccumulator(fractions, thresholds, ruin_drawdown)
+    done = 0
+    while done < runs:
+        rows = min(block_rows, runs - done)
+        r_block = resampler.r_multiples[resampler.sampler.draw_indices(rng, rows, trades_per_run)]
+        acc.update(r_block)
+        done += rows
+        del r_block
+    return acc
+
 
 class MonteCarloEngine:
     """
     v5.0 核心：蒙特卡洛模拟引擎
     用于预测未来的资金曲线分布和破产风险
+    v10.0: 分块生成 + 累计统计，峰值内存与模拟次数无关
     """
-    
+
     def __init__(self, trades_df):
-        # 提取净盈亏序列
+        # 提取净盈亏序列 (v10.0: 按平仓时间正序排列，块抽样需要真实的先后顺序)
         if not trades_df.empty:
+            if 'close_time' in trades_df.columns:
+                trades_df = trades_df.sort_values('close_time', kind='mergesort')
+            self.trades_df = trades_df
             self.pnl_series = trades_df['net_pnl'].values
         else:
+            self.trades_df = trades_df
             self.pnl_series = np.array([])
-            
-    def run_simulation(self, start_equity, sim_runs=100, trades_per_run=100):
+
+    def make_resampler(self, model='bootstrap', mean_block=5.0, strata='strategy', weights=None,
+                       sizing='fixed', risk_fraction=0.01, risk_unit=None):
+        """
+        v10.0 构建重采样模型
+        :param model: 'bootstrap' / 'block' / 'stratified' (见 RESAMPLING_MODELS)
+        :param mean_block: 块抽样的平均块长 (笔)
+        :param strata: 分层抽样按哪一列分层 ('strategy' 或 'symbol')，空值归为"未标记"
+        :param weights: 分层抽样的自定义权重 {层名: 权重}，None 时按历史占比
+        :param sizing: 'fixed' 固定美元盈亏 / 'fractional' R 倍数 + 固定比例仓位
+        :param risk_fraction: 固定比例仓位下每笔承担的资金比例 (0.01 = 1%)
+        :param risk_unit: 1R 对应的美元数，None 时取历史平均亏损
+        """
+        pnl = np.asarray(self.pnl_series, dtype=np.float64)
+        if model == 'block':
+            sampler = StationaryBlockResampler(pnl, mean_block)
+        elif model == 'stratified':
+            labels = self.trades_df[strata].fillna('').astype(str).replace('', '未标记')
+            sampler = StratifiedResampler(pnl, labels.values, weights)
+        else:
+            sampler = BootstrapResampler(pnl)
+        if sizing == 'fractional':
+            return RMultipleResampler(sampler, risk_fraction, risk_unit)
+        return sampler
+
+    def run_simulation(self, start_equity, sim_runs=100, trades_per_run=100, seed=None,
+                       workers=None, sample_paths=SAMPLE_PATHS, resampler=None):
         """
         执行模拟
         :param start_equity: 初始资金
         :param sim_runs: 模拟多少个平行宇宙 (例如 100 次)
         :param trades_per_run: 每个宇宙交易多少笔 (例如 未来100笔)
+        :param seed: 随机种子 (相同种子 + 相同参数 = 相同结果，与进程数无关)；None 时随机，实际种子见结果里的 'seed'
+        :param workers: 并行进程数，None=CPU 核数；只有一个任务时直接在本进程计算
+        :param sample_paths: 保留多少条原始路径用于画图
+        :param resampler: 重采样模型 (见 make_resampler)，None 时为独立 Bootstrap
         :return: 模拟结果字典
         """
         if len(self.pnl_series) < 10:
             return None, "交易样本太少 (至少需要10笔)"
-        
-        # 1. 核心统计特征
-        win_rate = np.mean(self.pnl_series > 0)
-        avg_win = np.mean(self.pnl_series[self.pnl_series > 0]) if np.any(self.pnl_series > 0) else 0
-        avg_loss = np.mean(self.pnl_series[self.pnl_series <= 0]) if np.any(self.pnl_series <= 0) else 0
-        
-        # 2. 蒙特卡洛抽样 (Bootstrap Method)
-        # 从历史盈亏中随机抽取，生成未来的盈亏序列
-        # shape: (sim_runs, trades_per_run)
-        random_pnls = np.random.choice(self.pnl_series, size=(sim_runs, trades_per_run), replace=True)
-        
-        # 3. 计算资金曲线
-        # cumulative sum across trades
-        cum_pnl = np.cumsum(random_pnls, axis=1)
-        # add start equity
-        equity_curves = start_equity + cum_pnl
-        
-        # 4. 计算关键指标
-        
-        # A. 破产率 (Risk of Ruin): 资金触及 0 或某条警戒线的概率
-        ruin_count = np.sum(np.any(equity_curves <= 0, axis=1))
-        risk_of_ruin = (ruin_count / sim_runs) * 100
-        
-        # B. 预期期末资金 (中位数和均值)
-        final_equities = equity_curves[:, -1]
-        median_final = np.median(final_equities)
-        worst_case = np.percentile(final_equities, 5)  # 最倒霉的 5% 的情况
-        best_case = np.percentile(final_equities, 95)  # 最幸运的 5% 的情况
-        
-        # C. 最大回撤预测 (Max Drawdown)
-        # 计算每条曲线的最大回撤
-        max_dds = []
-        for curve in equity_curves:
-            peak = start_equity
-            max_dd = 0
-            for val in curve:
-                if val > peak: peak = val
-                dd = (peak - val) / peak
-                if dd > max_dd: max_dd = dd
-            max_dds.append(max_dd)
-            
-        avg_max_dd = np.mean(max_dds) * 100
-        worst_max_dd = np.max(max_dds) * 100
-        
-        return {
-            "equity_curves": equity_curves,  # 原始曲线数据
-            "risk_of_ruin": risk_of_ruin,
-            "median_final": median_final,
-            "worst_case": worst_case,
-            "best_case": best_case,
-            "avg_max_dd": avg_max_dd,
-            "worst_max_dd": worst_max_dd,
-            "sim_runs": sim_runs,
-            "trades_per_run": trades_per_run
-        }, "OK"
+        if resampler is None:
+            resampler = self.make_resampler()
+
+        # 1. 按固定大小切分任务，每个任务一条独立的子随机流 (SeedSequence.spawn)
+        seed_seq = np.random.SeedSequence(seed)
+        task_runs = max(1, TASK_CELLS // trades_per_run)
+        sizes = [min(task_runs, sim_runs - i) for i in range(0, sim_runs, task_runs)]
+        task_seeds = seed_seq.spawn(len(sizes))
+
+        # 2. 直方图边界：第 0 个任务的第一块 (与该任务实际生成的第一块完全相同)
+        pilot_rows = min(sizes[0], max(1, CHUNK_CELLS // trades_per_run))
+        pilot = resampler.block(np.random.default_rng(task_seeds[0]), pilot_rows, trades_per_run, start_equity)
+        bounds = SimulationAccumulator.bounds_from_block(pilot, getattr(resampler, 'compounding', False))
+        del pilot
+
+        # 3. 执行任务 (串行或进程池)，按任务顺序合并，结果与并行度无关
+        task_args = [(resampler, start_equity, trades_per_run, runs, task_seed, bounds, sample_paths)
+                     for runs, task_seed in zip(sizes, task_seeds)]
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(task_args) <= 1:
+            partials = [_simulation_task(*args) for args in task_args]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(task_args))) as pool:
+                futures = [pool.submit(_simulation_task, *args) for args in task_args]
+                partials = [future.result() for future in futures]
+
+        acc = partials[0]
+        for partial in partials[1:]:
+            acc.merge(partial)
+        result = acc.result()
+        result["seed"] = seed_seq.entropy
+        return result, "OK"
+
+    def run_sweep(self, risk_fractions, start_equities, sim_runs=1000, trades_per_run=100, seed=None,
+                  workers=None, resampler=None, ruin_equity=0.0, ruin_drawdown=None):
+        """
+        v10.0 仓位比例 × 初始资金 扫描 (共用随机数 Common Random Numbers)
+        所有格子共用同一组抽样：每块只抽一次 R 序列，再对每个仓位比例做复利；
+        固定比例仓位下资金曲线与初始资金成正比，初始资金只影响绝对破产线 (ruin_equity / 初始资金)，不需要重新模拟
+        :param risk_fractions: 每笔风险比例列表 (0.01 = 1%)
+        :param start_equities: 初始资金列表
+        :param resampler: 抽样顺序模型 (make_resampler 的结果，R 倍数换算沿用其 1R)，None 时为独立 Bootstrap
+        :param ruin_equity: 资金跌到该值 (美元) 及以下视为破产，默认 0 (归零)
+        :param ruin_drawdown: 最大回撤达到该比例也视为破产 (如 0.5)，None 表示不计
+        :return: ({
+            'fractions', 'start_equities',
+            'ruin_prob': (仓位数 × 资金数) 破产概率 %, 可直接画热力图,
+            'avg_max_dd' / 'median_max_dd' / 'p95_max_dd': 每个仓位比例的最大回撤 %,
+            'median_growth': 每个仓位比例的期末资金倍数中位数,
+            'kelly_fraction' / 'kelly_growth': 历史 R 分布下的 Kelly 比例与每笔期望对数增长,
+            'risk_unit', 'seed', 'sim_runs', 'trades_per_run'
+        }, 消息)
+        """
+        if len(self.pnl_series) < 10:
+            return None, "交易样本太少 (至少需要10笔)"
+        fractions = np.asarray(risk_fractions, dtype=np.float64)
+        equities = np.asarray(start_equities, dtype=np.float64)
+        if len(fractions) == 0 or len(equities) == 0 or (equities <= 0).any():
+            return None, "仓位比例与初始资金不能为空，初始资金必须大于 0"
+
+        if resampler is None:
+            resampler = self.make_resampler()
+        if not isinstance(resampler, RMultipleResampler):
+            resampler = RMultipleResampler(resampler)
+        thresholds = float(ruin_equity) / equities
+
+        # 与 run_simulation 相同的任务切分与子随机流
+        seed_seq = np.random.SeedSequence(seed)
+        task_runs = max(1, TASK_CELLS // trades_per_run)
+        sizes = [min(task_runs, sim_runs - i) for i in range(0, sim_runs, task_runs)]
+        task_seeds = seed_seq.spawn(len(sizes))
+        task_args = [(resampler, fractions, thresholds, ruin_drawdown, trades_per_run, runs, task_seed)
+                     for runs, task_seed in zip(sizes, task_seeds)]
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(task_args) <= 1:
+            partials = [_sweep_task(*args) for args in task_args]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(task_args))) as pool:
+                futures = [pool.submit(_sweep_task, *args) for args in task_args]
+                partials = [future.result() for future in futures]
+
+        acc = partials[0]
+        for partial in partials[1:]:
+            acc.merge(partial)
+        result = acc.result()
+        kelly, kelly_growth = kelly_fraction(resampler.r_multiples)
+        result.update({
+            "fractions": fractions,
+            "start_equities": equities,
+            "kelly_fraction": kelly,
+            "kelly_growth": kelly_growth,
+            "risk_unit": resampler.risk_unit,
+            "seed": seed_seq.entropy,
+            "trades_per_run": trades_per_run,
+        })
+        return result, "OK"
+
 
+if __name__ == "__main__":
+    # 自检：直方图分位数 vs np.percentile (固定美元 Bootstrap 含破产/负资金路径 + 复利模型含归零路径)
+    rng = np.random.default_rng(0)
+    trades = pd.DataFrame({'net_pnl': np.round(rng.normal(5, 120, 300), 2), 'close_time': np.arange(300)})
+    engine = MonteCarloEngine(trades)
+    runs, steps, equity, seed = 5000, 200, 1000.0, 7
+    for resampler in (engine.make_resampler(), engine.make_resampler(sizing='fractional', risk_fraction=0.27)):
+        res, _ = engine.run_simulation(equity, runs, steps, seed=seed, workers=1, resampler=resampler)
+        # 同样的种子 + 同样的任务切分 (一个任务、一块) 重新生成全部路径，直接算精确分位数
+        task_seed = np.random.SeedSequence(seed).spawn(1)[0]
+        final = resampler.block(np.random.default_rng(task_seed), runs, steps, equity)[:, -1]
+        exact = np.percentile(final, (5, 50, 95))
+        # 线性分桶按全距的千分之一容差；log10 分桶 (复利) 按相对误差，归零部分必须精确为 0
+        atol = 0.0 if getattr(resampler, 'compounding', False) else (final.max() - final.min()) * 1e-3
+        for key, value in zip(("worst_case", "median_final", "best_case"), exact):
+            assert np.isclose(res[key], value, rtol=0.05, atol=atol), (type(resampler).__name__, key, res[key], value)
+        print(f"✅ {type(resampler).__name__}: 破产率 {res['risk_of_ruin']:.1f}% | "
+              f"P5/P50/P95 = {res['worst_case']:.4g} / {res['median_final']:.4g} / {res['best_case']:.4g} "
+              f"(精确 {exact[0]:.4g} / {exact[1]:.4g} / {exact[2]:.4g})")
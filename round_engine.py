@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+from data_processor import format_duration_vec, format_timestamp_ms, round_vec
+
+# 持仓归零判定阈值 (与 process_trades_to_rounds 保持一致)
+QTY_EPSILON = 0.0000001
+
+# 回合表中透传自开仓单的复盘字段及其默认值
+META_DEFAULTS = {
+    'notes': '', 'strategy': '', 'ai_analysis': '', 'screenshot': '',
+    'process_tag': '', 'mental_state': '', 'setup_rating': 0, 'mistake_tags': '', 'rr_ratio': 0.0,
+    'mae': np.nan, 'mfe': np.nan, 'etd': np.nan,
+    'mad': np.nan, 'efficiency': np.nan, 'rvol': np.nan, 'pattern_signal': ''
+}
+
+ROUND_COLUMNS = [
+    'round_id', 'symbol', 'direction', 'open_time', 'close_time',
+    'open_date_str', 'close_date_str', 'duration_min', 'duration_str',
+    'total_pnl', 'total_fee', 'net_pnl', 'trade_count', 'status'
+] + list(META_DEFAULTS.keys())
+
+
+class RoundEngine:
+    """
+    v10.0 核心组件：增量回合引擎
+    负责：
+    1. 把已完成的回合持久化到 rounds 表，把每个币种未平仓的状态存到 round_state 表 (断点)
+    2. 新成交写入后，只对有新成交的币种从断点继续跑状态机
+    3. 发现历史被改写 (删单/补历史) 时，自动对该币种全量重建
+    """
+    def __init__(self, db):
+        self.db = db
+        self._init_tables()
+
+    def _init_tables(self):
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            # 已完成回合 (只存结构数据，复盘标签查询时从开仓单上实时关联，保证编辑后立即可见)
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS rounds (
+                    round_id TEXT,
+                    api_key_tag TEXT,
+                    symbol TEXT,
+                    side_direction INTEGER,
+                    open_time INTEGER,
+                    close_time INTEGER,
+                    total_pnl REAL,
+                    total_fee REAL,
+                    trade_count INTEGER,
+                    PRIMARY KEY (round_id, api_key_tag)
+                )
+            ''')
+            # 每个 (账户, 币种) 的状态机断点
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS round_state (
+                    api_key_tag TEXT,
+                    symbol TEXT,
+                    fill_count INTEGER,
+                    last_rowid INTEGER,
+                    last_ts INTEGER,
+                    qty REAL,
+                    pnl REAL,
+                    fee REAL,
+                    start_time INTEGER,
+                    open_id TEXT,
+                    side_direction INTEGER,
+                    trade_count INTEGER,
+                    PRIMARY KEY (api_key_tag, symbol)
+                )
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_rounds_tag_close ON rounds (api_key_tag, close_time)')
+
+    # ===========================
+    #  🔄 增量同步
+    # ===========================
+    def sync(self, key_tag):
+        """
+        对比 trades 表与断点，只处理有变化的币种
+        :return: (续跑币种数, 重建币种数)
+        """
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT symbol, COUNT(*), MAX(rowid) FROM trades
+                WHERE api_key_tag = ? GROUP BY symbol
+            ''', (key_tag,))
+            current = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+
+            c.execute('SELECT * FROM round_state WHERE api_key_tag = ?', (key_tag,))
+            cols = [d[0] for d in c.description]
+            states = {row[1]: dict(zip(cols, row)) for row in c.fetchall()}
+
+            resumed, rebuilt = 0, 0
+
+            # 币种已经没有任何成交 (整币种被删)
+            for symbol in set(states) - set(current):
+                self._clear_symbol(c, key_tag, symbol)
+
+            for symbol, (fill_count, max_rowid) in current.items():
+                state = states.get(symbol)
+                if state and state['fill_count'] == fill_count and state['last_rowid'] == max_rowid:
+                    continue
+
+                if state and fill_count > state['fill_count']:
+                    c.execute('''
+                        SELECT rowid, id, timestamp, side, amount, pnl, fee FROM trades
+                        WHERE api_key_tag = ? AND symbol = ? AND rowid > ?
+                        ORDER BY timestamp ASC, rowid ASC
+                    ''', (key_tag, symbol, state['last_rowid']))
+                    new_fills = c.fetchall()
+                    # 只有"新成交全部追加在断点之后"才能续跑，否则说明历史被改写
+                    if (len(new_fills) == fill_count - state['fill_count']
+                            and new_fills and new_fills[0][2] >= (state['last_ts'] or 0)):
+                        self._run(c, key_tag, symbol, state, new_fills)
+                        resumed += 1
+                        continue
+
+                # 全量重建该币种
+                self._clear_symbol(c, key_tag, symbol)
+                c.execute('''
+                    SELECT rowid, id, timestamp, side, amount, pnl, fee FROM trades
+                    WHERE api_key_tag = ? AND symbol = ?
+                    ORDER BY timestamp ASC, rowid ASC
+                ''', (key_tag, symbol))
+                self._run(c, key_tag, symbol, self._empty_state(), c.fetchall())
+                rebuilt += 1
+
+        return resumed, rebuilt
+
+    def invalidate(self, key_tag, symbol=None):
+        """丢弃断点，下次 sync 时全量重建 (用于手动改写了成交的结构字段)"""
+        with self.db.transaction() as conn:
+            c = conn.cursor()
+            if symbol:
+                self._clear_symbol(c, key_tag, symbol)
+            else:
+                c.execute('DELETE FROM rounds WHERE api_key_tag = ?', (key_tag,))
+                c.execute('DELETE FROM round_state WHERE api_key_tag = ?', (key_tag,))
+
+    def _clear_symbol(self, c, key_tag, symbol):
+        c.execute('DELETE FROM rounds WHERE api_key_tag = ? AND symbol = ?', (key_tag, symbol))
+        c.execute('DELETE FROM round_state WHERE api_key_tag = ? AND symbol = ?', (key_tag, symbol))
+
+    @staticmethod
+    def _empty_state():
+        return {
+            'fill_count': 0, 'last_rowid': 0, 'last_ts': 0,
+            'qty': 0.0, 'pnl': 0.0, 'fee': 0.0,
+            'start_time': None, 'open_id': None, 'side_direction': 0, 'trade_count': 0
+        }
+
+    def _run(self, c, key_tag, symbol, state, fills):
+        """从断点继续跑开平仓状态机 (逻辑与 process_trades_to_rounds 逐行版完全一致)"""
+        qty = state['qty'] or 0.0
+        pnl_sum = state['pnl'] or 0.0
+        fee_sum = state['fee'] or 0.0
+        start_time = state['start_time']
+        open_id = state['open_id']
+        side_direction = state['side_direction'] or 0
+        trade_count = state['trade_count'] or 0
+        closed = []
+
+        for rowid, fill_id, ts, side, amount, pnl, fee in fills:
+            amount = float(amount or 0.0)
+            pnl = float(pnl or 0.0)
+            fee = float(fee or 0.0)
+            side = str(side).lower()
+
+            if abs(qty) < QTY_EPSILON:
+                # 开仓
+                start_time = ts
+                open_id = str(fill_id)
+                trade_count = 1
+                side_direction = 1 if side == 'buy' else -1
+                qty = amount if side == 'buy' else -amount
+                pnl_sum = pnl
+                fee_sum = fee
+            else:
+                trade_count += 1
+                pnl_sum += pnl
+                fee_sum += fee
+                if side == 'buy': qty += amount
+                else: qty -= amount
+
+                # 平仓
+                if abs(qty) < QTY_EPSILON:
+                    closed.append((open_id, key_tag, symbol, side_direction, start_time, ts,
+                                   pnl_sum, fee_sum, trade_count))
+                    qty = 0.0
+                    side_direction = 0
+
+        if closed:
+            c.executemany('''
+                INSERT OR REPLACE INTO rounds
+                (round_id, api_key_tag, symbol, side_direction, open_time, close_time, total_pnl, total_fee, trade_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', closed)
+
+        last_rowid = max([state['last_rowid'] or 0] + [f[0] for f in fills])
+        last_ts = fills[-1][2] if fills else state['last_ts']
+        c.execute('''
+            INSERT OR REPLACE INTO round_state
+            (api_key_tag, symbol, fill_count, last_rowid, last_ts, qty, pnl, fee, start_time, open_id, side_direction, trade_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (key_tag, symbol, (state['fill_count'] or 0) + len(fills), last_rowid, last_ts,
+              qty, pnl_sum, fee_sum, start_time, open_id, side_direction, trade_count))
+
+    # ===========================
+    #  📖 读取
+    # ===========================
+    def load_rounds(self, key_tag):
+        """
+        读取已完成回合，输出列与 process_trades_to_rounds 一致
+        复盘标签从开仓单上实时关联 (编辑笔记/标签后无需重建)
+        """
+        conn = self.db.connection()
+        rounds = pd.read_sql_query('''
+            SELECT round_id, symbol, side_direction, open_time, close_time, total_pnl, total_fee, trade_count
+            FROM rounds WHERE api_key_tag = ?
+        ''', conn, params=(key_tag,))
+        if rounds.empty:
+            return pd.DataFrame()
+
+        trade_cols = {row[1] for row in conn.execute('PRAGMA table_info(trades)').fetchall()}
+        meta_cols = [col for col in META_DEFAULTS if col in trade_cols]
+        select_cols = ", ".join([f"t.{col}" for col in meta_cols])
+        meta = pd.read_sql_query(f'''
+            SELECT t.id AS round_id, {select_cols}
+            FROM rounds r JOIN trades t ON t.id = r.round_id AND t.api_key_tag = r.api_key_tag
+            WHERE r.api_key_tag = ?
+        ''', conn, params=(key_tag,))
+        df = rounds.merge(meta, on='round_id', how='left')
+
+        for col, val in META_DEFAULTS.items():
+            if col not in df.columns:
+                df[col] = val
+            else:
+                df[col] = df[col].fillna(val)
+        # 与逐行版一致：整列都缺失的指标保持为 None (而不是 NaN)
+        for col in ['mae', 'mfe', 'etd', 'mad', 'efficiency', 'rvol']:
+            if df[col].isna().all():
+                df[col] = None
+
+        duration = (df['close_time'] - df['open_time']) / 1000 / 60
+        df['direction'] = np.where(df['side_direction'] == 1, '做多 (Long)', '做空 (Short)')
+        df['open_date_str'] = format_timestamp_ms(df['open_time'])
+        df['close_date_str'] = format_timestamp_ms(df['close_time'])
+        df['duration_min'] = round_vec(duration, 1)
+        df['duration_str'] = format_duration_vec(duration)
+        df['net_pnl'] = round_vec(df['total_pnl'] - df['total_fee'], 2)
+        df['total_pnl'] = round_vec(df['total_pnl'], 2)
+        df['total_fee'] = round_vec(df['total_fee'], 2)
+        df['status'] = 'Closed'
+
+        df = df[ROUND_COLUMNS]
+        return df.sort_values(by='close_time', ascending=False)
@@ -0,0 +1,138 @@
+from collections import deque, namedtuple
+import numpy as np
+
+# 分形左右各看几根 (5 即 11 根窗口的中心是局部极值，与原来 rolling(11, center=True) 一致)
+SWING_WINDOW = 5
+
+# 趋势结构分类 -> 界面/AI 上下文里的文字
+TREND_LABELS = {
+    'HH+HL': "📈 上升结构 (HH+HL)",
+    'LH+LL': "📉 下降结构 (LH+LL)",
+    'HH+LL': "📣 扩张结构 (HH+LL)",
+    'LH+HL': "📐 收敛结构 (LH+HL)",
+}
+NO_TREND_LABEL = "盘整/无趋势"
+
+# 一个确认的摆动点：index 为第几根 K 线 (从 0 开始)，kind 为 'high' 或 'low'
+Swing = namedtuple('Swing', ['index', 'timestamp', 'kind', 'price'])
+
+
+def classify_structure(highs, lows):
+    """
+    用最近两个摆动高点/低点判断趋势结构
+    :return: 'HH+HL' / 'LH+LL' / 'HH+LL' / 'LH+HL'，点数不够或持平时返回 None
+    """
+    if len(highs) < 2 or len(lows) < 2:
+        return None
+    curr_h, prev_h = highs[-1], highs[-2]
+    curr_l, prev_l = lows[-1], lows[-2]
+    if curr_h > prev_h and curr_l > prev_l:
+        return 'HH+HL'
+    if curr_h < prev_h and curr_l < prev_l:
+        return 'LH+LL'
+    if curr_h > prev_h and curr_l < prev_l:
+        return 'HH+LL'
+    if curr_h < prev_h and curr_l > prev_l:
+        return 'LH+HL'
+    return None
+
+
+class SwingTracker:
+    """
+    v10.0 核心组件：流式分形摆动点识别
+    负责：
+    1. 逐根追加 K 线 (append/extend)，单调队列维护最近 2*window+1 根的最高/最低，每根摊还 O(1)
+    2. 窗口中心等于窗口极值时确认一个摆动高/低点 (需要右侧 window 根 K 线，所以确认会滞后 window 根)
+    3. 直接给出最近几个摆动点和 HH/HL 结构分类
+    价格行为统计、K 线回放、AI 审计上下文共用这一套，不再各自用 rolling 重算
+    """
+
+    def __init__(self, window=SWING_WINDOW):
+        self.window = window
+        self.span = 2 * window + 1
+        self.count = 0
+        self.swings = []
+        # 最近 window+1 根 K 线 (最左边就是待确认的窗口中心)
+        self._recent = deque(maxlen=window + 1)
+        # 单调队列：(序号, 价格)，高点队列价格递减，低点队列价格递增
+        self._max_q = deque()
+        self._min_q = deque()
+
+    # ===========================
+    #  📥 追加 K 线
+    # ===========================
+    def append(self, high, low, timestamp=None):
+        """追加一根 K 线，返回因此新确认的摆动点列表 (0~2 个)"""
+        i = self.count
+        high, low = float(high), float(low)
+        while self._max_q and self._max_q[-1][1] <= high:
+            self._max_q.pop()
+        self._max_q.append((i, high))
+        while self._min_q and self._min_q[-1][1] >= low:
+            self._min_q.pop()
+        self._min_q.append((i, low))
+        # 移出窗口 [i-span+1, i] 之外的元素
+        if self._max_q[0][0] <= i - self.span:
+            self._max_q.popleft()
+        if self._min_q[0][0] <= i - self.span:
+            self._min_q.popleft()
+        self._recent.append((timestamp, high, low))
+        self.count += 1
+
+        new_swings = []
+        if self.count >= self.span:
+            center = i - self.window
+            ts, center_high, center_low = self._recent[0]
+            if center_high == self._max_q[0][1]:
+                new_swings.append(Swing(center, ts, 'high', center_high))
+            if center_low == self._min_q[0][1]:
+                new_swings.append(Swing(center, ts, 'low', center_low))
+            self.swings.extend(new_swings)
+        return new_swings
+
+    def extend(self, highs, lows, timestamps=None):
+        """批量追加 (如一段 K 线 DataFrame 的 high/low/timestamp 列)，返回新确认的摆动点"""
+        if timestamps is None:
+            timestamps = [None] * len(highs)
+        new_swings = []
+        for h, l, ts in zip(np.asarray(highs).tolist(), np.asarray(lows).tolist(), list(timestamps)):
+            new_swings.extend(self.append(h, l, ts))
+        return new_swings
+
+    # ===========================
+    #  📐 结构查询
+    # ===========================
+    def last(self, kind, n=3, before_ts=None):
+        """最近 n 个摆动高点或低点的价格 (按时间先后)；before_ts 只看该时间戳之前的点"""
+        prices = []
+        for swing in reversed(self.swings):
+            if swing.kind != kind:
+                continue
+            if before_ts is not None and not (swing.timestamp < before_ts):
+                continue
+            prices.append(swing.price)
+            if len(prices) >= n:
+                break
+        return prices[::-1]
+
+    def structure(self, before_ts=None):
+        """HH/HL 结构分类 (见 classify_structure)，before_ts 同 last"""
+        return classify_structure(self.last('high', 2, before_ts), self.last('low', 2, before_ts))
+
+    def trend_label(self, before_ts=None):
+        code = self.structure(before_ts)
+        return TREND_LABELS.get(code, NO_TREND_LABEL)
+
+    def flags(self, kind):
+        """长度为已追加 K 线数的布尔数组，摆动点所在位置为 True"""
+        out = np.zeros(self.count, dtype=bool)
+        idx = [s.index for s in self.swings if s.kind == kind]
+        out[idx] = True
+        return out
+
+
+def find_swings(highs, lows, timestamps=None, window=SWING_WINDOW):
+    """快捷入口：对一段完整 K 线跑一遍 SwingTracker"""
+    tracker = SwingTracker(window)
+    tracker.extend(highs, lows, timestamps)
+    return tracker
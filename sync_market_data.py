@@ -1,13 +1,20 @@
 import sqlite3
 import os
+import sys
 from market_engine import MarketDataEngine
 
-def smart_sync():
+def smart_sync(columnar=False):
     print("🦅 开始执行智能同步 (Smart Sync)...")
     
     # 1. 初始化市场数据引擎
     market = MarketDataEngine()
     
+    # v10.0: 可选迁移到列式仓库 (只需执行一次，之后自动启用)
+    if columnar and market.storage != 'columnar':
+        print("📦 正在把 SQLite K 线迁移到列式仓库...")
+        market.migrate_to_columnar(progress_callback=lambda msg, pct: print(f"\r   {msg} {int(pct*100)}%", end=""))
+        print("")
+    
     # 2. 连接交易记录数据库
     base_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -56,25 +63,25 @@ def smart_sync():
     target_list = sorted(list(my_coins))
     print(f"📋 你的专属同步列表 ({len(target_list)} 个): {target_list}")
     
-    # 5. 开始循环进货
-    for symbol in target_list:
-        print(f"\n🔄 [正在同步] {symbol} ...")
-        
-        # 简单的进度回调
-        def show_progress(msg, pct):
-            print(f"\r   {msg} {int(pct*100)}%", end="")
-            
-        # 同步最近 1 年 (365天) 的 1分钟 K线
-        success, msg = market.sync_symbol_history(symbol, timeframe='1m', days=365, progress_callback=show_progress)
-        print("") # 换行
+    # 5. 并发进货 (v10.0: 多币种同时抓取，节奏由交易所权重预算控制)
+    # 简单的进度回调 (整体进度)
+    def show_progress(msg, pct):
+        print(f"\r   [{int(pct*100)}%] {msg}".ljust(60), end="")
         
+    # 同步最近 1 年 (365天) 的 1分钟 K线
+    results = market.sync_symbols_async(target_list, timeframe='1m', days=365, progress_callback=show_progress)
+    print("") # 换行
+    
+    for symbol in target_list:
+        success, msg = results.get(symbol, (False, "未执行"))
         if success:
             print(f"   ✅ {msg}")
         else:
-            print(f"   ⚠️ {msg}")
+            print(f"   ⚠️ {symbol}: {msg}")
             
     print("\n🎉 所有数据同步完成！现在去 app.py 点击【极速还原】吧！")
 
 if __name__ == "__main__":
-    smart_sync()
+    # python sync_market_data.py [--columnar]
+    smart_sync(columnar='--columnar' in sys.argv)
 